@@ -0,0 +1,152 @@
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+import pyarrow as pa
+
+# Dimensions counted by the analysis charts
+# True - ", " joined list column counted per item, False - counted as whole value
+DIMENSIONS = {
+    "developers": False,
+    "publishers": False,
+    "platforms": True,
+    "categories": True,
+    "genres": True,
+}
+
+DEFAULT_TOP_N = 20
+MAX_TOP_N = 500
+# Number of filtered variants kept in memory
+MAX_CACHED_FILTERS = 256
+
+
+# Precomputed top-N counts per dimension for the analysis page
+# Unfiltered counts are built with the cache snapshot and published with it (to_tables / from_tables),
+# filtered variants are memoized
+class MetadataAggregates:
+    # table - Arrow metadata table, only the counted columns are converted
+    #  (dictionary encoded columns become pandas categoricals)
+    def __init__(self, table):
+        self._init(table)
+        self._prepare()
+        self._cache[(None, None, None)] = self._count(None)
+
+    def _init(self, table):
+        self._table = table
+        self._size = table.num_rows
+        self._years = None
+        self._values = None
+        self._lock = threading.Lock()
+        self._prepare_lock = threading.Lock()
+        self._cache = OrderedDict()
+
+    # Per row values used for counting, converted once (loaded snapshots only on the first filtered request)
+    def _prepare(self):
+        with self._prepare_lock:
+            if self._values is not None:
+                return
+            df = self._table.select(["appid", "release_date", *DIMENSIONS]).to_pandas()
+
+            # Release year parsed out of "21 Aug, 2012" / "Aug 21, 2012"
+            self._years = pd.to_numeric(
+                df["release_date"].astype("string").str.extract(r"(\d{4})", expand=False),
+                errors="coerce",
+            )
+
+            # Per dimension values as Series indexed by row position (list columns exploded)
+            values_by_dimension = {}
+            for dimension, is_list in DIMENSIONS.items():
+                values = df[dimension].astype("string")
+                if is_list:
+                    values = values.str.split(", ").explode()
+                values = values[values.notna() & (values != "")]
+                values_by_dimension[dimension] = values
+            self._values = values_by_dimension
+
+    def __len__(self):
+        return self._size
+
+    # Arrow table of the unfiltered counts: {name: pyarrow.Table}
+    def to_tables(self):
+        counts = self._cache[(None, None, None)]
+        dimensions, names, values = [], [], []
+        for dimension in DIMENSIONS:
+            dimensions += [dimension] * len(counts[dimension])
+            names += [str(name) for name in counts[dimension].index]
+            values += [int(value) for value in counts[dimension]]
+        return {"aggregates_counts": pa.table({
+            "dimension": pa.array(dimensions, pa.string()),
+            "name": pa.array(names, pa.string()),
+            "value": pa.array(values, pa.int64()),
+        })}
+
+    # Aggregates of table with the unfiltered counts of to_tables,
+    # the table is only converted when a filtered variant is requested
+    @classmethod
+    def from_tables(cls, table, tables):
+        aggregates = cls.__new__(cls)
+        aggregates._init(table)
+        df = tables["aggregates_counts"].to_pandas()
+        counts = {}
+        for dimension in DIMENSIONS:
+            rows = df[df["dimension"] == dimension]
+            counts[dimension] = pd.Series(rows["value"].to_numpy(), index=rows["name"].to_numpy())
+        aggregates._cache[(None, None, None)] = counts
+        return aggregates
+
+    # Boolean mask of rows matching every given filter (None -> all rows)
+    def _mask(self, genre, platform, year):
+        mask = pd.Series(True, index=range(self._size))
+        for dimension, value in (("genres", genre), ("platforms", platform)):
+            if value is not None:
+                values = self._values[dimension]
+                matching = values.index[values.str.lower() == value.lower()].unique()
+                mask &= mask.index.isin(matching)
+        if year is not None:
+            mask &= (self._years == year).fillna(False).to_numpy()
+        return mask
+
+    # Sorted counts per dimension for rows in mask
+    def _count(self, mask):
+        counts = {}
+        for dimension, values in self._values.items():
+            if mask is not None:
+                values = values[mask.loc[values.index].to_numpy()]
+            counts[dimension] = values.value_counts(sort=True)
+        return counts
+
+    # Memoized counts for one filter combination
+    def _counts_for(self, genre, platform, year):
+        key = (
+            genre.lower() if genre else None,
+            platform.lower() if platform else None,
+            year,
+        )
+        with self._lock:
+            counts = self._cache.get(key)
+            if counts is not None:
+                self._cache.move_to_end(key)
+                return counts
+
+        self._prepare()
+        counts = self._count(self._mask(genre, platform, year))
+
+        with self._lock:
+            self._cache[key] = counts
+            if len(self._cache) > MAX_CACHED_FILTERS:
+                # Unfiltered counts are never evicted
+                oldest = next(key for key in self._cache if key != (None, None, None))
+                del self._cache[oldest]
+        return counts
+
+    # Top-N counts per dimension
+    # Output: {dimension: [{name, value}, ...]}
+    def top(self, n=DEFAULT_TOP_N, dimensions=None, genre=None, platform=None, year=None):
+        counts = self._counts_for(genre, platform, year)
+        return {
+            dimension: [
+                {"name": name, "value": int(value)}
+                for name, value in counts[dimension].head(n).items()
+            ]
+            for dimension in (dimensions or DIMENSIONS)
+        }
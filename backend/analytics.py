@@ -0,0 +1,151 @@
+import json
+
+import numpy as np
+import pyarrow as pa
+
+DAY_MS = 24 * 60 * 60 * 1000
+# Player count change windows: name -> length (ms)
+CHANGE_WINDOWS = {"24h": DAY_MS, "7d": 7 * DAY_MS, "30d": 30 * DAY_MS}
+# Moving average windows: name -> length (ms)
+AVERAGE_WINDOWS = {"7d": 7 * DAY_MS, "30d": 30 * DAY_MS}
+# Orderings of /api/trending
+TRENDING_BY = ("percent", "absolute")
+TRENDING_DEFAULT_LIMIT = 50
+TRENDING_MAX_LIMIT = 500
+# Default lower bound of current players, small games dominate percent changes otherwise
+TRENDING_MIN_PLAYERS = 100
+
+# Points of all games are searched at once with keys game index * _SEGMENT + timestamp
+# (timestamps are epoch ms, below 2^42 until 2109)
+_SEGMENT = 1 << 42
+
+ANALYTICS_SCHEMA = pa.schema(
+    [
+        ("appid", pa.int64()),
+        ("rank", pa.int32()),
+        ("previous_rank", pa.int32()),
+        ("rank_change", pa.int32()),
+        ("players", pa.int64()),
+        ("latest_ts", pa.int64()),
+        ("peak", pa.int64()),
+        ("peak_ts", pa.int64()),
+    ]
+    + [(f"{kind}_{window}", pa.float64()) for window in CHANGE_WINDOWS for kind in ("change", "change_pct")]
+    + [(f"avg_{window}", pa.float64()) for window in AVERAGE_WINDOWS]
+)
+
+
+def _nullable_int(values, valid):
+    return pa.array(np.where(valid, values, 0), mask=~valid)
+
+
+# Per-game statistics of many player count histories, vectorized over all points at once
+# Input: non-empty PlayerHistory list, ranks (int or None) aligned with it,
+#  previous_ranks {appid: rank} of the previous snapshot
+# Output: pyarrow.Table with ANALYTICS_SCHEMA, one row per history
+def compute_analytics(histories, ranks, previous_ranks=None):
+    previous_ranks = previous_ranks or {}
+    if not histories:
+        return ANALYTICS_SCHEMA.empty_table()
+
+    lengths = np.array([len(history) for history in histories], dtype=np.int64)
+    ends = np.cumsum(lengths)
+    starts = ends - lengths
+    games = np.arange(len(histories), dtype=np.int64)
+    timestamps = np.concatenate([history.timestamps for history in histories]).astype(np.int64)
+    counts = np.concatenate([history.counts for history in histories]).astype(np.int64)
+    game_of_point = np.repeat(games, lengths)
+    keys = game_of_point * _SEGMENT + timestamps
+    # Prefix sums for window averages
+    sums = np.concatenate([[0], np.cumsum(counts)])
+
+    latest = counts[ends - 1]
+    latest_ts = timestamps[ends - 1]
+    peak = np.maximum.reduceat(counts, starts)
+    # First point reaching the peak
+    positions = np.arange(len(counts), dtype=np.int64)
+    peak_positions = np.minimum.reduceat(
+        np.where(counts == peak[game_of_point], positions, len(counts)), starts
+    )
+
+    columns = {
+        "appid": pa.array([history.appid for history in histories], type=pa.int64()),
+        "players": pa.array(latest),
+        "latest_ts": pa.array(latest_ts),
+        "peak": pa.array(peak),
+        "peak_ts": pa.array(timestamps[peak_positions]),
+    }
+
+    rank = np.array([-1 if value is None else value for value in ranks], dtype=np.int32)
+    previous = np.array(
+        [previous_ranks.get(history.appid, -1) for history in histories], dtype=np.int32
+    )
+    columns["rank"] = _nullable_int(rank, rank >= 0)
+    columns["previous_rank"] = _nullable_int(previous, previous >= 0)
+    # Positive when the game climbed
+    columns["rank_change"] = _nullable_int(previous - rank, (rank >= 0) & (previous >= 0))
+
+    for window, length in CHANGE_WINDOWS.items():
+        # Last point at or before latest_ts - window, missing if the history is shorter
+        index = np.searchsorted(keys, games * _SEGMENT + latest_ts - length, side="right") - 1
+        valid = index >= starts
+        past = counts[np.where(valid, index, 0)].astype(np.float64)
+        change = np.where(valid, latest - past, np.nan)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            change_pct = np.where(valid & (past > 0), np.round(change / past * 100, 2), np.nan)
+        columns[f"change_{window}"] = pa.array(change, from_pandas=True)
+        columns[f"change_pct_{window}"] = pa.array(change_pct, from_pandas=True)
+
+    for window, length in AVERAGE_WINDOWS.items():
+        # Mean of the points within (latest_ts - window, latest_ts]
+        first = np.searchsorted(keys, games * _SEGMENT + latest_ts - length, side="right")
+        columns[f"avg_{window}"] = pa.array(np.round((sums[ends] - sums[first]) / (ends - first), 2))
+
+    return pa.table([columns[field.name] for field in ANALYTICS_SCHEMA], schema=ANALYTICS_SCHEMA)
+
+
+# Trending / stats views of the analytics table, built once per cache generation
+# Rows are joined with name / header_image and serialized to JSON once, like RankingSnapshot
+class GameAnalytics:
+    # games - {appid: {"name", "header_image"}}
+    def __init__(self, table, games=None):
+        games = games or {}
+        self.table = table
+        self.rows = table.to_pylist()
+        for row in self.rows:
+            game = games.get(row["appid"], {})
+            row["name"] = game.get("name", "Unknown")
+            row["header_image"] = game.get("header_image", "")
+        self._positions = {row["appid"]: i for i, row in enumerate(self.rows)}
+        self._encoded = [
+            json.dumps(row, ensure_ascii=False, separators=(",", ":")).encode("utf-8") for row in self.rows
+        ]
+        self._players = table.column("players").to_numpy()
+
+        # Row order (largest first, games without the value left out) per (window, by)
+        self._orders = {}
+        for window in CHANGE_WINDOWS:
+            for by in TRENDING_BY:
+                column = f"change_pct_{window}" if by == "percent" else f"change_{window}"
+                values = table.column(column).to_numpy(zero_copy_only=False)
+                valid = np.flatnonzero(~np.isnan(values))
+                self._orders[window, by] = valid[np.argsort(-values[valid], kind="stable")]
+
+    def __len__(self):
+        return len(self.rows)
+
+    # Stats row of appid or None if it is not ranked
+    def get(self, appid):
+        position = self._positions.get(int(appid))
+        return None if position is None else self.rows[position]
+
+    # {appid: rank in the previous snapshot} of the ranked games
+    def previous_ranks(self):
+        return {row["appid"]: row["previous_rank"] for row in self.rows if row["previous_rank"] is not None}
+
+    # JSON array bytes of the games with the largest change over window
+    def encode_trending(self, window, by, limit, min_players=0):
+        order = self._orders[window, by]
+        if min_players:
+            order = order[self._players[order] >= min_players]
+        return b"[" + b",".join(self._encoded[i] for i in order[:limit].tolist()) + b"]"
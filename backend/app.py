@@ -1,36 +1,111 @@
-from flask import Flask, jsonify
+from flask import Flask, Response, g, jsonify, request
 from flask_cors import CORS
 import os
 from dotenv import load_dotenv
-import requests
 from flask_executor import Executor
 import time
 
 import csv_calling
-import bigquery_calling
+import metrics
+import storage
+from bad_appids import BAD_APPIDS
+from single_flight import SingleFlight
+from lru_cache import LRUCache
+import ingestion
+import update_job
+from metadata_store import MetadataStore
+from search_index import SearchIndex
+from cache_manager import CacheSnapshot, CacheRefreshManager
+from ranking_snapshot import RankingSnapshot
+from metadata_export import MetadataExport, parse_fields
+from player_history import PlayerHistory, parse_time_arg, MIN_POINTS, MAX_POINTS
+from applist_snapshot import AppListCache
+from warm_snapshot import save_warm_snapshot, load_warm_snapshot
+from shared_cache import BuilderLock, PublishedSnapshots, SHARED_FIRST_WAIT
+from aggregates import MetadataAggregates, DIMENSIONS, DEFAULT_TOP_N, MAX_TOP_N
+from analytics import compute_analytics, GameAnalytics, CHANGE_WINDOWS, TRENDING_BY, TRENDING_DEFAULT_LIMIT, \
+    TRENDING_MAX_LIMIT, TRENDING_MIN_PLAYERS
+from http_cache import CompressedBodies, ENCODINGS, COMPRESSIBLE_MIMETYPES, MIN_COMPRESS_SIZE, \
+    snapshot_etag, cache_control, compress_stream
 
 # Initialize Flask app and executor
 app = Flask(__name__)
 executor = Executor(app)
-CORS(app)
+# Paging headers of the list endpoints are read by the frontend (another origin)
+CORS(app, expose_headers=["X-Total-Count", "X-Next-Cursor", "X-Cache-Generation"])
 
 # Load environment variables
 load_dotenv()
-BAD_APPIDS = csv_calling.get_badappid_data()
 
 
+# Applist snapshot, re-encoded only when the CSV changes
+applist_cache = AppListCache(csv_calling.CSV_FILE_ALL_APPLIST, csv_calling.get_all_steam_games)
+
 # Cache for game ranking and metadata
 CACHE_DURATION = 12 * 60 * 60
+# Start background refresh this long before the cache expires
+CACHE_REFRESH_AHEAD = 30 * 60
+# "single" - every process builds its own cache
+# "shared" - multi-worker serving (see gunicorn.conf.py): one worker builds and publishes snapshots,
+#  the others memory-map the published snapshot
+CACHE_MODE = os.getenv("CACHE_MODE", "single")
+
+# Page size limit for /api/topcurrentgames
+RANKING_MAX_PAGE_SIZE = 1000
+
+# Search results limit
+SEARCH_DEFAULT_LIMIT = 20
+SEARCH_MAX_LIMIT = 100
+# Upper bound of appids per multi-get request
+MAX_BATCH_APPIDS = 500
+# Retry-After (seconds) of a game lookup the Steam store could not answer
+METADATA_RETRY_AFTER = 60
 
-cache_last_fetch_timestamp = 0
-cache_game_ranking_topcurplayers= []
-cache_all_games_metadata = []
+# HTTP caching of GET responses per route: (max-age, stale-while-revalidate) seconds, None = no-store
+# Data only changes with the cache snapshot (update task / CACHE_DURATION), revalidation is a cheap 304
+ROUTE_CACHE_POLICIES = {
+    "/api/topcurrentgames": (60, CACHE_DURATION),
+    "/api/steam/game/<appid>": (3600, CACHE_DURATION),
+    "/api/steam/game/<appid>/stats": (300, CACHE_DURATION),
+    "/api/trending": (300, CACHE_DURATION),
+    "/api/steam/games": (3600, CACHE_DURATION),
+    "/api/steam/allmetadata": (3600, CACHE_DURATION),
+    "/api/steam/aggregates": (3600, CACHE_DURATION),
+    "/api/steam/search/<query>": (300, CACHE_DURATION),
+    "/api/steam/playercount/<appid>": (300, CACHE_DURATION),
+    "/api/steam/playercounts": (300, CACHE_DURATION),
+    "/api/steam/getallgameslist": (3600, CACHE_DURATION),
+    "/api/cache/stats": None,
+    "/metrics": None,
+}
+# Routes answered from the cache snapshot: ETag derived from the snapshot, If-None-Match is checked
+#  before the handler runs
+SNAPSHOT_ROUTES = {
+    "/api/topcurrentgames", "/api/steam/game/<appid>", "/api/steam/games", "/api/steam/allmetadata",
+    "/api/steam/aggregates", "/api/steam/search/<query>", "/api/steam/playercount/<appid>",
+    "/api/steam/playercounts", "/api/steam/game/<appid>/stats", "/api/trending",
+}
+# Snapshot routes not served from the snapshot itself (player histories): their ETag only uses a snapshot
+#  that is already loaded, a cold instance must not wait for a snapshot build to answer them
+NON_BLOCKING_SNAPSHOT_ROUTES = {"/api/steam/playercount/<appid>", "/api/steam/playercounts"}
 
 
 #########################################################
 #####################   FUNCTIONS   #####################
 #########################################################
 
+# Concurrent per-appid lookups share one storage / upstream fetch, keyed by (operation, appid)
+in_flight = SingleFlight()
+
+# Compressed response bodies, reused while the cache snapshot (and so the body) stays the same
+compressed_bodies = CompressedBodies()
+
+# Parsed player histories, bounded by total number of points
+# Invalidated when the stored histories change (committed update run), TTL is only a safety net
+HISTORY_CACHE_MAX_POINTS = 5_000_000
+HISTORY_CACHE_TTL = 12 * 60 * 60
+history_cache = LRUCache(HISTORY_CACHE_MAX_POINTS, HISTORY_CACHE_TTL, weight=len)
+
 # List of fieldnames for game metadata
 fieldnames = [
     "appid", "name", "header_image", "short_description", "developers",
@@ -38,19 +113,71 @@ fieldnames = [
     "genres", "website", "screenshots", "background"
 ]
     
+# Get player count histories for many appids: cache hits in memory, misses in one storage query
+# Appids missing from storage are not crawled from SteamCharts here (one request could hold a worker for
+#  minutes), the single appid endpoint still falls back upstream
+# Input: list of int appids
+# Output: {appid: PlayerHistory or None}
+def get_player_histories(appids):
+    generation = history_cache_generation()
+    results = {}
+    missing = []
+    for appid in appids:
+        history = history_cache.get(appid, generation)
+        if history is not None:
+            results[appid] = history
+        else:
+            missing.append(appid)
+
+    if missing:
+        results.update(in_flight.do(("playercount", tuple(missing)), load_player_histories, missing, generation))
+    return results
+
+# Load and parse player count histories, caching them under generation
+def load_player_histories(appids, generation):
+    rows = storage.get_history_playercount_by_appids(appids)
+    if rows is None:
+        raise RuntimeError(f"Player count lookup for {len(appids)} appids failed")
+
+    results = {}
+    for appid in appids:
+        history = None
+        if appid in rows:
+            history = PlayerHistory.from_row(rows[appid])
+            history_cache.set(appid, history, generation)
+        results[appid] = history
+    return results
+
 # Get current playes for game
 # Input: appid
-# Output: appid, name, date_playerscount - for database
+# Output: PlayerHistory or None - from the history cache, storage backend or SteamCharts
 def get_current_history_playercouny(appid): 
-    row = bigquery_calling.BQ_get_history_playercount_by_appid(appid)
+    generation = history_cache_generation()
+    history = history_cache.get(int(appid), generation)
+    if history is not None:
+        return history
+    return in_flight.do(("playercount", int(appid)), load_player_history, appid, generation)
+
+# Load and parse player count history, caching it under generation
+def load_player_history(appid, generation):
+    rows = load_history_playercount(appid)
+    if not rows:
+        return None
+    history = PlayerHistory.from_row(rows[0])
+    history_cache.set(int(appid), history, generation)
+    return history
+
+# Load player count history from the storage backend or SteamCharts
+def load_history_playercount(appid):
+    row = storage.get_history_playercount_by_appid(appid)
 
     if row is not None and row != []:
         return row
     
     try:
         # Fetch current player count data from SteamCharts
-        url = f"https://steamcharts.com/app/{appid}/chart-data.json"
-        res = requests.get(url, timeout=10)
+        url = f"{ingestion.STEAMCHARTS_URL}/app/{appid}/chart-data.json"
+        res = ingestion.get_upstream(url)
         data = res.json()
         if not data:
             raise ValueError(f"No data found for appid {appid}.")
@@ -67,7 +194,14 @@ def get_current_history_playercouny(appid):
         print(f"Error fetching current players for appid {appid}: {e}")
         return None
     
-# Fetch game metadata from BigQuery or Steam API
+# BAD_APPIDS entry of a rejected appid (counted in the metrics) or None
+def rejected_appid(appid):
+    bad = BAD_APPIDS.get(appid)
+    if bad is not None:
+        metrics.bad_appid_rejections.inc(bad["reason"])
+    return bad
+
+# Fetch game metadata from the storage backend or Steam API
 # Input: appid
 # Output: appid, name, header_image, short_description, developers, publishers,
 #  release_date, platforms, price, categories, genres, website, screenshots, background
@@ -75,91 +209,103 @@ def get_current_history_playercouny(appid):
 # Input: appid=None
 # Output: all metadata from CSV
 def fetch_game_metadata(appid = None):
-    # If appid is None, return all metadata from BigQuery
+    # If appid is None, return all metadata from the storage backend
     if appid is None:
-        return bigquery_calling.BQ_get_all_metadata()
+        return storage.get_all_metadata()
 
     # Check if appid is valid            
-    if str(appid) in BAD_APPIDS:
-        return {
-            "appid": appid,
-            "name": "Unknown",
-            "header_image": "",
-        }
+    if appid in BAD_APPIDS:
+        return None
     
     # If cache is empty or expired, fetch new data
-    global cache_all_games_metadata
-    check_and_update_cache()
+    snapshot = check_and_update_cache()
+    metadata_store = snapshot.metadata_store if snapshot else MetadataStore()
 
-    result = None
     # Check if appid is already in cache
-    if cache_all_games_metadata:
-        for row in cache_all_games_metadata:
-            if int(row["appid"]) == int(appid):
-                result = row.copy()
-                for data in fieldnames:
-                    if data in ["platforms", "categories", "genres", "screenshots"]:
-                        result[data] = result[data].split(", ") if result[data] else []
-        
-
-    # If cache is empty, fetch from BigQuery
-    if result is None:
-        result = bigquery_calling.BQ_get_metadata_by_appid(appid)
-
-    # If found in cache or database return the result
+    result = metadata_store.get(appid)
     if result is not None:
+        metrics.cache_requests.inc("metadata", "hit")
         return result
+
+    metrics.cache_requests.inc("metadata", "miss")
+    return in_flight.do(("metadata", int(appid)), load_game_metadata, appid, metadata_store)
+
+# Load game metadata missing from the cache from the storage backend or Steam API
+# Found metadata is added to metadata_store
+# Raises ConnectionError if the Steam API could not answer (transient, not negative cached)
+def load_game_metadata(appid, metadata_store):
+    # If cache is empty, fetch from the storage backend and keep it in the store
+    result = storage.get_metadata_by_appid(appid)
+    if result is not None:
+        return metadata_store.add(result)
     
     # If not found in cache or CSV, fetch from API
-    url = f"https://store.steampowered.com/api/appdetails?appids={appid}"
+    url = f"{ingestion.STEAM_STORE_URL}/api/appdetails?appids={appid}"
     try:
-        res = requests.get(url, timeout=10)
+        res = ingestion.get_upstream(url)
         data = res.json()
-
-        # Check if the API response contains the appid and success status
-        if not data.get(appid, {}).get("success"):
-            csv_calling.add_badappid(appid)
-            BAD_APPIDS.add(str(appid))
-            raise ValueError(f"App ID {appid} not found or API request failed.")
+        if not data:
+            raise ValueError("Empty response, store API rate limited?")
     
     except Exception as e:
         print(f"Error fetching metadata for appid {appid}: {e}")
+        raise ConnectionError(f"Steam store unavailable for appid {appid}") from e
+
+    # Check if the API response contains the appid and success status
+    if not data.get(str(appid), {}).get("success"):
+        print(f"App ID {appid} not found or API request failed.")
+        BAD_APPIDS.add(appid, "not_found")
         return None
 
     # Parse the response data
-    game_data = data[appid]["data"]
-    result = {
-        "appid": appid,
-        "name": game_data.get("name"),
-        "header_image": game_data.get("header_image"),
-        "short_description": game_data.get("short_description"),
-        "developers": ", ".join(game_data.get("developers", [])),
-        "publishers": ", ".join(game_data.get("publishers", [])),
-        "release_date": game_data.get("release_date", {}).get("date"),
-        "platforms": ", ".join([k for k, v in game_data.get("platforms", {}).items() if v]),
-        "price": game_data.get("price_overview", {}).get("final_formatted"),
-        "categories": ", ".join([cat["description"] for cat in game_data.get("categories", [])]),
-        "genres": ", ".join([genre["description"] for genre in game_data.get("genres", [])]),
-        "website": game_data.get("website"),
-        "screenshots": ", ".join([s["path_full"] for s in game_data.get("screenshots", [])]),
-        "background": game_data.get("background")
-    }
-
-    # Add metadata to BigQuery
-    bigquery_calling.BQ_add_metadata(result)
-
-    for data in fieldnames:
-        if data in ["platforms", "categories", "genres", "screenshots"]:
-            result[data] = result[data].split(", ") if result[data] else []
+    result = ingestion.store_data_to_row(appid, data[str(appid)]["data"])
+
+    # Add metadata to the storage backend and to the cache store
+    storage.add_metadata(result)
+    result = metadata_store.add(result)
 
     return result
 
 
+# Fetch metadata for many appids: cache hits in memory, misses in one storage query
+# Appids missing from storage are reported as not_found instead of being fetched from the Steam store
+#  (the single appid endpoint still falls back upstream)
+# Input: list of int appids (not in BAD_APPIDS)
+# Output: {appid: {"status": "ok", "data": row} | {"status": "failed", "reason": reason}}
+def fetch_games_metadata(appids):
+    snapshot = check_and_update_cache()
+    metadata_store = snapshot.metadata_store if snapshot else MetadataStore()
+
+    results = {}
+    missing = []
+    for appid in appids:
+        result = metadata_store.get(appid)
+        if result is not None:
+            results[appid] = {"status": "ok", "data": result}
+        else:
+            missing.append(appid)
+
+    metrics.cache_requests.inc("metadata", "hit", amount=len(results))
+    metrics.cache_requests.inc("metadata", "miss", amount=len(missing))
+    if missing:
+        results.update(in_flight.do(("metadata", tuple(missing)), load_games_metadata, missing, metadata_store))
+    return results
+
+# Load metadata for appids missing from the cache, found metadata is added to metadata_store
+def load_games_metadata(appids, metadata_store):
+    found = storage.get_metadata_by_appids(appids)
+    if found is None:
+        raise RuntimeError(f"Metadata lookup for {len(appids)} appids failed")
+
+    results = {appid: {"status": "ok", "data": metadata_store.add(row)} for appid, row in found.items()}
+    for appid in appids:
+        results.setdefault(appid, {"status": "failed", "reason": "not_found"})
+    return results
+
 
-# Get all top games sorted by concurrent players
 # Output: appid, name, header_image, concurrent_in_game, rank
 def get_all_top_games_sored():
-    all_games_return = bigquery_calling.BQ_get_current_history_playercount_sorted()
+    all_games_return = storage.get_current_history_playercount_sorted()
 
     # Raking the games based on concurrent_in_game
     for i, game in enumerate(all_games_return, start=1):
@@ -167,87 +313,330 @@ def get_all_top_games_sored():
 
     return all_games_return
 
-def check_and_update_cache():
-    global cache_last_fetch_timestamp, cache_game_ranking_topcurplayers, cache_all_games_metadata
+# Build a new cache snapshot: ranking + metadata + indexes
+# Raises if the storage backend returned nothing so the last good snapshot is kept
+def build_cache_snapshot(generation):
+    print("Cache expired or empty, fetching new data.")
+    exec_all_ranks = executor.submit(get_all_top_games_sored)
+    metadata_table = storage.get_all_metadata_table()
+    game_ranking_topcurplayers = exec_all_ranks.result()
+
+    if not game_ranking_topcurplayers or metadata_table is None or metadata_table.num_rows == 0:
+        raise ValueError("Storage backend returned no ranking or metadata")
+
+    # Ranked games missing from the metadata table are backfilled in one batch here, not per request
+    metadata_store = MetadataStore(metadata_table)
+    missing_appids = [game["appid"] for game in game_ranking_topcurplayers if game["appid"] not in metadata_store]
+    if missing_appids:
+        print(f"Metadata for {len(missing_appids)} ranked appids not found, fetching from API.")
+        for result in storage.backfill_metadata(missing_appids).values():
+            if result["status"] == "ok":
+                metadata_store.add(result["data"])
+
+    analytics_table = build_analytics_table(game_ranking_topcurplayers)
+    fetched_at = int(time.time())
+    return make_cache_snapshot(
+        generation, fetched_at, game_ranking_topcurplayers, metadata_store, analytics_table,
+        history_version=get_history_version(fetched_at),
+    )
+
+# Version of the stored player count histories: the newest committed update run
+# Only an update run changes the histories, so the history cache outlives refreshes and is the same in every
+#  worker, a failed lookup gives a version of its own (cached histories are not reused across it)
+def get_history_version(fetched_at):
     try:
-        # Check if cache is empty or expired
-        if not cache_all_games_metadata or not cache_game_ranking_topcurplayers or \
-            (int(time.time()) - cache_last_fetch_timestamp >= CACHE_DURATION):
-            print("Cache expired or empty, fetching new data.")
-            exec_all_ranks = executor.submit(get_all_top_games_sored)
-            exec_all_games = executor.submit(fetch_game_metadata)
-
-            cache_game_ranking_topcurplayers = exec_all_ranks.result()
-            cache_all_games_metadata = exec_all_games.result()
-            cache_last_fetch_timestamp = int(time.time())
+        return storage.get_last_committed_update_run_id()
     except Exception as e:
-        print(f"Error fetching data: {e}")
-        return jsonify({"error": "Failed to fetch data"}), 500
+        print(f"Error reading the last committed update run: {e}")
+        return f"unknown-{fetched_at}"
+
+# Ranks of the current snapshot the new ranking is compared with
+# A refresh without new data (same ranking) keeps the rank changes of the last update
+def get_previous_ranks(game_ranking_topcurplayers):
+    snapshot = cache_manager.snapshot
+    if snapshot is None:
+        return {}
+    previous = {int(game["appid"]): int(game["rank"]) for game in snapshot.ranking}
+    if previous == {int(game["appid"]): int(game["rank"]) for game in game_ranking_topcurplayers}:
+        return snapshot.analytics.previous_ranks()
+    return previous
+
+# Trending / peak statistics of every ranked game, computed from the full player count histories
+# Output: analytics pyarrow.Table (empty if the histories could not be fetched)
+def build_analytics_table(game_ranking_topcurplayers):
+    started = time.monotonic()
+    rows = storage.get_history_playercount_by_appids([int(game["appid"]) for game in game_ranking_topcurplayers])
+    if rows is None:
+        print("Player count histories for analytics could not be fetched.")
+        return compute_analytics([], [])
+
+    histories = []
+    ranks = []
+    for game in game_ranking_topcurplayers:
+        row = rows.get(int(game["appid"]))
+        if row is None:
+            continue
+        history = PlayerHistory.from_row(row)
+        if len(history):
+            histories.append(history)
+            ranks.append(int(game["rank"]))
+
+    table = compute_analytics(histories, ranks, get_previous_ranks(game_ranking_topcurplayers))
+    print(f"Analytics for {table.num_rows} games computed in {time.monotonic() - started:.2f}s.")
+    return table
+
+# Cache snapshot with indexes built from the ranking and the Arrow metadata table of metadata_store
+# indexes - persisted index tables of a published snapshot, used instead of building the indexes again
+def make_cache_snapshot(generation, fetched_at, game_ranking_topcurplayers, metadata_store, analytics_table,
+                        indexes=None, history_version=None):
+    indexes = indexes or {}
+    metadata_table = metadata_store.table
+    if "ranking_games" in indexes:
+        top_games = RankingSnapshot.from_tables(generation, indexes)
+    else:
+        top_games = RankingSnapshot(generation, game_ranking_topcurplayers, metadata_store)
+    search_index = SearchIndex.from_tables(metadata_table, indexes) if "search_rows" in indexes else None
+    if search_index is None:
+        search_index = SearchIndex(
+            metadata_table,
+            {int(game["appid"]): game["concurrent_in_game"] for game in game_ranking_topcurplayers},
+        )
+    if "aggregates_counts" in indexes:
+        aggregates = MetadataAggregates.from_tables(metadata_table, indexes)
+    else:
+        aggregates = MetadataAggregates(metadata_table)
+    return CacheSnapshot(
+        generation=generation,
+        fetched_at=fetched_at,
+        ranking=game_ranking_topcurplayers,
+        metadata=metadata_table,
+        metadata_store=metadata_store,
+        search_index=search_index,
+        top_games=top_games,
+        metadata_export=MetadataExport(metadata_table),
+        aggregates=aggregates,
+        analytics=GameAnalytics(analytics_table, {game["appid"]: game for game in top_games.games}),
+        history_version=history_version,
+    )
+
+# Cache snapshot from the snapshot persisted by the update task, None if there is none
+def load_cache_snapshot(generation):
+    started = time.monotonic()
+    warm = load_warm_snapshot()
+    if warm is None or not warm["ranking"] or warm["metadata"].num_rows == 0:
+        return None
+    published.loaded_version = warm["version"]
+    snapshot = make_cache_snapshot(
+        generation, warm["fetched_at"], warm["ranking"], MetadataStore(warm["metadata"]), warm["analytics"],
+        warm["indexes"], warm["history_version"],
+    )
+    # Time until the snapshot can serve requests, including any index not persisted with it
+    print(f"Warm snapshot {warm['version']} servable in {time.monotonic() - started:.2f}s "
+          f"({len(warm['indexes'])} persisted index tables).")
+    return snapshot
+
+# Persist snapshot so new instances start warm and other workers can attach to it
+def publish_cache_snapshot(snapshot):
+    published.loaded_version = save_warm_snapshot(
+        snapshot.generation, snapshot.fetched_at, snapshot.ranking, snapshot.metadata, snapshot.analytics.table,
+        {**snapshot.search_index.to_tables(), **snapshot.top_games.to_tables(), **snapshot.aggregates.to_tables()},
+        snapshot.history_version,
+    )
+
+# Cache refresh in shared mode
+# - a newer snapshot published by another worker is attached to
+# - the builder worker rebuilds from storage and publishes
+# - other workers keep serving their snapshot until the builder publishes (picked up by published.poll),
+#   on a cold start they wait for the first publish
+def build_shared_cache_snapshot(generation):
+    if not published.has_new():
+        if builder_lock.acquire():
+            snapshot = build_cache_snapshot(generation)
+            publish_cache_snapshot(snapshot)
+            return snapshot
+        if cache_manager.snapshot is not None:
+            return cache_manager.snapshot
+        if not published.wait_for_new(SHARED_FIRST_WAIT):
+            raise ValueError("Waiting for the builder worker to publish a snapshot")
+
+    snapshot = load_cache_snapshot(generation)
+    if snapshot is None:
+        raise ValueError("Published snapshot could not be loaded")
+    return snapshot
+
+published = PublishedSnapshots()
+builder_lock = BuilderLock()
+
+cache_manager = CacheRefreshManager(
+    build_shared_cache_snapshot if CACHE_MODE == "shared" else build_cache_snapshot,
+    executor.submit,
+    max_age=CACHE_DURATION,
+    refresh_ahead=CACHE_REFRESH_AHEAD,
+    load_initial=load_cache_snapshot,
+)
+# Instances load the persisted snapshot at boot instead of on the first request
+# (Flask-Executor copies the request context into submitted jobs, so one is needed here)
+with app.test_request_context():
+    cache_manager.warm_up()
+
+# Cache state read on every /metrics scrape
+def collect_cache_metrics():
+    history = history_cache.stats()
+    snapshot = cache_manager.snapshot
+    families = [
+        ("history_cache_entries", "gauge", "Player histories in the history cache", [({}, history["entries"])]),
+        ("history_cache_points", "gauge", "Points held by the history cache", [({}, history["weight"])]),
+        ("history_cache_requests_total", "counter", "History cache lookups by result",
+         [({"result": "hit"}, history["hits"]), ({"result": "miss"}, history["misses"])]),
+        ("history_cache_evictions_total", "counter", "History cache evictions", [({}, history["evictions"])]),
+    ]
+    if snapshot is not None:
+        families += [
+            ("cache_snapshot_generation", "gauge", "Generation of the served cache snapshot",
+             [({"mode": CACHE_MODE}, snapshot.generation)]),
+            ("cache_snapshot_age_seconds", "gauge", "Age of the served cache snapshot",
+             [({"mode": CACHE_MODE}, round(time.time() - snapshot.fetched_at, 3))]),
+            ("cache_snapshot_rows", "gauge", "Ranked games / metadata rows in the served snapshot",
+             [({"table": "ranking"}, len(snapshot.top_games)), ({"table": "metadata"}, len(snapshot.metadata_store))]),
+        ]
+    return families
+
+metrics.register_collector(collect_cache_metrics)
+metrics.start_process_writer()
+
+# Version the history cache is keyed by (the stored histories, see get_history_version), never blocks on a refresh
+def history_cache_generation():
+    snapshot = cache_manager.snapshot
+    return snapshot.history_version if snapshot is not None else None
+
+# Get current cache snapshot, refreshing it in background when needed
+# Output: CacheSnapshot or None if no data could be fetched yet
+def check_and_update_cache():
+    # Pick up snapshots published by the builder (or an update task) in another worker
+    if CACHE_MODE == "shared" and cache_manager.snapshot is not None and published.poll():
+        cache_manager.invalidate()
+    return cache_manager.get()
 
 #########################################################
 #####################   API CALLS   #####################
 #########################################################
 
 
+# Request latency per route (streamed bodies are timed until the response object is returned)
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def observe_request_duration(response):
+    started = g.pop("request_started", None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        metrics.http_request_duration.observe(
+            time.perf_counter() - started, route, request.method, response.status_code
+        )
+    return response
+
+# Conditional GET for snapshot routes: a matching If-None-Match is answered with 304 without running the handler
+@app.before_request
+def check_not_modified():
+    if request.method != "GET" or request.url_rule is None or request.url_rule.rule not in SNAPSHOT_ROUTES:
+        return None
+    if request.url_rule.rule in NON_BLOCKING_SNAPSHOT_ROUTES:
+        snapshot = cache_manager.snapshot
+    else:
+        snapshot = check_and_update_cache()
+    if snapshot is None:
+        return None
+    g.cache_snapshot = snapshot
+    if request.if_none_match.contains_weak(snapshot_etag(snapshot)):
+        return app.response_class(status=304)
+    return None
+
+# ETag / Cache-Control headers and compressed bodies
+# (the ETag comes from the snapshot looked up before the handler, so it is never newer than the body)
+@app.after_request
+def set_cache_headers(response):
+    rule = request.url_rule.rule if request.url_rule is not None else None
+    snapshot = g.pop("cache_snapshot", None)
+    # A handler setting its own (strong) ETag encodes the body itself, re-encoding it here would send
+    #  different bytes under the same validator
+    handler_etag = "ETag" in response.headers
+
+    if request.method == "GET" and response.status_code in (200, 304) and rule in ROUTE_CACHE_POLICIES:
+        response.headers.setdefault("Cache-Control", cache_control(ROUTE_CACHE_POLICIES[rule]))
+        if snapshot is not None and "ETag" not in response.headers:
+            response.set_etag(snapshot_etag(snapshot), weak=True)
+            if response.status_code == 200 and not response.is_streamed:
+                response.make_conditional(request)
+
+    if response.status_code != 200 or response.mimetype not in COMPRESSIBLE_MIMETYPES \
+            or "Content-Encoding" in response.headers or handler_etag:
+        return response
+    response.vary.add("Accept-Encoding")
+    encoding = request.accept_encodings.best_match(ENCODINGS)
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        response.response = compress_stream(response.response, encoding)
+        response.headers.pop("Content-Length", None)
+    else:
+        body = response.get_data()
+        if len(body) < MIN_COMPRESS_SIZE:
+            return response
+        response.set_data(compressed_bodies.get(body, encoding))
+    response.headers["Content-Encoding"] = encoding
+    return response
+
+# Prometheus metrics of this instance (with gunicorn, the metrics of every worker are merged,
+#  see METRICS_MULTIPROC_DIR in gunicorn.conf.py)
+# Output: text exposition format
+@app.route("/metrics")
+def get_metrics():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
 # Top Current Gasmes
-# Input: key
+# Input: optional page + per_page OR offset + limit
 # Output: rank, appid, concurrent_in_game + name, header_image
+#  without paging params - whole list (total and generation in X-Total-Count / X-Cache-Generation headers)
+#  with paging params - {generation, total, offset, limit, games}
 @app.route("/api/topcurrentgames")
 def get_top_current_games():
-    global cache_game_ranking_topcurplayers, cache_all_games_metadata
-    combine_data = []
-
     # Check and update cache if needed
-    check_and_update_cache()
+    snapshot = check_and_update_cache()
 
-    if not cache_game_ranking_topcurplayers or not cache_all_games_metadata:
+    if snapshot is None or not len(snapshot.top_games):
+        metrics.cache_requests.inc("ranking", "miss")
         return jsonify({"error": "No data available"}), 500
+    metrics.cache_requests.inc("ranking", "hit")
 
     try:
-        # Process the cached game ranking data
-        for game in cache_game_ranking_topcurplayers:
-            metadata = look_for_data_in_sorted_list(cache_all_games_metadata, int(game["appid"]))
-            if metadata is not None:
-                game["name"] = metadata.get("name", "Unknown")
-                game["header_image"] = metadata.get("header_image", "")
-            else:
-                print(f"Metadata for appid {game['appid']} not found, fetching from API.")
-                try_to_fetch = fetch_game_metadata(game["appid"])
-                if try_to_fetch is None:
-                    continue
-                game["name"] = try_to_fetch["name"]
-                game["header_image"] = try_to_fetch["header_image"]
-
-            # Append the game data to the combined list
-            combine_data.append({
-                "rank": game["rank"],
-                "appid": game["appid"],
-                "concurrent_in_game": game["concurrent_in_game"],
-                "name": game["name"],
-                "header_image": game["header_image"]
-            })
-
-        return jsonify(combine_data)
+        top_games = snapshot.top_games
+        args = request.args
+
+        if "page" in args or "per_page" in args:
+            per_page = max(1, min(args.get("per_page", 25, type=int), RANKING_MAX_PAGE_SIZE))
+            page = max(1, args.get("page", 1, type=int))
+            body = top_games.encode_page((page - 1) * per_page, per_page)
+        elif "offset" in args or "limit" in args:
+            limit = max(1, min(args.get("limit", 25, type=int), RANKING_MAX_PAGE_SIZE))
+            offset = max(0, args.get("offset", 0, type=int))
+            body = top_games.encode_page(offset, limit)
+        else:
+            body = top_games.encode_slice()
+
+        response = app.response_class(body, mimetype="application/json")
+        response.headers["X-Total-Count"] = str(len(top_games))
+        response.headers["X-Cache-Generation"] = str(top_games.generation)
+        return response
     except Exception as e:
         print(f"Error processing game metadata: {e}")
         return jsonify({"error": "Failed to process game metadata"}), 500
     
     
 
-# Look for data in sorted list by appid
-def look_for_data_in_sorted_list(sorted_list, appid):
-    low, high = 0, len(sorted_list) - 1
-    while low <= high:
-        mid = (low + high) // 2
-        if int(sorted_list[mid]["appid"]) == appid:
-            return sorted_list[mid]
-        elif int(sorted_list[mid]["appid"]) < appid:
-            low = mid + 1
-        else:
-            high = mid - 1
-    return None
-
-
 # Get Metadata from appid
 # Input: appid
 # Output: appid, name, header_image
@@ -256,116 +645,434 @@ def get_game_metadata(appid):
     if appid is None or not appid.isdigit():
         return jsonify({"error": "Invalid appid format"}), 400
 
+    bad = rejected_appid(appid)
+    if bad is not None:
+        return jsonify({"error": "Game not found", "reason": bad["reason"]}), 404
+
     try:
         metadata = fetch_game_metadata(appid)
         if metadata:
             return jsonify(metadata)
         return jsonify({"error": "Game not found"}), 404
+    except ConnectionError as e:
+        return jsonify({"error": str(e)}), 503, {"Retry-After": str(METADATA_RETRY_AFTER)}
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+# Get trending / peak statistics of a game
+# Input: appid
+# Output: rank, previous_rank, rank_change, players, peak, peak_ts, change_24h / 7d / 30d (absolute and percent),
+#  avg_7d / avg_30d - precomputed for ranked games, computed from the player count history otherwise
+@app.route("/api/steam/game/<appid>/stats")
+def get_game_stats(appid):
+    if appid is None or not appid.isdigit():
+        return jsonify({"error": "Invalid appid format"}), 400
+
+    bad = rejected_appid(appid)
+    if bad is not None:
+        return jsonify({"error": "App ID not found", "reason": bad["reason"]}), 404
+
+    try:
+        snapshot = check_and_update_cache()
+        stats = snapshot.analytics.get(appid) if snapshot is not None else None
+        if stats is not None:
+            return jsonify(stats)
+
+        history = get_current_history_playercouny(appid)
+        if history is None or not len(history):
+            return jsonify({"error": "App ID not found"}), 404
+        stats = compute_analytics([history], [None]).to_pylist()[0]
+        metadata = snapshot.metadata_store.get(appid) if snapshot is not None else None
+        stats["name"] = metadata.get("name") if metadata else history.name
+        stats["header_image"] = metadata.get("header_image") if metadata else ""
+        return jsonify(stats)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+# Get the ranked games with the largest player count change
+# Input: optional window (24h, 7d, 30d - default 7d), by (percent, absolute - default percent),
+#  limit (default 50, max 500), min_players (default 100 current players)
+# Output: list of game stats (see /api/steam/game/<appid>/stats), largest change first
+@app.route("/api/trending")
+def get_trending():
+    args = request.args
+    window = args.get("window", "7d")
+    by = args.get("by", "percent")
+    if window not in CHANGE_WINDOWS or by not in TRENDING_BY:
+        return jsonify({"error": f"window must be one of {list(CHANGE_WINDOWS)}, by one of {list(TRENDING_BY)}"}), 400
+    limit = max(1, min(args.get("limit", TRENDING_DEFAULT_LIMIT, type=int), TRENDING_MAX_LIMIT))
+    min_players = max(0, args.get("min_players", TRENDING_MIN_PLAYERS, type=int))
+
+    snapshot = check_and_update_cache()
+    if snapshot is None or not len(snapshot.analytics):
+        return jsonify({"error": "No data available"}), 500
+
+    try:
+        body = snapshot.analytics.encode_trending(window, by, limit, min_players)
+        response = app.response_class(body, mimetype="application/json")
+        response.headers["X-Cache-Generation"] = str(snapshot.generation)
+        return response
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+# Appids of a multi-get request: ?appids=1,2,3 or JSON body {"appids": [1, 2, 3]}
+# Output: (unique int appids in request order, {raw value: error} for invalid ones)
+def parse_appids_arg():
+    body = request.get_json(silent=True) or {}
+    if "appids" in request.args:
+        values = request.args["appids"].split(",")
+    else:
+        values = body.get("appids") or []
+        if not isinstance(values, list):
+            raise ValueError("appids must be a list")
+
+    appids = {}
+    errors = {}
+    for value in values:
+        value = str(value).strip()
+        if not value:
+            continue
+        if value.isdigit():
+            appids[int(value)] = None
+        else:
+            errors[value] = {"error": "Invalid appid format"}
+
+    if not appids and not errors:
+        raise ValueError("No appids given")
+    if len(appids) + len(errors) > MAX_BATCH_APPIDS:
+        raise ValueError(f"At most {MAX_BATCH_APPIDS} appids per request")
+    return list(appids), errors
+
+# Get metadata of many games in one request
+# Input: appids (comma separated query param or JSON body list, max 500)
+# Output: {appid: metadata OR {"error", "reason"}}
+@app.route("/api/steam/games", methods=["GET", "POST"])
+def get_games_metadata():
+    try:
+        appids, results = parse_appids_arg()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        to_fetch = []
+        for appid in appids:
+            bad = rejected_appid(appid)
+            if bad is not None:
+                results[str(appid)] = {"error": "Game not found", "reason": bad["reason"]}
+            else:
+                to_fetch.append(appid)
+
+        fetched = fetch_games_metadata(to_fetch) if to_fetch else {}
+        for appid in to_fetch:
+            result = fetched.get(appid, {"status": "failed", "reason": "not_found"})
+            if result["status"] == "ok":
+                results[str(appid)] = result["data"]
+            else:
+                results[str(appid)] = {"error": "Game not found", "reason": result["reason"]}
+        return jsonify(results)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 # Get all metadata
-# Input: None
-# Output: list of all games metadata
+# Input: optional fields (e.g. "appid,name,genres"), cursor (last appid of previous page),
+#  limit, format=ndjson
+# Output: list of all games metadata, streamed in chunks
+#  next page cursor in X-Next-Cursor header (missing on last page)
 @app.route("/api/steam/allmetadata")
 def get_metadata_all():
-    global cache_all_games_metadata
     try:
-        if not cache_all_games_metadata:
-            check_and_update_cache()
+        fields = parse_fields(request.args.get("fields"))
+        cursor = request.args.get("cursor", type=int)
+        limit = request.args.get("limit", type=int)
+        if limit is not None and limit < 1:
+            return jsonify({"error": "limit must be positive"}), 400
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
-        if not cache_all_games_metadata:
+    try:
+        snapshot = check_and_update_cache()
+
+        if snapshot is None or not len(snapshot.metadata_export):
             return jsonify({"error": "No metadata found"}), 404
-                
-        return jsonify(cache_all_games_metadata)
+
+        export = snapshot.metadata_export
+        ndjson = request.args.get("format") == "ndjson"
+        start, end, next_cursor = export.page(cursor, limit)
+
+        response = app.response_class(
+            export.stream(start, end, fields, ndjson),
+            mimetype="application/x-ndjson" if ndjson else "application/json",
+        )
+        response.headers["X-Total-Count"] = str(len(export))
+        if next_cursor is not None:
+            response.headers["X-Next-Cursor"] = str(next_cursor)
+        return response
     
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+# Get aggregated counts for the analysis charts
+# Input: optional top (default 20), dimensions (e.g. "genres,platforms"), genre, platform, year
+# Output: generation + {dimension: [{name, value}]} for developers, publishers, platforms, categories, genres
+@app.route("/api/steam/aggregates")
+def get_metadata_aggregates():
+    args = request.args
+    top = max(1, min(args.get("top", DEFAULT_TOP_N, type=int), MAX_TOP_N))
+    dimensions = [d.strip() for d in args.get("dimensions", "").split(",") if d.strip()] or None
+    if dimensions and any(d not in DIMENSIONS for d in dimensions):
+        return jsonify({"error": f"Unknown dimension, expected any of: {', '.join(DIMENSIONS)}"}), 400
+
+    try:
+        snapshot = check_and_update_cache()
+
+        if snapshot is None or not len(snapshot.aggregates):
+            return jsonify({"error": "No metadata found"}), 404
+
+        counts = snapshot.aggregates.top(
+            top,
+            dimensions,
+            genre=args.get("genre"),
+            platform=args.get("platform"),
+            year=args.get("year", type=int),
+        )
+        return jsonify({"generation": snapshot.generation, **counts})
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+# Get cache statistics
+# Output: hit / miss / eviction counters of the player history and compressed body caches
+@app.route("/api/cache/stats")
+def get_cache_stats():
+    return jsonify({"history": history_cache.stats(), "compressed_bodies": compressed_bodies.stats()})
+
 # Get all games applist
-# Input: None
-# Output: list of appids and names
+# Input: optional since=<version> for a delta from that version
+# Output: list of appids and names (gzip when accepted), ETag = version
+#  OR with known since: {version, since, added, removed}
 @app.route("/api/steam/getallgameslist")
 def get_search_games():
     try:
-        all_games = csv_calling.get_all_steam_games()
-        
-        if not all_games:
+        snapshot = applist_cache.get()
+
+        if not snapshot.names:
             return jsonify({"error": "No games found"}), 404
-        
-        return jsonify(all_games)
+
+        since = request.args.get("since")
+        delta = snapshot.delta_since(since) if since else None
+        etag = snapshot.version if delta is None else f"{snapshot.version}-{since}"
+        # Every encoding is a different representation, so it gets its own strong ETag
+        gzip = "gzip" in request.accept_encodings
+        if gzip:
+            etag += "-gzip"
+
+        if request.if_none_match.contains(etag):
+            response = app.response_class(status=304)
+        else:
+            json_bytes, gzip_bytes = delta if delta is not None else (snapshot.json_bytes, snapshot.gzip_bytes)
+            response = app.response_class(mimetype="application/json")
+            if gzip:
+                response.set_data(gzip_bytes)
+                response.headers["Content-Encoding"] = "gzip"
+            else:
+                response.set_data(json_bytes)
+
+        response.set_etag(etag)
+        response.headers["Vary"] = "Accept-Encoding"
+        response.headers["X-Applist-Version"] = snapshot.version
+        return response
     
     except Exception as e:
         return jsonify({"error": str(e)}), 500
     
 # Get game api by search query
-# Input: query
-# Output: appid, name, header_images
+# Input: query, limit (optional, default 20, max 100)
+# Output: appid, name, header_image - ranked by exact/prefix match, then current players
 @app.route("/api/steam/search/<query>")
 def get_search_games_query(query):
     try:
-        global cache_all_games_metadata
-        if not cache_all_games_metadata:
-            check_and_update_cache()
-        
-        all_games = cache_all_games_metadata
+        limit = request.args.get("limit", SEARCH_DEFAULT_LIMIT, type=int)
+        limit = max(1, min(limit, SEARCH_MAX_LIMIT))
 
-        if not all_games:
+        snapshot = check_and_update_cache()
+
+        if snapshot is None or not len(snapshot.search_index):
             return jsonify({"error": "No games found"}), 404
-        
-        filtered_games = []
-
-        for game in all_games:
-            if game["name"].lower().find(str(query.lower()), 0, 4 + len(str(query))) != -1:
-                filtered_games.append({
-                    "appid": game["appid"],
-                    "name": game["name"],
-                    "header_image": game["header_image"]
-                })
-
-        return jsonify(filtered_games)
+
+        return jsonify(snapshot.search_index.search(query, limit))
     
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 # Get current player count for a game
-# Input: appid
-# Output: appid, name, date_playerscount
+# Input: appid, optional from / to (epoch ms or ISO date), points (LTTB downsampling target),
+#  format=columns
+# Output: [{appid, name, date_playerscount}]
+#  OR with format=columns: {appid, name, timestamps, counts}
 @app.route("/api/steam/playercount/<appid>")
 def get_current_playercount(appid):
+    if appid is None or not appid.isdigit():
+        return jsonify({"error": "Invalid appid format"}), 400
+
+    args = request.args
     try:
-        row_of_data = get_current_history_playercouny(appid)
-        if row_of_data is None:
+        from_ts = parse_time_arg(args.get("from"))
+        to_ts = parse_time_arg(args.get("to"))
+        points = args.get("points", type=int)
+        if points is not None:
+            points = max(MIN_POINTS, min(points, MAX_POINTS))
+    except ValueError as e:
+        return jsonify({"error": f"Invalid from/to: {e}"}), 400
+    columns = args.get("format") == "columns"
+
+    bad = rejected_appid(appid)
+    if bad is not None:
+        return jsonify({"error": "App ID not found", "reason": bad["reason"]}), 404
+
+    try:
+        history = get_current_history_playercouny(appid)
+        if history is None:
             return jsonify({"error": "App ID not found"}), 404
-        return jsonify(row_of_data)
+
+        history = history.between(from_ts, to_ts).downsample(points)
+        if columns:
+            return jsonify(history.to_columns())
+        return jsonify([history.to_row()])
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
+# Get player count history of many games in one request
+# Input: appids (comma separated query param or JSON body list, max 500),
+#  optional from / to, points, format=columns - applied to every game
+# Output: {appid: {appid, name, date_playerscount} OR {appid, name, timestamps, counts}
+#  OR {"error", "reason"}}
+@app.route("/api/steam/playercounts", methods=["GET", "POST"])
+def get_playercounts():
+    args = request.args
+    try:
+        appids, results = parse_appids_arg()
+        from_ts = parse_time_arg(args.get("from"))
+        to_ts = parse_time_arg(args.get("to"))
+        points = args.get("points", type=int)
+        if points is not None:
+            points = max(MIN_POINTS, min(points, MAX_POINTS))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    columns = args.get("format") == "columns"
 
-# Update the player count history in BigQuery
-# This endpoint is for manual triggering of the update task
+    try:
+        to_fetch = []
+        for appid in appids:
+            bad = rejected_appid(appid)
+            if bad is not None:
+                results[str(appid)] = {"error": "App ID not found", "reason": bad["reason"]}
+            else:
+                to_fetch.append(appid)
 
-# @app.route("/update", methods=["POST"])
-# def update_entrypoint():
-#     if bigquery_calling.try_acquire_lock():
-#         task_name = bigquery_calling.create_cloud_task()
-#         return jsonify({"status": "Update task enqueued", "task": task_name}), 202
-#     else:
-#         return jsonify({"status": "Update already running or not due"}), 200
+        histories = get_player_histories(to_fetch) if to_fetch else {}
+        for appid in to_fetch:
+            history = histories.get(appid)
+            if history is None:
+                results[str(appid)] = {"error": "App ID not found"}
+                continue
+            history = history.between(from_ts, to_ts).downsample(points)
+            results[str(appid)] = history.to_columns() if columns else history.to_row()
+        return jsonify(results)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+# Update the player count history
+# A run is split into appid shards, every crawled shard is checkpointed (staged rows) and the run is
+#  committed in one transaction once all shards are done, so a retried or timed out update resumes
+#  the unfinished shards and readers never see a half applied update (see update_job.py)
+
+# Commits run if every shard is done, then rebuilds and publishes the caches
+# Output: True if the run is committed
+def finish_update_run(run):
+    if not update_job.commit_if_finished(run):
+        return False
+    history_cache.clear()
+
+    # Rebuild and publish the caches so other workers and new instances pick them up
+    try:
+        publish_cache_snapshot(cache_manager.rebuild(build_cache_snapshot))
+    except Exception as e:
+        print(f"Cache rebuild after update failed, keeping the last snapshot: {e}")
+    return True
+
+# committed=False with no pending shards means another shard request committed the run
+def update_status(run, committed):
+    mode = "full" if run["full_rebuild"] else "incremental"
+    pending = [] if committed else update_job.pending_shards(run)
+    if not pending:
+        return jsonify({"status": "Update finished", "run_id": run["run_id"], "mode": mode}), 200
+    return jsonify({
+        "status": "Update in progress",
+        "run_id": run["run_id"],
+        "mode": mode,
+        "pending_shards": pending,
+    }), 202
+
+# Input: optional mode=full (query string or JSON body) to rebuild the whole history table,
+#  default is incremental (only new points are appended); optional shards (new runs only)
+# Output: 200 when the run is committed, 202 while shards are pending (call again to resume)
 @app.route("/update-task", methods=["POST"])
 def update_task_handler():
     try:
-        all_data = executor.submit(bigquery_calling.BQ_fetch_new_history_playercount).result()
-        bigquery_calling.upload_to_bigquery(all_data)
+        body = request.get_json(silent=True) or {}
+        full_rebuild = (request.args.get("mode") or body.get("mode")) == "full"
+        shards = int(request.args.get("shards") or body.get("shards") or update_job.UPDATE_SHARDS)
+        if shards < 1:
+            return jsonify({"error": "shards must be positive"}), 400
+
+        run, resumed = update_job.start_or_resume_run(full_rebuild, shards)
+        if run is None:
+            # The lock was not acquired, so it is not ours to release
+            return jsonify({"status": "Update already running or not due"}), 200
+        if resumed:
+            print(f"Resuming update run {run['run_id']}.")
+
+        pending = update_job.pending_shards(run)
+        if update_job.UPDATE_DISPATCH == "tasks":
+            for shard in pending:
+                storage.enqueue_update_shard(run["run_id"], shard)
+            return jsonify({"status": "Update shards enqueued", "run_id": run["run_id"], "shards": pending}), 202
+
+        deadline = time.monotonic() + update_job.UPDATE_TIME_BUDGET
+        for shard in pending:
+            executor.submit(update_job.run_shard, run, shard).result()
+            if time.monotonic() > deadline:
+                break
+        return update_status(run, finish_update_run(run))
 
-        return jsonify({"status": "Update finished"}), 200
-    
     except Exception as e:
         print(f"Update failed: {e}")
         return jsonify({"error": str(e)}), 500
-    finally:
-        bigquery_calling.release_lock()
+
+# Crawls one shard of a run (Cloud Tasks target, see UPDATE_DISPATCH), the last shard commits the run
+# Input: JSON body {"run_id", "shard"}
+@app.route("/update-task/shard", methods=["POST"])
+def update_shard_handler():
+    try:
+        body = request.get_json(silent=True) or {}
+        run = storage.get_update_run(body.get("run_id"))
+        if run is None:
+            return jsonify({"error": "Unknown update run"}), 404
+        if run["committed"]:
+            return update_status(run, True)
+
+        shard = int(body.get("shard", -1))
+        if not 0 <= shard < run["shards"]:
+            return jsonify({"error": "Invalid shard"}), 400
+
+        update_job.run_shard(run, shard)
+        return update_status(run, finish_update_run(run))
+
+    except Exception as e:
+        print(f"Update shard failed: {e}")
+        return jsonify({"error": str(e)}), 500
 
 
 # RUN THE APP
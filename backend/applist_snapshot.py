@@ -0,0 +1,81 @@
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+
+# How often the source file is checked for changes
+APPLIST_CHECK_INTERVAL = 60
+# Number of previous versions a delta can be requested from
+APPLIST_DELTA_VERSIONS = 3
+
+
+def _encode(data):
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+# One encoded version of the applist: raw JSON, gzip JSON and content hash version
+class AppListSnapshot:
+    # previous - (version, names) of recent versions
+    def __init__(self, games, previous=()):
+        self.names = {game["appid"]: game["name"] for game in games}
+        self.json_bytes = _encode(games)
+        self.gzip_bytes = gzip.compress(self.json_bytes, compresslevel=9)
+        self.version = hashlib.sha256(self.json_bytes).hexdigest()[:20]
+
+        # Pre-encoded deltas from recent versions to this one
+        self.deltas = {}
+        for old_version, old_names in previous:
+            if old_version == self.version:
+                continue
+            added = [
+                {"appid": appid, "name": name}
+                for appid, name in self.names.items()
+                if old_names.get(appid) != name
+            ]
+            removed = [appid for appid in old_names if appid not in self.names]
+            delta = _encode({"version": self.version, "since": old_version, "added": added, "removed": removed})
+            self.deltas[old_version] = (delta, gzip.compress(delta))
+
+    # Delta from version `since` to this one (json, gzip) or None if unknown
+    def delta_since(self, since):
+        if since == self.version:
+            empty = _encode({"version": self.version, "since": since, "added": [], "removed": []})
+            return empty, gzip.compress(empty)
+        return self.deltas.get(since)
+
+
+# Applist snapshot rebuilt only when the source file changes
+# load_games() reads the source, path is stat-ed for changes
+class AppListCache:
+    def __init__(self, path, load_games):
+        self.path = path
+        self.load_games = load_games
+        self._snapshot = None
+        self._history = []
+        self._file_state = None
+        self._checked_at = 0
+        self._lock = threading.Lock()
+
+    def _state(self):
+        stat = os.stat(self.path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def get(self):
+        snapshot = self._snapshot
+        if snapshot is not None and time.time() - self._checked_at < APPLIST_CHECK_INTERVAL:
+            return snapshot
+
+        with self._lock:
+            if self._snapshot is not None and time.time() - self._checked_at < APPLIST_CHECK_INTERVAL:
+                return self._snapshot
+            self._checked_at = time.time()
+            state = self._state()
+            if self._snapshot is None or state != self._file_state:
+                previous = self._history[-APPLIST_DELTA_VERSIONS:]
+                self._snapshot = AppListSnapshot(self.load_games(), previous)
+                self._history = (previous + [(self._snapshot.version, self._snapshot.names)])[-APPLIST_DELTA_VERSIONS:]
+                self._file_state = state
+                print(f"Applist loaded, version {self._snapshot.version}.")
+            return self._snapshot
@@ -0,0 +1,157 @@
+import hashlib
+import math
+import os
+import sqlite3
+import threading
+import time
+
+import csv_calling
+
+BAD_APPIDS_DB_PATH = os.getenv("BAD_APPIDS_DB_PATH", os.path.join(csv_calling.BASE_DIR, "bad_appids.sqlite3"))
+
+# Time to live per failure reason (seconds), default for anything else
+REASON_TTL = {
+    "not_found": 7 * 24 * 60 * 60,
+    "legacy": 7 * 24 * 60 * 60,
+}
+DEFAULT_TTL = 60 * 60
+# How often other processes' writes are picked up
+SYNC_INTERVAL = 5
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS bad_appids (
+        appid INTEGER PRIMARY KEY,
+        reason TEXT,
+        failed_at REAL,
+        expires_at REAL
+    );
+"""
+
+
+# Fixed-size Bloom filter of int appids (double hashing over one blake2b digest)
+class BloomFilter:
+    def __init__(self, capacity, error_rate=0.01):
+        capacity = max(capacity, 1)
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, appid):
+        digest = hashlib.blake2b(str(appid).encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, appid):
+        for position in self._positions(appid):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, appid):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(appid))
+
+
+# Negative lookup cache for appids that failed to fetch
+# - exact entries (reason, expiry) live in SQLite so every worker process shares them
+# - an in-memory Bloom filter answers the common "not bad" case without touching SQLite
+# - the filter is rebuilt when another process commits (PRAGMA data_version)
+class NegativeCache:
+    def __init__(self, path=BAD_APPIDS_DB_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._bloom = BloomFilter(0)
+        # data_version is only comparable on one connection, so syncing has its own
+        self._sync_connection = None
+        self._data_version = None
+        self._synced_at = 0
+
+    def _connect(self, **kwargs):
+        connection = sqlite3.connect(self.path, timeout=30, **kwargs)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.executescript(SCHEMA)
+        return connection
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = self._connect()
+            self._local.connection = connection
+        return connection
+
+    # Import the legacy bad_fetching_appids.txt once (tracked in user_version)
+    def _import_legacy(self, connection):
+        if connection.execute("PRAGMA user_version").fetchone()[0] >= 1:
+            return
+        now = time.time()
+        with connection:
+            connection.execute("PRAGMA user_version = 1")
+            connection.executemany(
+                "INSERT OR IGNORE INTO bad_appids (appid, reason, failed_at, expires_at) VALUES (?, ?, ?, ?)",
+                [
+                    (int(appid), "legacy", now, now + REASON_TTL["legacy"])
+                    for appid in csv_calling.get_badappid_data() if appid.isdigit()
+                ],
+            )
+
+    # Rebuild the Bloom filter when the database changed (at most every SYNC_INTERVAL)
+    def _sync(self, force=False):
+        if not force and time.time() - self._synced_at < SYNC_INTERVAL:
+            return
+        with self._lock:
+            if self._sync_connection is None:
+                self._sync_connection = self._connect(check_same_thread=False)
+                self._import_legacy(self._sync_connection)
+            connection = self._sync_connection
+            data_version = connection.execute("PRAGMA data_version").fetchone()[0]
+            if force or data_version != self._data_version:
+                appids = [row[0] for row in connection.execute(
+                    "SELECT appid FROM bad_appids WHERE expires_at > ?", (time.time(),)
+                )]
+                bloom = BloomFilter(len(appids) * 2)
+                for appid in appids:
+                    bloom.add(appid)
+                self._bloom = bloom
+                self._data_version = data_version
+            self._synced_at = time.time()
+
+    def __contains__(self, appid):
+        return self.get(appid) is not None
+
+    # Entry for appid: {"appid", "reason", "failed_at", "expires_at"} or None
+    def get(self, appid):
+        try:
+            appid = int(appid)
+        except (TypeError, ValueError):
+            return None
+        self._sync()
+        if appid not in self._bloom:
+            return None
+        row = self._connection().execute(
+            "SELECT reason, failed_at, expires_at FROM bad_appids WHERE appid = ? AND expires_at > ?",
+            (appid, time.time()),
+        ).fetchone()
+        if row is None:
+            return None
+        return {"appid": appid, "reason": row[0], "failed_at": row[1], "expires_at": row[2]}
+
+    # Record a failure, ttl defaults to the reason's TTL
+    def add(self, appid, reason, ttl=None):
+        now = time.time()
+        ttl = ttl if ttl is not None else REASON_TTL.get(reason, DEFAULT_TTL)
+        connection = self._connection()
+        with connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO bad_appids (appid, reason, failed_at, expires_at) VALUES (?, ?, ?, ?)",
+                (int(appid), reason, now, now + ttl),
+            )
+            connection.execute("DELETE FROM bad_appids WHERE expires_at <= ?", (now,))
+        self._sync(force=True)
+
+    def remove(self, appid):
+        connection = self._connection()
+        with connection:
+            connection.execute("DELETE FROM bad_appids WHERE appid = ?", (int(appid),))
+        self._sync(force=True)
+
+
+BAD_APPIDS = NegativeCache()
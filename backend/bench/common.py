@@ -0,0 +1,96 @@
+import json
+import os
+import tempfile
+
+# Benchmarks never touch data/ or real services: negative cache and warm snapshots go to a temp dir
+_TMP = tempfile.mkdtemp(prefix="gamestats-bench-")
+os.environ.setdefault("BAD_APPIDS_DB_PATH", os.path.join(_TMP, "bad_appids.sqlite3"))
+os.environ.setdefault("WARM_SNAPSHOT_DIR", os.path.join(_TMP, "warm_snapshot"))
+os.environ.setdefault("CACHE_MODE", "single")
+
+
+# Point every Steam / SteamCharts URL used by ingestion and app at base_url (a SteamStub)
+def use_steam_stub(base_url):
+    import ingestion
+
+    ingestion.STEAMCHARTS_URL = base_url
+    ingestion.STEAM_STORE_URL = base_url
+    ingestion.STEAM_API_URL = base_url
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(q / 100 * (len(sorted_values) - 1)))))
+    return sorted_values[index]
+
+
+# Latency summary in milliseconds for a list of durations in seconds
+def summarize(durations, elapsed=None):
+    values = sorted(durations)
+    summary = {
+        "count": len(values),
+        "mean_ms": round(sum(values) / len(values) * 1000, 3) if values else 0.0,
+        "p50_ms": round(percentile(values, 50) * 1000, 3),
+        "p90_ms": round(percentile(values, 90) * 1000, 3),
+        "p99_ms": round(percentile(values, 99) * 1000, 3),
+        "max_ms": round(values[-1] * 1000, 3) if values else 0.0,
+    }
+    if elapsed:
+        summary["per_s"] = round(len(values) / elapsed, 1)
+    return summary
+
+
+def print_table(results, columns=("count", "per_s", "mean_ms", "p50_ms", "p99_ms", "max_ms")):
+    width = max(len(name) for name in results) + 2
+    print("name".ljust(width) + "".join(column.rjust(11) for column in columns))
+    for name, summary in results.items():
+        print(name.ljust(width) + "".join(str(summary.get(column, "")).rjust(11) for column in columns))
+
+
+def save_results(path, results):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+
+# Compare results with a saved baseline
+# A benchmark regresses when p50 / p99 grow or throughput drops by more than tolerance (0.2 = 20%)
+# Output: list of regression messages (empty if none)
+def compare_with_baseline(results, baseline_path, tolerance):
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+
+    regressions = []
+    for name, summary in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        for metric in ("p50_ms", "p99_ms"):
+            if base.get(metric) and summary[metric] > base[metric] * (1 + tolerance):
+                regressions.append(f"{name}: {metric} {base[metric]} -> {summary[metric]}")
+        if base.get("per_s") and summary.get("per_s") is not None and summary["per_s"] < base["per_s"] * (1 - tolerance):
+            regressions.append(f"{name}: per_s {base['per_s']} -> {summary['per_s']}")
+    return regressions
+
+
+# Shared CLI options: --save, --baseline, --tolerance
+def add_baseline_arguments(parser):
+    parser.add_argument("--save", help="write results as JSON (use as a later --baseline)")
+    parser.add_argument("--baseline", help="fail (exit 1) if results regress against this JSON")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed regression, default 0.2 (20%%)")
+
+
+# Save / compare according to the parsed CLI options, returns the process exit code
+def finish(args, results):
+    if args.save:
+        save_results(args.save, results)
+        print(f"Results saved to {args.save}")
+    if args.baseline:
+        regressions = compare_with_baseline(results, args.baseline, args.tolerance)
+        if regressions:
+            print("Regressions against baseline:")
+            for message in regressions:
+                print(f"  {message}")
+            return 1
+        print(f"No regressions against {args.baseline} (tolerance {args.tolerance:.0%}).")
+    return 0
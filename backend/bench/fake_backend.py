@@ -0,0 +1,134 @@
+import time
+
+import storage
+
+# Facade functions of storage.py replaced by install()
+STORAGE_FUNCTIONS = [
+    "get_all_metadata", "get_all_metadata_table", "get_metadata_by_appid", "get_metadata_by_appids",
+    "add_metadata", "backfill_metadata", "get_history_playercount_by_appid", "get_history_playercount_by_appids",
+    "get_current_history_playercount_sorted", "get_last_history_timestamps", "try_acquire_lock", "release_lock",
+    "start_update_run", "get_open_update_run", "get_last_committed_update_run_id", "get_update_run", "get_update_run_apps",
+    "get_finished_update_shards", "stage_update_rows", "checkpoint_update_shard", "commit_update_run",
+]
+
+
+# In-process stand-in for bigquery_calling / sqlite_calling backed by a bench Dataset
+# latency - seconds added to every call (a BigQuery query round trip is typically 0.5-2s)
+class FakeBackend:
+    def __init__(self, dataset, latency=0.0):
+        self.dataset = dataset
+        self.latency = latency
+        self.calls = {}
+        # Update runs in memory: run_id -> run, run_id -> finished shards
+        self.runs = {}
+        self.finished_shards = {}
+
+    def _call(self, name):
+        self.calls[name] = self.calls.get(name, 0) + 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    # Replace the storage facade functions, must run before app is imported
+    def install(self, module=storage):
+        for name in STORAGE_FUNCTIONS:
+            setattr(module, name, getattr(self, name))
+        return self
+
+    def get_all_metadata(self):
+        self._call("get_all_metadata")
+        return [dict(row) for row in self.dataset.metadata]
+
+    def get_all_metadata_table(self):
+        self._call("get_all_metadata_table")
+        return self.dataset.raw_metadata_table()
+
+    def get_metadata_by_appid(self, appid):
+        self._call("get_metadata_by_appid")
+        row = self.dataset.by_appid.get(int(appid))
+        return dict(row) if row is not None else None
+
+    def get_metadata_by_appids(self, appids):
+        self._call("get_metadata_by_appids")
+        return {int(a): dict(self.dataset.by_appid[int(a)]) for a in appids if int(a) in self.dataset.by_appid}
+
+    def add_metadata(self, data):
+        self._call("add_metadata")
+        return data
+
+    def backfill_metadata(self, appids):
+        self._call("backfill_metadata")
+        return {
+            int(a): {"status": "ok", "data": dict(self.dataset.by_appid[int(a)])}
+            if int(a) in self.dataset.by_appid else {"status": "failed", "reason": "not_found"}
+            for a in appids
+        }
+
+    def get_history_playercount_by_appid(self, appid):
+        self._call("get_history_playercount_by_appid")
+        row = self.dataset.history_row(int(appid))
+        return [row] if row is not None else []
+
+    def get_history_playercount_by_appids(self, appids):
+        self._call("get_history_playercount_by_appids")
+        rows = {int(a): self.dataset.history_row(int(a)) for a in appids}
+        return {appid: row for appid, row in rows.items() if row is not None}
+
+    def get_current_history_playercount_sorted(self):
+        self._call("get_current_history_playercount_sorted")
+        return [dict(game) for game in self.dataset.ranking]
+
+    def get_last_history_timestamps(self):
+        self._call("get_last_history_timestamps")
+        return {}
+
+    def try_acquire_lock(self):
+        return True
+
+    def release_lock(self):
+        pass
+
+    # Update runs only record shard checkpoints, staged rows are dropped
+    def start_update_run(self, full_rebuild, shards):
+        self._call("start_update_run")
+        run_id = f"run-{len(self.runs) + 1}"
+        self.runs[run_id] = {"run_id": run_id, "shards": shards, "full_rebuild": full_rebuild, "committed": False}
+        self.finished_shards[run_id] = set()
+        return dict(self.runs[run_id])
+
+    def get_open_update_run(self):
+        self._call("get_open_update_run")
+        runs = [run for run in self.runs.values() if not run["committed"]]
+        return dict(runs[-1]) if runs else None
+
+    def get_last_committed_update_run_id(self):
+        self._call("get_last_committed_update_run_id")
+        runs = [run["run_id"] for run in self.runs.values() if run["committed"]]
+        return runs[-1] if runs else None
+
+    def get_update_run(self, run_id):
+        self._call("get_update_run")
+        run = self.runs.get(run_id)
+        return dict(run) if run is not None else None
+
+    def get_update_run_apps(self, run_id, shards, shard):
+        self._call("get_update_run_apps")
+        return [{"appid": a, "name": self.dataset.by_appid[a]["name"]} for a in self.dataset.appids if a % shards == shard]
+
+    def get_finished_update_shards(self, run_id):
+        self._call("get_finished_update_shards")
+        return set(self.finished_shards.get(run_id, ()))
+
+    def stage_update_rows(self, run_id, shard, attempt, rows):
+        self._call("stage_update_rows")
+
+    def checkpoint_update_shard(self, run_id, shard, attempt, row_count):
+        self._call("checkpoint_update_shard")
+        self.finished_shards[run_id].add(shard)
+
+    def commit_update_run(self, run):
+        self._call("commit_update_run")
+        stored = self.runs[run["run_id"]]
+        if stored["committed"]:
+            return False
+        stored["committed"] = True
+        return True
@@ -0,0 +1,118 @@
+import random
+import time
+
+import pyarrow as pa
+
+from metadata_store import METADATA_SCHEMA, to_metadata_table
+
+# Production-like scale
+APPS = 125_000
+RANKED = 7_000
+HISTORY_DAYS = 3 * 365
+
+WORDS = [
+    "Dark", "Souls", "Counter", "Strike", "Legends", "Empire", "Galaxy", "Farm", "Simulator", "Tactics",
+    "Dungeon", "Hero", "Quest", "Racing", "Zombie", "Survival", "Craft", "Island", "Space", "Station",
+    "Kingdom", "War", "Shadow", "Night", "City", "Builder", "Puzzle", "Adventure", "Pixel", "Dragon",
+    "Knight", "Rogue", "Cyber", "Punk", "Ocean", "Planet", "Arena", "Battle", "Royale", "Legacy",
+    "Horizon", "Frontier", "Colony", "Tycoon", "Story", "Chronicles", "Odyssey", "Forge", "Storm", "Echo",
+]
+SUFFIXES = ["", "", "", " II", " III", " 2", " Remastered", " Online", " Deluxe Edition", ": Origins"]
+GENRES = ["Action", "Indie", "Adventure", "Casual", "RPG", "Strategy", "Simulation", "Sports", "Racing",
+          "Free to Play", "Massively Multiplayer", "Early Access"]
+CATEGORIES = ["Single-player", "Multi-player", "Steam Achievements", "Full controller support",
+              "Steam Cloud", "Co-op", "Online PvP", "Steam Trading Cards"]
+PLATFORMS = ["windows", "mac", "linux"]
+MONTHS = ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
+
+
+# Deterministic synthetic dataset: metadata, ranking and player count histories
+# Histories are generated on demand from the appid, so a 125k-app dataset stays cheap to hold
+class Dataset:
+    def __init__(self, apps=APPS, ranked=RANKED, history_days=HISTORY_DAYS, seed=1):
+        rng = random.Random(seed)
+        self.history_days = history_days
+        self.now_ms = int(time.time() // 86400 * 86400 * 1000)
+
+        self.appids = sorted(rng.sample(range(10, 3_500_000), apps))
+        developers = [f"{rng.choice(WORDS)} {rng.choice(['Games', 'Studios', 'Interactive', 'Soft'])}"
+                      for _ in range(apps // 8)]
+        publishers = developers[:apps // 40]
+
+        self.metadata = []
+        for appid in self.appids:
+            name = f"{rng.choice(WORDS)} {rng.choice(WORDS)}{rng.choice(SUFFIXES)}"
+            genres = rng.sample(GENRES, rng.randint(0, 3))
+            self.metadata.append({
+                "appid": appid,
+                "name": name,
+                "header_image": f"https://cdn.example.com/steam/apps/{appid}/header.jpg",
+                "short_description": f"{name} is a game about {rng.choice(WORDS).lower()} and {rng.choice(WORDS).lower()}.",
+                "developers": rng.choice(developers),
+                "publishers": rng.choice(publishers),
+                "release_date": f"{rng.randint(1, 28)} {rng.choice(MONTHS)}, {rng.randint(2004, 2025)}",
+                "platforms": ", ".join(["windows"] + [p for p in PLATFORMS[1:] if rng.random() < 0.3]),
+                "price": f"{rng.choice([0, 4.99, 9.99, 19.99, 29.99, 59.99])}€",
+                "categories": ", ".join(rng.sample(CATEGORIES, rng.randint(1, 4))),
+                "genres": ", ".join(genres) if genres else None,
+                "website": None,
+                "screenshots": ", ".join(f"https://cdn.example.com/ss/{appid}/{i}.jpg" for i in range(4)),
+                "background": f"https://cdn.example.com/bg/{appid}.jpg",
+            })
+        self.by_appid = {row["appid"]: row for row in self.metadata}
+
+        # Player counts follow a long tail: a few huge games, thousands of small ones
+        ranked_appids = rng.sample(self.appids, min(ranked, apps))
+        self.ranking = [
+            {"appid": appid, "name": self.by_appid[appid]["name"], "concurrent_in_game": int(900_000 / (rank ** 0.9))}
+            for rank, appid in enumerate(ranked_appids, start=1)
+        ]
+        self.players = {game["appid"]: game["concurrent_in_game"] for game in self.ranking}
+
+    def metadata_table(self):
+        return to_metadata_table(self.metadata)
+
+    # Metadata as BigQuery returns it (plain string columns, unsorted)
+    def raw_metadata_table(self):
+        return pa.Table.from_pylist(self.metadata, schema=METADATA_SCHEMA)
+
+    # Daily [[ts, count], ...] for the last history_days days, ending at the current ranking count
+    def chart_data(self, appid):
+        rng = random.Random(appid)
+        latest = self.players.get(appid) or rng.randint(1, 5_000)
+        points = []
+        for day in range(self.history_days - 1):
+            ts = self.now_ms - (self.history_days - 1 - day) * 86_400_000
+            points.append([ts, int(latest * (0.6 + 0.8 * rng.random()))])
+        points.append([self.now_ms, latest])
+        return points
+
+    # History row as stored in the history_playercount table
+    def history_row(self, appid):
+        if appid not in self.by_appid:
+            return None
+        data = self.chart_data(appid)
+        return {
+            "appid": appid,
+            "name": self.by_appid[appid]["name"],
+            "date_playerscount": ", ".join(f"{ts} {count}" for ts, count in data),
+        }
+
+    # Steam store appdetails "data" object
+    def store_appdetails(self, appid):
+        row = self.by_appid[appid]
+        return {
+            "name": row["name"],
+            "header_image": row["header_image"],
+            "short_description": row["short_description"],
+            "developers": [row["developers"]],
+            "publishers": [row["publishers"]],
+            "release_date": {"date": row["release_date"]},
+            "platforms": {platform: platform in row["platforms"] for platform in PLATFORMS},
+            "price_overview": {"final_formatted": row["price"]},
+            "categories": [{"description": c} for c in row["categories"].split(", ")],
+            "genres": [{"description": g} for g in (row["genres"] or "").split(", ") if g],
+            "website": row["website"],
+            "screenshots": [{"path_full": s} for s in row["screenshots"].split(", ")],
+            "background": row["background"],
+        }
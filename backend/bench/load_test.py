@@ -0,0 +1,137 @@
+import argparse
+import logging
+import random
+import sys
+import threading
+import time
+
+import requests
+
+from bench import common
+from bench.fixtures import Dataset, APPS, RANKED, HISTORY_DAYS
+
+SEARCH_QUERIES = ["counter", "dark souls", "dra", "galaxy farm", "kingdm war", "zombie", "pixel dungeon", "tycoon"]
+
+
+# Weighted request mix: name -> (weight, path generator)
+def request_mix(dataset, rng):
+    ranked = [game["appid"] for game in dataset.ranking]
+    pages = max(1, len(ranked) // 50)
+    return {
+        "top.page": (20, lambda: f"/api/topcurrentgames?page={rng.randint(1, pages)}&per_page=50"),
+        "top.all": (2, lambda: "/api/topcurrentgames"),
+        "game": (25, lambda: f"/api/steam/game/{rng.choice(dataset.appids)}"),
+        "game.unknown": (2, lambda: f"/api/steam/game/{rng.randint(4_000_000, 9_000_000)}"),
+        "playercount": (15, lambda: f"/api/steam/playercount/{rng.choice(ranked)}?points=500"),
+        "search": (15, lambda: f"/api/steam/search/{rng.choice(SEARCH_QUERIES)}?limit=20"),
+        "games.multi": (5, lambda: "/api/steam/games?appids=" + ",".join(str(a) for a in rng.sample(dataset.appids, 20))),
+        "aggregates": (5, lambda: "/api/steam/aggregates?top=20"),
+        "trending": (3, lambda: f"/api/trending?window={rng.choice(['24h', '7d', '30d'])}&limit=50"),
+        "game.stats": (5, lambda: f"/api/steam/game/{rng.choice(ranked)}/stats"),
+        "allmetadata.page": (3, lambda: f"/api/steam/allmetadata?fields=appid,name,genres&limit=1000"
+                                        f"&cursor={rng.choice(dataset.appids)}"),
+    }
+
+
+# Serve the app with the fake backend and the Steam stub in this process
+# Output: base URL
+def start_local_server(dataset, args):
+    from bench.fake_backend import FakeBackend
+    from bench.steam_stub import SteamStub
+
+    stub = SteamStub(dataset, args.stub_latency, args.stub_latency, args.stub_error_rate)
+    common.use_steam_stub(stub.start())
+    FakeBackend(dataset, args.backend_latency).install()
+
+    from werkzeug.serving import make_server
+    import app as appmod
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+
+    server = make_server("127.0.0.1", 0, appmod.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}"
+
+
+# Run the mix with `concurrency` client threads for `duration` seconds
+# Output: {name: summary} plus "total"
+def run_load(base_url, mix, concurrency, duration, seed):
+    names = list(mix)
+    weights = [mix[name][0] for name in names]
+    durations = {name: [] for name in names}
+    errors = {name: 0 for name in names}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker(worker_id):
+        rng = random.Random(seed + worker_id)
+        session = requests.Session()
+        while time.perf_counter() < deadline:
+            name = rng.choices(names, weights)[0]
+            path = mix[name][1]()
+            started = time.perf_counter()
+            try:
+                ok = session.get(base_url + path, timeout=60).status_code < 500
+            except requests.RequestException:
+                ok = False
+            elapsed = time.perf_counter() - started
+            with lock:
+                durations[name].append(elapsed)
+                if not ok:
+                    errors[name] += 1
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    results = {}
+    for name in names:
+        if durations[name]:
+            results[name] = dict(common.summarize(durations[name], elapsed), errors=errors[name])
+    results["total"] = dict(
+        common.summarize([d for values in durations.values() for d in values], elapsed),
+        errors=sum(errors.values()),
+    )
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Endpoint load test: throughput and p50/p99 latency per endpoint")
+    parser.add_argument("--url", help="test a running server instead of an in-process one with fake backends "
+                                      "(the server should use the same --apps/--seed dataset)")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=20, help="seconds")
+    parser.add_argument("--warmup", type=float, default=3, help="seconds of traffic before measuring")
+    parser.add_argument("--only", help="comma separated endpoint names, e.g. game,search")
+    parser.add_argument("--apps", type=int, default=APPS)
+    parser.add_argument("--ranked", type=int, default=RANKED)
+    parser.add_argument("--history-days", type=int, default=HISTORY_DAYS)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--backend-latency", type=float, default=0.0, help="seconds added per storage call")
+    parser.add_argument("--stub-latency", type=float, default=0.05, help="Steam stub base latency / jitter (s)")
+    parser.add_argument("--stub-error-rate", type=float, default=0.0)
+    common.add_baseline_arguments(parser)
+    args = parser.parse_args()
+
+    dataset = Dataset(apps=args.apps, ranked=args.ranked, history_days=args.history_days, seed=args.seed)
+    base_url = args.url or start_local_server(dataset, args)
+
+    # First request waits for the cache snapshot
+    started = time.perf_counter()
+    requests.get(base_url + "/api/topcurrentgames?page=1&per_page=1", timeout=600)
+    print(f"Serving {base_url}, cache ready after {time.perf_counter() - started:.1f}s")
+
+    mix = request_mix(dataset, random.Random(args.seed))
+    if args.only:
+        mix = {name: entry for name, entry in mix.items() if name in args.only.split(",")}
+    if args.warmup:
+        run_load(base_url, mix, args.concurrency, args.warmup, args.seed + 1000)
+
+    print(f"Load: {args.concurrency} clients for {args.duration}s")
+    results = run_load(base_url, mix, args.concurrency, args.duration, args.seed)
+    common.print_table(results, ("count", "errors", "per_s", "p50_ms", "p90_ms", "p99_ms", "max_ms"))
+    sys.exit(common.finish(args, results))
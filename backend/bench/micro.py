@@ -0,0 +1,118 @@
+import argparse
+import json
+import random
+import sys
+import time
+
+from bench import common
+from bench.fixtures import Dataset, APPS, RANKED, HISTORY_DAYS
+
+from aggregates import MetadataAggregates
+from analytics import GameAnalytics, compute_analytics
+from metadata_export import MetadataExport, parse_fields
+from metadata_store import MetadataStore, to_metadata_table
+from player_history import PlayerHistory
+from ranking_snapshot import RankingSnapshot
+from search_index import SearchIndex
+
+SEARCH_QUERIES = ["counter strike", "dark", "dra", "galaxy farm simulator", "kingdm war", "zombie surv", "x"]
+
+
+# Run fn repeatedly for at least min_time seconds (at least min_runs times)
+# Output: latency summary of single runs
+def measure(fn, min_time, min_runs=3):
+    durations = []
+    started = time.perf_counter()
+    while len(durations) < min_runs or time.perf_counter() - started < min_time:
+        t = time.perf_counter()
+        fn()
+        durations.append(time.perf_counter() - t)
+    return common.summarize(durations, sum(durations))
+
+
+def run(args):
+    rng = random.Random(args.seed)
+    started = time.perf_counter()
+    dataset = Dataset(apps=args.apps, ranked=args.ranked, history_days=args.history_days, seed=args.seed)
+    print(f"Dataset: {args.apps} apps, {args.ranked} ranked, {args.history_days} days "
+          f"(built in {time.perf_counter() - started:.1f}s)")
+
+    raw_table = dataset.raw_metadata_table()
+    store = MetadataStore(raw_table)
+    table = store.table
+    ranking = [dict(game, rank=rank) for rank, game in enumerate(dataset.ranking, start=1)]
+    players = {game["appid"]: game["concurrent_in_game"] for game in ranking}
+    index = SearchIndex(table, players)
+    top_games = RankingSnapshot(1, ranking, store)
+    export = MetadataExport(table)
+    aggregates = MetadataAggregates(table)
+    histories = [PlayerHistory.from_row(dataset.history_row(game["appid"])) for game in ranking]
+    ranks = [game["rank"] for game in ranking]
+    previous_ranks = {game["appid"]: len(ranking) - game["rank"] + 1 for game in ranking}
+    analytics_table = compute_analytics(histories, ranks, previous_ranks)
+    analytics = GameAnalytics(analytics_table, {game["appid"]: game for game in top_games.games})
+    persisted = {**index.to_tables(), **top_games.to_tables(), **aggregates.to_tables()}
+    history_row = dataset.history_row(dataset.ranking[0]["appid"])
+    history = PlayerHistory.from_row(history_row)
+    random_appids = [rng.choice(dataset.appids) for _ in range(10_000)]
+    years = iter(range(10**9))
+    fields = parse_fields("appid,name,developers,publishers,release_date,platforms,categories,genres")
+
+    def stream_all(fields=None):
+        for _ in export.stream(0, len(export), fields):
+            pass
+
+    benchmarks = {
+        # Refresh path (per cache generation)
+        "refresh.metadata_table": lambda: to_metadata_table(raw_table),
+        "refresh.search_index": lambda: SearchIndex(table, players),
+        "refresh.ranking_join": lambda: RankingSnapshot(1, ranking, store),
+        "refresh.aggregates": lambda: MetadataAggregates(table),
+        "refresh.analytics": lambda: compute_analytics(histories, ranks, previous_ranks),
+        "refresh.analytics_encode": lambda: GameAnalytics(analytics_table, {}),
+        # Warm start from the index tables persisted with a published snapshot
+        "attach.search_index": lambda: SearchIndex.from_tables(table, persisted),
+        "attach.ranking": lambda: RankingSnapshot.from_tables(1, persisted),
+        "attach.aggregates": lambda: MetadataAggregates.from_tables(table, persisted),
+        # Request path
+        "lookup.get": lambda: store.get(rng.choice(random_appids)),
+        "lookup.get_many_100": lambda: store.get_many(rng.sample(random_appids, 100)),
+        "lookup.metadata_json": lambda: json.dumps(store.get(rng.choice(random_appids))),
+        "search.mixed": lambda: index.search(rng.choice(SEARCH_QUERIES), 20),
+        "ranking.page_50": lambda: top_games.encode_page(rng.randrange(0, len(top_games) - 50), 50),
+        "ranking.all": lambda: top_games.encode_slice(),
+        "export.all_fields": stream_all,
+        "export.analysis_fields": lambda: stream_all(fields),
+        "aggregates.unfiltered": lambda: aggregates.top(),
+        "trending.7d_50": lambda: analytics.encode_trending("7d", "percent", 50, 100),
+        # New year values defeat the memo, so the filtered count itself is measured
+        "aggregates.filtered_uncached": lambda: aggregates.top(20, None, "Action", None, 2000 + next(years) % 10**6),
+        "history.parse": lambda: PlayerHistory.from_row(history_row),
+        "history.downsample_500": lambda: history.downsample(500),
+        "history.to_row": lambda: history.to_row(),
+    }
+
+    results = {}
+    for name, fn in benchmarks.items():
+        if args.only and not any(part in name for part in args.only.split(",")):
+            continue
+        results[name] = measure(fn, args.min_time)
+        print(f"  {name}: p50 {results[name]['p50_ms']} ms", flush=True)
+
+    print()
+    common.print_table(results)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Micro-benchmarks for search, lookup, ranking join and serialization")
+    parser.add_argument("--apps", type=int, default=APPS)
+    parser.add_argument("--ranked", type=int, default=RANKED)
+    parser.add_argument("--history-days", type=int, default=HISTORY_DAYS)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--min-time", type=float, default=1.0, help="seconds per benchmark")
+    parser.add_argument("--only", help="comma separated name filters, e.g. search,lookup")
+    common.add_baseline_arguments(parser)
+    args = parser.parse_args()
+
+    sys.exit(common.finish(args, run(args)))
@@ -0,0 +1,107 @@
+import argparse
+import asyncio
+import random
+import threading
+
+from aiohttp import web
+
+from bench.fixtures import Dataset
+
+
+# Local stand-in for store.steampowered.com, steamcharts.com and api.steampowered.com
+# latency - base response delay (s), jitter - extra uniform random delay (s)
+# error_rate - share of responses answered with error_status (429 / 5xx exercise the retry path)
+class SteamStub:
+    def __init__(self, dataset, latency=0.0, jitter=0.0, error_rate=0.0, error_status=503, seed=1):
+        self.dataset = dataset
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.requests = 0
+        self.errors = 0
+        self._rng = random.Random(seed)
+        self._runner = None
+        self._loop = None
+
+    async def _delay_or_error(self):
+        self.requests += 1
+        delay = self.latency + (self._rng.uniform(0, self.jitter) if self.jitter else 0)
+        if delay:
+            await asyncio.sleep(delay)
+        if self.error_rate and self._rng.random() < self.error_rate:
+            self.errors += 1
+            return web.Response(status=self.error_status, text="stub error")
+        return None
+
+    async def appdetails(self, request):
+        error = await self._delay_or_error()
+        if error is not None:
+            return error
+        appid = request.query.get("appids", "")
+        if appid.isdigit() and int(appid) in self.dataset.by_appid:
+            return web.json_response({appid: {"success": True, "data": self.dataset.store_appdetails(int(appid))}})
+        return web.json_response({appid: {"success": False}})
+
+    async def chart_data(self, request):
+        error = await self._delay_or_error()
+        if error is not None:
+            return error
+        appid = request.match_info["appid"]
+        if not appid.isdigit() or int(appid) not in self.dataset.by_appid:
+            return web.json_response([], status=404)
+        return web.json_response(self.dataset.chart_data(int(appid)))
+
+    async def top_games(self, request):
+        error = await self._delay_or_error()
+        if error is not None:
+            return error
+        ranks = [{"rank": i, "appid": game["appid"]} for i, game in enumerate(self.dataset.ranking[:100], start=1)]
+        return web.json_response({"response": {"ranks": ranks}})
+
+    def make_app(self):
+        app = web.Application()
+        app.router.add_get("/api/appdetails", self.appdetails)
+        app.router.add_get("/app/{appid}/chart-data.json", self.chart_data)
+        app.router.add_get("/ISteamChartsService/GetGamesByConcurrentPlayers/v1/", self.top_games)
+        return app
+
+    # Serve on a background thread, returns the base URL
+    def start(self, host="127.0.0.1", port=0):
+        started = threading.Event()
+        result = {}
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self._loop)
+            self._runner = web.AppRunner(self.make_app())
+            self._loop.run_until_complete(self._runner.setup())
+            site = web.TCPSite(self._runner, host, port)
+            self._loop.run_until_complete(site.start())
+            result["port"] = site._server.sockets[0].getsockname()[1]
+            started.set()
+            self._loop.run_forever()
+
+        threading.Thread(target=run, daemon=True).start()
+        started.wait()
+        return f"http://{host}:{result['port']}"
+
+    def stop(self):
+        if self._loop is not None:
+            asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+            self._loop.call_soon_threadsafe(self._loop.stop)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Steam store / SteamCharts stub server")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--apps", type=int, default=125_000)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--jitter", type=float, default=0.05)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=503)
+    args = parser.parse_args()
+
+    stub = SteamStub(Dataset(apps=args.apps), args.latency, args.jitter, args.error_rate, args.error_status)
+    print(f"Steam stub on http://127.0.0.1:{args.port}, set STEAM_STORE_URL / STEAMCHARTS_URL / STEAM_API_URL to it")
+    web.run_app(stub.make_app(), host="127.0.0.1", port=args.port)
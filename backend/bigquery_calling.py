@@ -1,11 +1,16 @@
+from datetime import datetime, timezone
 from dotenv import load_dotenv
-from google.cloud import bigquery, tasks_v2, bigquery_storage_v1
-from concurrent.futures import ThreadPoolExecutor
-import requests
-import pandas as pd
+from google.api_core.exceptions import NotFound
+from google.cloud import bigquery
+import json
 import os
+import sys
+import threading
+import time
+import uuid
 
-import app
+import ingestion
+import metrics
 
 
 # Environment Variables
@@ -14,75 +19,162 @@ PROJECT_ID = os.getenv("PROJECT_ID", "gamestats-462112")
 HISTORY_TABLE = PROJECT_ID + ".GameStats.history_playercount"
 LOCK_TABLE = PROJECT_ID + ".GameStats.update_lock"
 METADATA_TABLE = PROJECT_ID + ".GameStats.steam_metadata"
+# Materialized from the history table by ingestion (see BQ_migrate_history_tables)
+# - latest point per app, read by the ranking instead of parsing every history string
+HISTORY_LATEST_TABLE = PROJECT_ID + ".GameStats.history_latest"
+# - one row per point, partitioned by month and clustered by appid, read by per-game queries
+#   (only maintained with HISTORY_POINTS=true)
+HISTORY_POINTS_TABLE = PROJECT_ID + ".GameStats.history_points"
+# Ranking size
+RANKING_LIMIT = 7000
+# Sharded update runs (see update_job.py)
+UPDATE_RUNS_TABLE = PROJECT_ID + ".GameStats.update_runs"
+UPDATE_RUN_APPS_TABLE = PROJECT_ID + ".GameStats.update_run_apps"
+UPDATE_SHARDS_TABLE = PROJECT_ID + ".GameStats.update_shards"
+HISTORY_STAGING_TABLE = PROJECT_ID + ".GameStats.history_playercount_staging"
 REGION = "us-central1"
 GOOGLE_APPLICATION_CREDENTIALS = os.getenv("GOOGLE_APPLICATION_CREDENTIALS", "")
 TASK_ENDPOINT = os.getenv("TASK_ENDPOINT", "/update-task")
 CLOUD_RUN_URL = os.getenv("CLOUD_RUN_URL", "https://your-cloud-run-url.com")
 QUEUE_NAME = "update-queue"
 
-client_bq = bigquery.Client()
-client_storage = bigquery_storage_v1.BigQueryReadClient()
-client_tasks = tasks_v2.CloudTasksClient()
+# Google clients are created on first use, not at import (keeps instance start fast)
+_clients = {}
+_clients_lock = threading.Lock()
+
+def _get_client(name, create):
+    client = _clients.get(name)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(name)
+            if client is None:
+                client = create()
+                _clients[name] = client
+    return client
+
+def bq_client():
+    return _get_client("bigquery", bigquery.Client)
+
+def storage_client():
+    from google.cloud import bigquery_storage_v1
+    return _get_client("bigquery_storage", bigquery_storage_v1.BigQueryReadClient)
+
+def tasks_client():
+    from google.cloud import tasks_v2
+    return _get_client("tasks", tasks_v2.CloudTasksClient)
+
+
+# Records count, duration, bytes processed and rows of one BigQuery job
+def _record_job(job_name, started, job=None, rows=None, error=False):
+    metrics.bigquery_jobs.inc(job_name, "error" if error else "ok")
+    metrics.bigquery_job_duration.observe(time.perf_counter() - started, job_name)
+    bytes_processed = getattr(job, "total_bytes_processed", None)
+    if isinstance(bytes_processed, int):
+        metrics.bigquery_bytes_processed.inc(job_name, amount=bytes_processed)
+    if isinstance(rows, int):
+        metrics.bigquery_rows.inc(job_name, amount=rows)
+
+# Runs a query and downloads its result
+# Output: pyarrow.Table
+def query_arrow(job_name, query, job_config=None):
+    started = time.perf_counter()
+    job = None
+    try:
+        job = bq_client().query(query, job_config=job_config)
+        table = job.to_arrow(bqstorage_client=storage_client())
+    except Exception:
+        _record_job(job_name, started, job, error=True)
+        raise
+    _record_job(job_name, started, job, table.num_rows)
+    return table
+
+# Submits a job (DML query / load) with submit() and waits for it
+# Output: finished job
+def run_job(job_name, submit):
+    started = time.perf_counter()
+    job = None
+    try:
+        job = submit()
+        job.result()
+    except Exception:
+        _record_job(job_name, started, job, error=True)
+        raise
+    rows = getattr(job, "num_dml_affected_rows", None)
+    if not isinstance(rows, int):
+        rows = getattr(job, "output_rows", None)
+    _record_job(job_name, started, job, rows)
+    return job
+
+
+# MATERIALIZED HISTORY TABLES
+
+# Latest point of every history row in `source` (table reference, e.g. the history table or run deltas)
+def _latest_select(source):
+    return f"""
+        SELECT
+            appid,
+            name,
+            SAFE_CAST(SPLIT(last_point, ' ')[SAFE_OFFSET(0)] AS INT64) AS latest_ts,
+            SAFE_CAST(SPLIT(last_point, ' ')[SAFE_OFFSET(1)] AS INT64) AS latest_players
+        FROM (
+            SELECT appid, name, ARRAY_REVERSE(SPLIT(date_playerscount, ', '))[SAFE_OFFSET(0)] AS last_point
+            FROM {source}
+        )
+        WHERE SAFE_CAST(SPLIT(last_point, ' ')[SAFE_OFFSET(0)] AS INT64) IS NOT NULL
+    """
+
+# Every point of the history rows in `source` as (appid, ts, players)
+def _points_select(source):
+    return f"""
+        SELECT
+            appid,
+            TIMESTAMP_MILLIS(SAFE_CAST(SPLIT(point, ' ')[SAFE_OFFSET(0)] AS INT64)) AS ts,
+            SAFE_CAST(SPLIT(point, ' ')[SAFE_OFFSET(1)] AS INT64) AS players
+        FROM {source}, UNNEST(SPLIT(date_playerscount, ', ')) AS point
+        WHERE SAFE_CAST(SPLIT(point, ' ')[SAFE_OFFSET(0)] AS INT64) IS NOT NULL
+    """
+
+# Migration from the string-only schema, also run after a full rebuild
+# (Re)creates the latest table (and the points table with HISTORY_POINTS) from the history table,
+#  this is the only step scanning every history string
+def BQ_migrate_history_tables():
+    query = f"""
+        CREATE OR REPLACE TABLE `{HISTORY_LATEST_TABLE}`
+        CLUSTER BY appid
+        AS {_latest_select(f"`{HISTORY_TABLE}`")};
+    """
+    if ingestion.HISTORY_POINTS:
+        query += f"""
+            CREATE OR REPLACE TABLE `{HISTORY_POINTS_TABLE}`
+            PARTITION BY TIMESTAMP_TRUNC(ts, MONTH)
+            CLUSTER BY appid
+            AS {_points_select(f"`{HISTORY_TABLE}`")};
+        """
+    run_job("history_migrate", lambda: bq_client().query(query))
+    print(f"History tables rebuilt from {HISTORY_TABLE}.")
 
 
 # UPDATING TABLES
 
-# Fetches new player count history for games not in the metadata table
-def BQ_fetch_new_history_playercount():
+# Fetches last ingested timestamp for every appid from the latest table
+# (the legacy full scan of the history strings is used until BQ_migrate_history_tables has run)
+# Output: {appid: last timestamp (ms)}
+def BQ_get_last_history_timestamps():
     query = f"""
-        SELECT appid, name
-        FROM `{METADATA_TABLE}`
+        SELECT appid, latest_ts AS last_ts
+        FROM `{HISTORY_LATEST_TABLE}`
     """
     try:
-        df = client_bq.query(query).to_arrow(bqstorage_client=client_storage).to_pandas()
-        data_list = df.to_dict('records')
-
-        steam_top_url = "https://api.steampowered.com/ISteamChartsService/GetGamesByConcurrentPlayers/v1/"
-        res = requests.get(steam_top_url)
-        if res.status_code != 200:
-            print(f"Failed to fetch top sellers: {res.status_code}")
-            steam_data = {}
-        else:
-            steam_data = res.json()
-        ranks = steam_data.get("response", {}).get("ranks", [])
-        existing_appids = {str(item["appid"]) for item in data_list}
-        for data in ranks:
-            if str(data["appid"]) not in existing_appids:
-                print(f"Fetching metadata for new appid: {data['appid']}")
-                new_data = app.fetch_game_metadata(str(data["appid"]))
-                data_list.append({"appid": data["appid"], "name": new_data["name"] })
-
-        import time
-        def fetch_chart_data(appid, name, retries=3, delay=1):
-            url = f"https://steamcharts.com/app/{appid}/chart-data.json"
-            for attempt in range(retries):
-                try:
-                    request = requests.get(url, timeout=10)
-                    if request.status_code != 200:
-                        print(f"Failed to fetch data for appid {appid}: {request.status_code}")
-                        return None
-                    data = request.json()
-                    date_playerscount = ", ".join([f"{entry[0]} {entry[1]}" for entry in data])
-                    return {
-                        "appid": appid,
-                        "name": name,
-                        "date_playerscount": date_playerscount
-                    }
-                except Exception as e:
-                    print(f"Error fetching chart data for appid {appid} (attempt {attempt+1}): {e}")
-                    time.sleep(delay)
-            return None
-
-        print(f"Fetching player count history for {len(data_list)} apps...")
-        with ThreadPoolExecutor(max_workers=100) as executor:
-            futures = [executor.submit(fetch_chart_data, row['appid'], row['name']) for row in data_list]
-            data_return = [f.result() for f in futures if f.result() is not None]
-        
-        return data_return
-    
-    except Exception as e:
-        print(f"Error fetching new player count history: {e}")
-        return []
+        rows = query_arrow("last_history_timestamps", query).to_pylist()
+    except NotFound:
+        print(f"{HISTORY_LATEST_TABLE} not found, run `python bigquery_calling.py migrate`.")
+        query = f"""
+            SELECT appid, MAX(SAFE_CAST(SPLIT(point, ' ')[SAFE_OFFSET(0)] AS INT64)) AS last_ts
+            FROM `{HISTORY_TABLE}`, UNNEST(SPLIT(date_playerscount, ', ')) AS point
+            GROUP BY appid
+        """
+        rows = query_arrow("last_history_timestamps_legacy", query).to_pylist()
+    return {row["appid"]: row["last_ts"] for row in rows if row["last_ts"] is not None}
 
 # Tries to acquire a lock for updating player count history
 def try_acquire_lock() -> bool:
@@ -94,8 +186,7 @@ def try_acquire_lock() -> bool:
       AND TIMESTAMP_DIFF(CURRENT_TIMESTAMP(), last_update_time, HOUR) > 12
       AND is_updating = FALSE
     """
-    job = client_bq.query(query)
-    job.result()
+    job = run_job("lock_acquire", lambda: bq_client().query(query))
     return job.num_dml_affected_rows == 1
 
 # Releases the lock after updating player count history
@@ -105,76 +196,389 @@ def release_lock():
     SET last_update_time = CURRENT_TIMESTAMP(), is_updating = FALSE
     WHERE lock_name = "players_update"
     """
-    client_bq.query(query).result()
+    run_job("lock_release", lambda: bq_client().query(query))
 
+# Enqueues a Cloud Task crawling one shard of an update run (POST /update-task/shard)
 # https://cloud.google.com/python/docs/reference/cloudtasks/latest/google.cloud.tasks_v2.types.HttpRequest
+def enqueue_update_shard(run_id, shard):
+    from google.cloud import tasks_v2
+
+    task = {
+        "http_request": {
+            "http_method": tasks_v2.HttpMethod.POST,
+            "url": f"{CLOUD_RUN_URL}{TASK_ENDPOINT}/shard",
+            "headers": {"Content-Type": "application/json"},
+            "body": json.dumps({"run_id": run_id, "shard": shard}).encode(),
+            "oidc_token": {
+                "service_account_email": f"{PROJECT_ID}@appspot.gserviceaccount.com"
+            },
+        }
+    }
+    parent = tasks_client().queue_path(PROJECT_ID, REGION, QUEUE_NAME)
+    return tasks_client().create_task(parent=parent, task=task).name
+
+
+# SHARDED UPDATE RUNS
+
+def _run_params(run_id, *params):
+    return bigquery.QueryJobConfig(
+        query_parameters=[bigquery.ScalarQueryParameter("run_id", "STRING", run_id), *params]
+    )
+
+def _append_rows(job_name, table, rows, schema):
+    run_job(job_name, lambda: bq_client().load_table_from_json(
+        rows,
+        table,
+        job_config=bigquery.LoadJobConfig(schema=schema, write_disposition="WRITE_APPEND"),
+    ))
 
-# Creates a Cloud Task to update player count history
-# def create_cloud_task():
-#     parent = client_tasks.queue_path(PROJECT_ID, REGION, QUEUE_NAME)
-#     task = {
-#         "http_request": {
-#             "http_method": tasks_v2.HttpMethod.POST,
-#             "url": f"{CLOUD_RUN_URL}{TASK_ENDPOINT}",
-#             "headers": {"Content-Type": "application/json"},
-#             "oidc_token": {
-#                 "service_account_email": f"{PROJECT_ID}@appspot.gserviceaccount.com"
-def upload_to_bigquery(all_data):
-    df = pd.DataFrame(all_data)
-    df = df.drop_duplicates(subset=["appid","name","date_playerscount"])
-
-    if df.empty:
-        print("No data to upload to BigQuery. DataFrame is empty.")
-        return
-
-    job = client_bq.load_table_from_dataframe(
-        df,
-        HISTORY_TABLE,
-        job_config=bigquery.LoadJobConfig(write_disposition="WRITE_TRUNCATE"),
+def _create_update_tables():
+    query = f"""
+        CREATE TABLE IF NOT EXISTS `{UPDATE_RUNS_TABLE}` (
+            run_id STRING, shards INT64, full_rebuild BOOL, created_at TIMESTAMP, committed_at TIMESTAMP
+        );
+        CREATE TABLE IF NOT EXISTS `{UPDATE_RUN_APPS_TABLE}` (run_id STRING, appid INT64, name STRING)
+        CLUSTER BY run_id;
+        CREATE TABLE IF NOT EXISTS `{UPDATE_SHARDS_TABLE}` (
+            run_id STRING, shard INT64, attempt STRING, row_count INT64, finished_at TIMESTAMP
+        );
+        CREATE TABLE IF NOT EXISTS `{HISTORY_STAGING_TABLE}` (
+            run_id STRING, shard INT64, attempt STRING, appid INT64, name STRING, date_playerscount STRING
+        )
+        CLUSTER BY run_id;
+    """
+    run_job("update_tables", lambda: bq_client().query(query))
+
+def _run_from_row(row):
+    return {
+        "run_id": row["run_id"],
+        "shards": row["shards"],
+        "full_rebuild": row["full_rebuild"],
+        "committed": row["committed_at"] is not None,
+    }
+
+# Plans a new update run: the apps of the metadata table plus newly ranked apps, stored with the run
+# Output: run {"run_id", "shards", "full_rebuild", "committed"}
+def BQ_start_update_run(full_rebuild, shards):
+    rows = query_arrow("metadata_appids", f"SELECT appid, name FROM `{METADATA_TABLE}`").to_pylist()
+    apps = ingestion.add_new_ranked_apps(rows, BQ_backfill_metadata)
+    run_id = f"{int(time.time())}-{uuid.uuid4().hex[:8]}"
+
+    _create_update_tables()
+    _append_rows("update_run_apps", UPDATE_RUN_APPS_TABLE, [
+        {"run_id": run_id, "appid": int(app["appid"]), "name": app["name"]} for app in apps
+    ], [
+        bigquery.SchemaField("run_id", "STRING"),
+        bigquery.SchemaField("appid", "INT64"),
+        bigquery.SchemaField("name", "STRING"),
+    ])
+    # The run row is written last, so an open run always has its apps
+    _append_rows("update_run", UPDATE_RUNS_TABLE, [{
+        "run_id": run_id,
+        "shards": shards,
+        "full_rebuild": full_rebuild,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "committed_at": None,
+    }], [
+        bigquery.SchemaField("run_id", "STRING"),
+        bigquery.SchemaField("shards", "INT64"),
+        bigquery.SchemaField("full_rebuild", "BOOL"),
+        bigquery.SchemaField("created_at", "TIMESTAMP"),
+        bigquery.SchemaField("committed_at", "TIMESTAMP"),
+    ])
+    print(f"Update run {run_id} planned: {len(apps)} apps in {shards} shards.")
+    return {"run_id": run_id, "shards": shards, "full_rebuild": full_rebuild, "committed": False}
+
+# Output: run or None
+def BQ_get_update_run(run_id):
+    query = f"""
+        SELECT run_id, shards, full_rebuild, committed_at
+        FROM `{UPDATE_RUNS_TABLE}`
+        WHERE run_id = @run_id
+    """
+    rows = query_arrow("update_run", query, _run_params(run_id)).to_pylist()
+    return _run_from_row(rows[0]) if rows else None
+
+# Newest run that was not committed (to resume) or None
+def BQ_get_open_update_run():
+    query = f"""
+        SELECT run_id, shards, full_rebuild, committed_at
+        FROM `{UPDATE_RUNS_TABLE}`
+        WHERE committed_at IS NULL
+        ORDER BY created_at DESC
+        LIMIT 1
+    """
+    try:
+        rows = query_arrow("update_open_run", query).to_pylist()
+    except NotFound:
+        return None
+    return _run_from_row(rows[0]) if rows else None
+
+# run_id of the newest committed run or None, identifies the stored player count histories
+def BQ_get_last_committed_update_run_id():
+    query = f"""
+        SELECT run_id
+        FROM `{UPDATE_RUNS_TABLE}`
+        WHERE committed_at IS NOT NULL
+        ORDER BY committed_at DESC
+        LIMIT 1
+    """
+    try:
+        rows = query_arrow("update_last_committed_run", query).to_pylist()
+    except NotFound:
+        return None
+    return rows[0]["run_id"] if rows else None
+
+# Apps of one shard (appid % shards == shard)
+# Output: [{"appid", "name"}]
+def BQ_get_update_run_apps(run_id, shards, shard):
+    query = f"""
+        SELECT appid, name
+        FROM `{UPDATE_RUN_APPS_TABLE}`
+        WHERE run_id = @run_id AND MOD(appid, @shards) = @shard
+    """
+    job_config = _run_params(
+        run_id,
+        bigquery.ScalarQueryParameter("shards", "INT64", shards),
+        bigquery.ScalarQueryParameter("shard", "INT64", shard),
     )
-    job.result()
+    return query_arrow("update_run_apps", query, job_config).to_pylist()
+
+# Output: set of checkpointed shards
+def BQ_get_finished_update_shards(run_id):
+    query = f"""
+        SELECT DISTINCT shard
+        FROM `{UPDATE_SHARDS_TABLE}`
+        WHERE run_id = @run_id
+    """
+    return {row["shard"] for row in query_arrow("update_shards", query, _run_params(run_id)).to_pylist()}
+
+# Stages a batch of crawled rows of one shard attempt (called while the shard is crawled)
+# Every attempt writes under its own id and the commit only reads the checkpointed attempt,
+#  so a shard retried after a crash is never applied twice
+def BQ_stage_update_rows(run_id, shard, attempt, rows):
+    if rows:
+        _append_rows("history_staging", HISTORY_STAGING_TABLE, [
+            {
+                "run_id": run_id,
+                "shard": shard,
+                "attempt": attempt,
+                "appid": int(row["appid"]),
+                "name": row["name"],
+                "date_playerscount": row["date_playerscount"],
+            }
+            for row in rows
+        ], [
+            bigquery.SchemaField("run_id", "STRING"),
+            bigquery.SchemaField("shard", "INT64"),
+            bigquery.SchemaField("attempt", "STRING"),
+            bigquery.SchemaField("appid", "INT64"),
+            bigquery.SchemaField("name", "STRING"),
+            bigquery.SchemaField("date_playerscount", "STRING"),
+        ])
+
+# Checkpoints a shard once every row of attempt is staged
+def BQ_checkpoint_update_shard(run_id, shard, attempt, row_count):
+    _append_rows("update_shard", UPDATE_SHARDS_TABLE, [{
+        "run_id": run_id,
+        "shard": shard,
+        "attempt": attempt,
+        "row_count": row_count,
+        "finished_at": datetime.now(timezone.utc).isoformat(),
+    }], [
+        bigquery.SchemaField("run_id", "STRING"),
+        bigquery.SchemaField("shard", "INT64"),
+        bigquery.SchemaField("attempt", "STRING"),
+        bigquery.SchemaField("row_count", "INT64"),
+        bigquery.SchemaField("finished_at", "TIMESTAMP"),
+    ])
+
+# Applies the staged rows of a finished run in one transaction and marks it committed
+# full_rebuild=True - staged rows replace the history, the materialized tables are rebuilt from it
+# full_rebuild=False - staged rows are deltas appended to each app's history
+# Output: True if committed by this call, False if the run was already committed
+def BQ_commit_update_run(run):
+    if run["full_rebuild"]:
+        apply = f"""
+            DELETE FROM `{HISTORY_TABLE}` WHERE TRUE;
+            INSERT INTO `{HISTORY_TABLE}` (appid, name, date_playerscount)
+            SELECT appid, name, date_playerscount FROM run_delta;
+
+            DELETE FROM `{HISTORY_LATEST_TABLE}` WHERE TRUE;
+            INSERT INTO `{HISTORY_LATEST_TABLE}` (appid, name, latest_ts, latest_players)
+            {_latest_select(f"`{HISTORY_TABLE}`")};
+        """
+        if ingestion.HISTORY_POINTS:
+            apply += f"""
+                DELETE FROM `{HISTORY_POINTS_TABLE}` WHERE TRUE;
+                INSERT INTO `{HISTORY_POINTS_TABLE}` (appid, ts, players)
+                {_points_select(f"`{HISTORY_TABLE}`")};
+            """
+    else:
+        apply = f"""
+            MERGE `{HISTORY_TABLE}` AS t
+            USING run_delta AS s
+            ON t.appid = s.appid
+            WHEN MATCHED THEN
+                UPDATE SET
+                    name = s.name,
+                    date_playerscount = IF(
+                        t.date_playerscount IS NULL OR t.date_playerscount = '',
+                        s.date_playerscount,
+                        CONCAT(t.date_playerscount, ', ', s.date_playerscount)
+                    )
+            WHEN NOT MATCHED THEN
+                INSERT (appid, name, date_playerscount)
+                VALUES (s.appid, s.name, s.date_playerscount);
+
+            MERGE `{HISTORY_LATEST_TABLE}` AS t
+            USING ({_latest_select("run_delta")}) AS s
+            ON t.appid = s.appid
+            WHEN MATCHED THEN
+                UPDATE SET name = s.name, latest_ts = s.latest_ts, latest_players = s.latest_players
+            WHEN NOT MATCHED THEN
+                INSERT (appid, name, latest_ts, latest_players)
+                VALUES (s.appid, s.name, s.latest_ts, s.latest_players);
+        """
+        if ingestion.HISTORY_POINTS:
+            apply += f"""
+                INSERT INTO `{HISTORY_POINTS_TABLE}` (appid, ts, players)
+                {_points_select("run_delta")};
+            """
+
+    query = f"""
+        DECLARE committed BOOL DEFAULT FALSE;
+
+        -- Rows of the checkpointed (latest) attempt of every shard, one per app
+        CREATE TEMP TABLE run_delta AS
+        SELECT s.appid, ANY_VALUE(s.name) AS name, ANY_VALUE(s.date_playerscount) AS date_playerscount
+        FROM `{HISTORY_STAGING_TABLE}` AS s
+        JOIN (
+            SELECT shard, ARRAY_AGG(attempt ORDER BY finished_at DESC LIMIT 1)[OFFSET(0)] AS attempt
+            FROM `{UPDATE_SHARDS_TABLE}`
+            WHERE run_id = @run_id
+            GROUP BY shard
+        ) AS c ON c.shard = s.shard AND c.attempt = s.attempt
+        WHERE s.run_id = @run_id
+        GROUP BY s.appid;
+
+        BEGIN TRANSACTION;
+
+        UPDATE `{UPDATE_RUNS_TABLE}` SET committed_at = CURRENT_TIMESTAMP()
+        WHERE run_id = @run_id AND committed_at IS NULL;
+
+        IF @@row_count = 1 THEN
+            {apply}
+
+            DELETE FROM `{HISTORY_STAGING_TABLE}` WHERE run_id = @run_id;
+            DELETE FROM `{UPDATE_RUN_APPS_TABLE}` WHERE run_id = @run_id;
+            SET committed = TRUE;
+        END IF;
+
+        COMMIT TRANSACTION;
+
+        SELECT committed;
+    """
+    try:
+        result = query_arrow("update_commit", query, _run_params(run["run_id"]))
+    except NotFound:
+        # First run after deploying: the transaction was rolled back, migrate and commit again
+        print("Materialized history tables not found, migrating.")
+        BQ_migrate_history_tables()
+        result = query_arrow("update_commit", query, _run_params(run["run_id"]))
+
+    committed = result.column("committed")[0].as_py()
+    if committed:
+        print(f"Update run {run['run_id']} committed.")
+    return committed
 
 
 
 
 # HISTORY PLAYERCOUNT CALLING
 
+# History rows of the appids in @appids, from the points table (only the clustered blocks of
+#  those appids are read) or the history table
+def _history_by_appids_query():
+    if not ingestion.HISTORY_POINTS:
+        # At most one row per appid (the LIMIT 1 of the single appid read, duplicates are never returned)
+        return f"""
+            SELECT appid, name, date_playerscount
+            FROM `{HISTORY_TABLE}`
+            WHERE appid IN UNNEST(@appids)
+            QUALIFY ROW_NUMBER() OVER (PARTITION BY appid) = 1
+        """
+    return f"""
+        SELECT
+            p.appid,
+            ANY_VALUE(l.name) AS name,
+            STRING_AGG(CONCAT(CAST(UNIX_MILLIS(p.ts) AS STRING), ' ', CAST(p.players AS STRING)), ', '
+                ORDER BY p.ts) AS date_playerscount
+        FROM `{HISTORY_POINTS_TABLE}` AS p
+        LEFT JOIN `{HISTORY_LATEST_TABLE}` AS l ON l.appid = p.appid
+        WHERE p.appid IN UNNEST(@appids) AND p.players IS NOT NULL
+        GROUP BY p.appid
+    """
+
 # Fetches all player count history
 def BQ_get_history_playercount_by_appid(appid):
-    query = f"""
-        SELECT appid, name, date_playerscount
-        FROM `{HISTORY_TABLE}`
-        WHERE appid = @appid
-        LIMIT 1
-    """
     job_config = bigquery.QueryJobConfig(
         query_parameters=[
-            bigquery.ScalarQueryParameter("appid", "INT64", int(appid))
+            bigquery.ArrayQueryParameter("appids", "INT64", [int(appid)])
         ]
     )
     
     try:
-        df = client_bq.query(query, job_config=job_config).to_arrow(bqstorage_client=client_storage).to_pandas()
-        result = df.to_dict('records')
-        return result
+        return query_arrow("history_by_appid", _history_by_appids_query(), job_config).to_pylist()
 
     except Exception as e:
         print(f"Error fetching player count history for appid {appid}: {e}")
         return None
 
+# Fetches player count history for many appids in one query
+# Output: {appid: row} for the appids found, None on error
+def BQ_get_history_playercount_by_appids(appids):
+    job_config = bigquery.QueryJobConfig(
+        query_parameters=[
+            bigquery.ArrayQueryParameter("appids", "INT64", [int(appid) for appid in appids])
+        ]
+    )
+
+    try:
+        rows = query_arrow("history_by_appids", _history_by_appids_query(), job_config).to_pylist()
+        return {row["appid"]: row for row in rows}
+
+    except Exception as e:
+        print(f"Error fetching player count history for {len(appids)} appids: {e}")
+        return None
+
 # Fetches the current player count history sorted by concurrent players
+# Reads the latest table (a few MB), the history strings are only parsed until the migration has run
 def BQ_get_current_history_playercount_sorted():
     query = f"""
-        SELECT appid, name, SAFE_CAST(SPLIT(ARRAY_REVERSE(SPLIT(date_playerscount, ', '))[SAFE_OFFSET(0)],' ')[SAFE_OFFSET(1)] AS INT64) AS concurrent_in_game
-        FROM `gamestats-462112.GameStats.history_playercount`
-        WHERE ARRAY_LENGTH(SPLIT(ARRAY_REVERSE(SPLIT(date_playerscount, ', '))[SAFE_OFFSET(0)], ' ')) > 1
-        ORDER BY concurrent_in_game DESC
-        LIMIT 7000
+        SELECT appid, name, latest_players AS concurrent_in_game
+        FROM `{HISTORY_LATEST_TABLE}`
+        WHERE latest_players IS NOT NULL
+        ORDER BY latest_players DESC
+        LIMIT {RANKING_LIMIT}
     """
     try:
-        df = client_bq.query(query).to_arrow(bqstorage_client=client_storage).to_pandas()
-        results = df.to_dict('records')
-        return results
+        return query_arrow("ranking", query).to_pylist()
+
+    except NotFound:
+        print(f"{HISTORY_LATEST_TABLE} not found, run `python bigquery_calling.py migrate`.")
+        query = f"""
+            SELECT appid, name, SAFE_CAST(SPLIT(ARRAY_REVERSE(SPLIT(date_playerscount, ', '))[SAFE_OFFSET(0)],' ')[SAFE_OFFSET(1)] AS INT64) AS concurrent_in_game
+            FROM `{HISTORY_TABLE}`
+            WHERE ARRAY_LENGTH(SPLIT(ARRAY_REVERSE(SPLIT(date_playerscount, ', '))[SAFE_OFFSET(0)], ' ')) > 1
+            ORDER BY concurrent_in_game DESC
+            LIMIT {RANKING_LIMIT}
+        """
+        try:
+            return query_arrow("ranking_legacy", query).to_pylist()
+        except Exception as e:
+            print(f"Error fetching player count history: {e}")
+            return []
     
     except Exception as e:
         print(f"Error fetching player count history: {e}")
@@ -199,14 +603,27 @@ def BQ_get_all_metadata():
     """
 
     try:
-        df = client_bq.query(query).to_arrow(bqstorage_client=client_storage).to_pandas()
-        results = df.to_dict('records')
-        return results
+        return query_arrow("metadata_all", query).to_pylist()
 
     except Exception as e:
         print(f"Error fetching metadata: {e}")
         return []
 
+# Fetches the whole metadata table as a pyarrow.Table (no per-row Python objects)
+# Output: pyarrow.Table or None on error
+def BQ_get_all_metadata_table():
+    query = f"""
+        SELECT *
+        FROM `{METADATA_TABLE}`
+    """
+
+    try:
+        return query_arrow("metadata_table", query)
+
+    except Exception as e:
+        print(f"Error fetching metadata table: {e}")
+        return None
+
 # Fetches metadata for a specific appid from the metadata table
 def BQ_get_metadata_by_appid(appid):
     query = f"""
@@ -221,8 +638,7 @@ def BQ_get_metadata_by_appid(appid):
         ]
     )
     try:
-        df = client_bq.query(query, job_config=job_config).to_dataframe(bqstorage_client=client_storage)
-        rows = df.to_dict('records')
+        rows = query_arrow("metadata_by_appid", query, job_config).to_pylist()
 
         if not rows:
             return None
@@ -238,6 +654,64 @@ def BQ_get_metadata_by_appid(appid):
         print(f"Error fetching metadata for appid {appid}: {e}")
         return None
 
+# Fetches metadata for many appids in one query
+# Output: {appid: row} for the appids found, None on error
+def BQ_get_metadata_by_appids(appids):
+    query = f"""
+        SELECT *
+        FROM `{METADATA_TABLE}`
+        WHERE appid IN UNNEST(@appids)
+    """
+    job_config = bigquery.QueryJobConfig(
+        query_parameters=[
+            bigquery.ArrayQueryParameter("appids", "INT64", [int(appid) for appid in appids])
+        ]
+    )
+    try:
+        results = {}
+        for row_dict in query_arrow("metadata_by_appids", query, job_config).to_pylist():
+            for data in fieldnames:
+                if data in ["platforms", "categories", "genres", "screenshots"]:
+                    row_dict[data] = row_dict[data].split(", ") if row_dict.get(data) else []
+            results[int(row_dict["appid"])] = row_dict
+        return results
+
+    except Exception as e:
+        print(f"Error fetching metadata for {len(appids)} appids: {e}")
+        return None
+
+# Adds many metadata rows to the metadata table in one load job
+# Output: True on success
+def BQ_add_metadata_batch(rows):
+    if not rows:
+        return True
+    try:
+        schema = bq_client().get_table(METADATA_TABLE).schema
+        run_job("metadata_batch_load", lambda: bq_client().load_table_from_json(
+            rows,
+            METADATA_TABLE,
+            job_config=bigquery.LoadJobConfig(schema=schema, write_disposition="WRITE_APPEND"),
+        ))
+        print(f"Metadata for {len(rows)} appids inserted successfully.")
+        return True
+
+    except Exception as e:
+        print(f"Error inserting metadata batch of {len(rows)} appids: {e}")
+        return False
+
+# Fetches store details for appids missing from the metadata table and stores them in one batch
+# New "not found" appids are added to BAD_APPIDS
+# Output: {appid: {"status": "ok", "data": row} | {"status": "failed", "reason": reason}}
+def BQ_backfill_metadata(appids):
+    results = ingestion.fetch_store_metadata(appids)
+    rows = [result["data"] for result in results.values() if result["status"] == "ok"]
+
+    if not BQ_add_metadata_batch(rows):
+        for row in rows:
+            results[row["appid"]] = {"status": "failed", "reason": "insert_failed"}
+
+    return results
+
 # Adds metadata to the metadata table
 def BQ_add_metadata(data):
     columns = ", ".join(data.keys())
@@ -259,8 +733,7 @@ def BQ_add_metadata(data):
     job_config = bigquery.QueryJobConfig(query_parameters=query_params)
 
     try:
-        query_job = client_bq.query(query, job_config=job_config)
-        query_job.result()
+        run_job("metadata_insert", lambda: bq_client().query(query, job_config=job_config))
         print(f"Metadata for appid inserted successfully.")
         return data
     
@@ -280,10 +753,15 @@ def BQ_get_all_steam_games():
         FROM `{PROJECT_ID}.GameStats.all_steam_apps`
     """
     try:
-        df = client_bq.query(query).to_dataframe(bqstorage_client=client_storage)
-        results = df.to_dict('records')
-        return results
+        return query_arrow("steam_apps", query).to_pylist()
     
     except Exception as e:
         print(f"Error fetching all steam games: {e}")
         return []
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["migrate"]:
+        BQ_migrate_history_tables()
+    else:
+        print("Usage: python bigquery_calling.py migrate")
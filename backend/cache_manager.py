@@ -0,0 +1,134 @@
+import threading
+import time
+
+
+# Immutable view of everything built from one cache refresh
+# Swapped as one object so a request never sees ranking and metadata from different refreshes
+class CacheSnapshot:
+    # history_version - identifies the stored player count histories (see app.get_history_version)
+    def __init__(self, generation, fetched_at, ranking, metadata, metadata_store, search_index, top_games,
+                 metadata_export, aggregates, analytics, history_version=None):
+        self.generation = generation
+        self.fetched_at = fetched_at
+        self.history_version = history_version
+        self.ranking = ranking
+        self.metadata = metadata
+        self.metadata_store = metadata_store
+        self.search_index = search_index
+        self.top_games = top_games
+        self.metadata_export = metadata_export
+        self.aggregates = aggregates
+        self.analytics = analytics
+
+
+# Stale-while-revalidate refresh manager
+# - first call (no snapshot yet) waits for the single in-flight build
+# - afterwards the current snapshot is always served, refreshes run in background
+# - refresh starts `refresh_ahead` seconds before `max_age` expiry
+# - failed refresh keeps last good snapshot and backs off exponentially
+# - a build returning the current snapshot means "not due", the refresh is retried after backoff_initial
+# - load_initial(generation), if given, is tried before the first build (warm start),
+#   a stale loaded snapshot is served while the full build runs in background
+class CacheRefreshManager:
+    def __init__(self, build_snapshot, submit, max_age, refresh_ahead=0,
+                 backoff_initial=30, backoff_max=30 * 60, load_initial=None):
+        self.build_snapshot = build_snapshot
+        self.load_initial = load_initial
+        self.submit = submit
+        self.max_age = max_age
+        self.refresh_ahead = refresh_ahead
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+
+        self._snapshot = None
+        self._lock = threading.Lock()
+        self._future = None
+        self._backoff = 0
+        self._next_attempt_at = 0
+        self._last_generation = 0
+
+    @property
+    def snapshot(self):
+        return self._snapshot
+
+    # Run the builder and swap in the result, called on the executor
+    def _refresh(self):
+        try:
+            if self._snapshot is None and self.load_initial is not None:
+                snapshot = self.load_initial(self._next_generation())
+                if snapshot is not None and self._swap(snapshot):
+                    print(f"Cache warm-started, generation {snapshot.generation}.")
+                    return snapshot
+
+            snapshot = self.build_snapshot(self._next_generation())
+            self._backoff = 0
+            if snapshot is self._snapshot:
+                # Nothing newer to serve yet (e.g. a worker waiting for another one to publish), check again later
+                self._next_attempt_at = time.time() + self.backoff_initial
+                return snapshot
+            self._next_attempt_at = 0
+            if not self._swap(snapshot):
+                return self._snapshot
+            print(f"Cache refreshed, generation {snapshot.generation}.")
+            return snapshot
+        except Exception as e:
+            self._backoff = min(self._backoff * 2 or self.backoff_initial, self.backoff_max)
+            self._next_attempt_at = time.time() + self._backoff
+            print(f"Cache refresh failed, retrying in {self._backoff}s: {e}")
+            return self._snapshot
+        finally:
+            with self._lock:
+                self._future = None
+
+    # Swap in snapshot unless a newer generation was swapped in meanwhile
+    def _swap(self, snapshot):
+        with self._lock:
+            if self._snapshot is not None and self._snapshot.generation > snapshot.generation:
+                return False
+            self._snapshot = snapshot
+            return True
+
+    # Generation ids are timestamps, strictly increasing within the process
+    def _next_generation(self):
+        with self._lock:
+            self._last_generation = max(int(time.time()), self._last_generation + 1)
+            return self._last_generation
+
+    # Start a background refresh unless one is running or we are backing off
+    def _start_refresh(self, force=False):
+        with self._lock:
+            if self._future is None and (force or time.time() >= self._next_attempt_at):
+                self._future = self.submit(self._refresh)
+            return self._future
+
+    # Force a refresh (e.g. after the update task), returns the in-flight future
+    def invalidate(self):
+        return self._start_refresh(force=True)
+
+    # Build a snapshot in the calling thread and swap it in, raises if the build fails
+    # (e.g. the update task, which has to know when the new data is served)
+    # build_snapshot overrides the builder for this call only
+    def rebuild(self, build_snapshot=None):
+        snapshot = (build_snapshot or self.build_snapshot)(self._next_generation())
+        self._swap(snapshot)
+        print(f"Cache rebuilt, generation {snapshot.generation}.")
+        return snapshot
+
+    # Start loading the first snapshot at boot, without waiting for it
+    def warm_up(self):
+        if self._snapshot is None:
+            self._start_refresh()
+
+    # Get current snapshot, scheduling a refresh when it is close to expiry
+    # Returns None only if no snapshot was ever built successfully
+    def get(self):
+        snapshot = self._snapshot
+        if snapshot is None:
+            future = self._start_refresh()
+            if future is None:
+                return self._snapshot
+            return future.result()
+
+        if time.time() - snapshot.fetched_at >= self.max_age - self.refresh_ahead:
+            self._start_refresh()
+        return snapshot
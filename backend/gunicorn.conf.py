@@ -0,0 +1,27 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+# Production serving: gunicorn -c gunicorn.conf.py app:app
+# Workers share one cache snapshot (CACHE_MODE=shared, see app.py)
+bind = f"0.0.0.0:{os.environ.get('PORT', 8080)}"
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", 8))
+# Worker heartbeat: a worker that stops responding (deadlock, hung storage call) is restarted after this many seconds
+# With gthread the heartbeat is sent by the worker's main loop, so long requests (the update task, streamed
+# exports) are not affected, Cloud Run enforces its own request timeout for those
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 120))
+# Workers write their metrics here, /metrics on any worker merges them (see metrics.py)
+metrics_dir = os.getenv("METRICS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), "gamestats_metrics"))
+raw_env = [
+    f"CACHE_MODE={os.getenv('CACHE_MODE', 'shared')}",
+    f"METRICS_MULTIPROC_DIR={metrics_dir}",
+]
+
+
+# Metrics of a previous server run must not be added to the new totals
+def on_starting(server):
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir)
@@ -0,0 +1,82 @@
+import hashlib
+import os
+import zlib
+
+import brotli
+
+from lru_cache import LRUCache
+
+# Encodings offered to clients, preferred first on equal quality
+ENCODINGS = ("br", "gzip")
+COMPRESSIBLE_MIMETYPES = {"application/json", "application/x-ndjson", "text/plain"}
+# Smaller bodies are sent as they are
+MIN_COMPRESS_SIZE = 1024
+# Reused bodies are compressed once, so the levels favour size over speed
+BROTLI_QUALITY = 9
+GZIP_LEVEL = 9
+# Streamed bodies are compressed on every request
+STREAM_BROTLI_QUALITY = 4
+STREAM_GZIP_LEVEL = 6
+
+COMPRESSED_CACHE_MAX_BYTES = 64 * 1024 * 1024
+COMPRESSED_CACHE_TTL = 12 * 60 * 60
+
+# Deployed revision (set by Cloud Run), so a deploy changing response shapes changes every ETag
+REVISION = os.getenv("K_REVISION", "")
+
+
+# Weak ETag of responses derived from a cache snapshot
+# fetched_at (not the per-process generation) is used, so workers serving the same published snapshot agree
+def snapshot_etag(snapshot):
+    return hashlib.blake2b(f"{snapshot.fetched_at}:{REVISION}".encode(), digest_size=8).hexdigest()
+
+# Cache-Control value for (max-age, stale-while-revalidate) or None (no-store)
+def cache_control(policy):
+    if policy is None:
+        return "no-store"
+    max_age, stale = policy
+    return f"public, max-age={max_age}, stale-while-revalidate={stale}"
+
+
+def _compress(body, encoding):
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+    return compressor.compress(body) + compressor.flush()
+
+
+# Compressed response bodies keyed by content hash, so every distinct body is compressed once per encoding
+# (bodies only change with the cache snapshot, old ones are evicted by size / TTL)
+class CompressedBodies:
+    def __init__(self, max_bytes=COMPRESSED_CACHE_MAX_BYTES, ttl=COMPRESSED_CACHE_TTL):
+        self._cache = LRUCache(max_bytes, ttl, weight=len)
+
+    def get(self, body, encoding):
+        key = (hashlib.blake2b(body, digest_size=16).digest(), encoding)
+        compressed = self._cache.get(key)
+        if compressed is None:
+            compressed = _compress(body, encoding)
+            self._cache.set(key, compressed)
+        return compressed
+
+    def stats(self):
+        return self._cache.stats()
+
+
+# Compress a streamed body chunk by chunk
+def compress_stream(chunks, encoding):
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=STREAM_BROTLI_QUALITY)
+        for chunk in chunks:
+            data = compressor.process(chunk)
+            if data:
+                yield data
+        yield compressor.finish()
+        return
+
+    compressor = zlib.compressobj(STREAM_GZIP_LEVEL, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
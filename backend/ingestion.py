@@ -0,0 +1,387 @@
+import asyncio
+import inspect
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import aiohttp
+import requests
+
+import metrics
+from bad_appids import BAD_APPIDS
+
+STEAMCHARTS_URL = os.getenv("STEAMCHARTS_URL", "https://steamcharts.com")
+STEAM_STORE_URL = os.getenv("STEAM_STORE_URL", "https://store.steampowered.com")
+STEAM_API_URL = os.getenv("STEAM_API_URL", "https://api.steampowered.com")
+
+# Also keep history as one (appid, ts, players) row per point, read by per-game history queries
+HISTORY_POINTS = os.getenv("HISTORY_POINTS", "false").lower() == "true"
+
+# Crawl settings
+INGEST_CONCURRENCY = int(os.getenv("INGEST_CONCURRENCY", 64))
+INGEST_RATE_PER_HOST = float(os.getenv("INGEST_RATE_PER_HOST", 50))
+INGEST_RETRIES = 3
+INGEST_TIMEOUT = 10
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 10
+# Steam store appdetails is rate limited much harder than SteamCharts
+STORE_CONCURRENCY = int(os.getenv("STORE_CONCURRENCY", 8))
+STORE_RATE_PER_HOST = float(os.getenv("STORE_RATE_PER_HOST", 3))
+
+# Crawled history rows handed to the uploader at once
+HISTORY_BATCH_SIZE = int(os.getenv("HISTORY_BATCH_SIZE", 500))
+
+# Status codes worth retrying, everything else non-200 is a permanent failure
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+# Throughput and failure counters for one crawl
+class IngestionStats:
+    def __init__(self, total):
+        self.total = total
+        self.succeeded = 0
+        self.failed = {}
+        self.retries = 0
+        self.started_at = time.monotonic()
+        self.finished_at = None
+
+    def add_failure(self, reason):
+        self.failed[reason] = self.failed.get(reason, 0) + 1
+
+    @property
+    def failed_total(self):
+        return sum(self.failed.values())
+
+    @property
+    def elapsed(self):
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+    def summary(self):
+        rate = (self.succeeded + self.failed_total) / self.elapsed if self.elapsed else 0
+        return (
+            f"Fetched {self.succeeded}/{self.total} apps in {self.elapsed:.1f}s "
+            f"({rate:.1f} apps/s), {self.failed_total} failed {self.failed}, {self.retries} retries"
+        )
+
+
+# Token bucket shared by all workers hitting one host
+class HostRateLimiter:
+    def __init__(self, rate_per_second):
+        self.interval = 1 / rate_per_second if rate_per_second > 0 else 0
+        self._next_slot = 0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        if not self.interval:
+            return
+        async with self._lock:
+            now = asyncio.get_running_loop().time()
+            delay = self._next_slot - now
+            self._next_slot = max(now, self._next_slot) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+# Full-jitter exponential backoff
+def backoff_delay(attempt):
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+
+# Convert SteamCharts chart-data.json ([[ts, count], ...]) to a history row
+def chart_data_to_row(appid, name, data):
+    return {
+        "appid": appid,
+        "name": name,
+        "date_playerscount": ", ".join([f"{entry[0]} {entry[1]}" for entry in data]),
+    }
+
+
+# Convert Steam store appdetails "data" object to a metadata table row
+def store_data_to_row(appid, game_data):
+    return {
+        "appid": appid,
+        "name": game_data.get("name"),
+        "header_image": game_data.get("header_image"),
+        "short_description": game_data.get("short_description"),
+        "developers": ", ".join(game_data.get("developers", [])),
+        "publishers": ", ".join(game_data.get("publishers", [])),
+        "release_date": game_data.get("release_date", {}).get("date"),
+        "platforms": ", ".join([k for k, v in game_data.get("platforms", {}).items() if v]),
+        "price": game_data.get("price_overview", {}).get("final_formatted"),
+        "categories": ", ".join([cat["description"] for cat in game_data.get("categories", [])]),
+        "genres": ", ".join([genre["description"] for genre in game_data.get("genres", [])]),
+        "website": game_data.get("website"),
+        "screenshots": ", ".join([s["path_full"] for s in game_data.get("screenshots", [])]),
+        "background": game_data.get("background")
+    }
+
+
+class _Crawler:
+    def __init__(self, stats, concurrency, rate_per_host, retries):
+        self.stats = stats
+        self.concurrency = concurrency
+        self.rate_per_host = rate_per_host
+        self.retries = retries
+        self._limiters = {}
+
+    def _limiter(self, url):
+        host = urlsplit(url).netloc
+        if host not in self._limiters:
+            self._limiters[host] = HostRateLimiter(self.rate_per_host)
+        return self._limiters[host]
+
+    # GET JSON with rate limit and retries
+    # Output: (parsed JSON, None) or (None, failure reason)
+    async def get_json(self, session, url):
+        for attempt in range(self.retries + 1):
+            if attempt:
+                self.stats.retries += 1
+                await asyncio.sleep(backoff_delay(attempt))
+            await self._limiter(url).wait()
+            started = time.perf_counter()
+            try:
+                async with session.get(url) as res:
+                    if res.status == 200:
+                        data = await res.json(content_type=None)
+                        metrics.observe_upstream(url, time.perf_counter() - started)
+                        return data, None
+                    metrics.observe_upstream(url, time.perf_counter() - started, f"http_{res.status}")
+                    if res.status not in RETRY_STATUSES or attempt == self.retries:
+                        return None, f"http_{res.status}"
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                metrics.observe_upstream(url, time.perf_counter() - started, type(e).__name__)
+                if attempt == self.retries:
+                    return None, type(e).__name__
+        return None, "retries_exhausted"
+
+    async def _worker(self, session, queue, url_for, on_result, on_failure):
+        while True:
+            row = await queue.get()
+            try:
+                if row is None:
+                    return
+                data, reason = await self.get_json(session, url_for(row))
+                if reason is None and not data:
+                    reason = "empty"
+                if reason is not None:
+                    self.stats.add_failure(reason)
+                    if on_failure is not None:
+                        on_failure(row, reason)
+                    continue
+                self.stats.succeeded += 1
+                result = on_result(row, data)
+                # Async callbacks (e.g. waiting for an upload) pause this worker only, not the event loop
+                if inspect.isawaitable(result):
+                    await result
+            except Exception as e:
+                self.stats.add_failure(type(e).__name__)
+                print(f"Error handling response for appid {row['appid']}: {e}")
+                if on_failure is not None:
+                    on_failure(row, type(e).__name__)
+            finally:
+                queue.task_done()
+
+    async def run(self, rows, url_for, on_result, on_failure):
+        connector = aiohttp.TCPConnector(
+            limit=self.concurrency,
+            limit_per_host=self.concurrency,
+            keepalive_timeout=30,
+            ttl_dns_cache=300,
+        )
+        timeout = aiohttp.ClientTimeout(total=INGEST_TIMEOUT)
+        queue = asyncio.Queue(maxsize=self.concurrency * 2)
+
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+            workers = [
+                asyncio.create_task(self._worker(session, queue, url_for, on_result, on_failure))
+                for _ in range(self.concurrency)
+            ]
+            for row in rows:
+                await queue.put(row)
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+
+
+# Fetch JSON for every row with bounded concurrency
+# url_for(row) builds the request url
+# on_result(row, data) is called as soon as each row completes (an awaitable it returns is awaited),
+#  on_failure(row, reason) on failure
+# Output: IngestionStats
+def crawl_json(rows, url_for, on_result, on_failure=None, concurrency=INGEST_CONCURRENCY,
+               rate_per_host=INGEST_RATE_PER_HOST, retries=INGEST_RETRIES):
+    rows = list(rows)
+    stats = IngestionStats(len(rows))
+    crawler = _Crawler(stats, concurrency, rate_per_host, retries)
+    asyncio.run(crawler.run(rows, url_for, on_result, on_failure))
+    stats.finished_at = time.monotonic()
+    print(stats.summary())
+    return stats
+
+
+# Crawl SteamCharts history for rows ({appid, name})
+def crawl_chart_data(rows, on_result, on_failure=None, **kwargs):
+    return crawl_json(
+        rows,
+        lambda row: f"{STEAMCHARTS_URL}/app/{row['appid']}/chart-data.json",
+        on_result,
+        on_failure,
+        **kwargs,
+    )
+
+
+# Crawl Steam store appdetails for rows ({appid})
+def crawl_store_appdetails(rows, on_result, on_failure=None, **kwargs):
+    kwargs.setdefault("concurrency", STORE_CONCURRENCY)
+    kwargs.setdefault("rate_per_host", STORE_RATE_PER_HOST)
+    return crawl_json(
+        rows,
+        lambda row: f"{STEAM_STORE_URL}/api/appdetails?appids={row['appid']}",
+        on_result,
+        on_failure,
+        **kwargs,
+    )
+
+
+# Fetch store details for many appids, skipping known bad appids
+# Appids the store reports as not found are added to BAD_APPIDS
+# Output: {appid: {"status": "ok", "data": row} | {"status": "failed", "reason": reason}}
+def fetch_store_metadata(appids):
+    results = {}
+    to_fetch = []
+    for appid in dict.fromkeys(int(appid) for appid in appids):
+        if appid in BAD_APPIDS:
+            results[appid] = {"status": "failed", "reason": "bad_appid"}
+        else:
+            to_fetch.append({"appid": appid})
+
+    def collect(row, data):
+        appid = row["appid"]
+        details = data.get(str(appid), {})
+        if not details.get("success"):
+            results[appid] = {"status": "failed", "reason": "not_found"}
+            return
+        results[appid] = {"status": "ok", "data": store_data_to_row(appid, details["data"])}
+
+    def failed(row, reason):
+        results[row["appid"]] = {"status": "failed", "reason": reason}
+
+    crawl_store_appdetails(to_fetch, collect, failed)
+
+    for appid, result in results.items():
+        if result.get("reason") == "not_found":
+            BAD_APPIDS.add(appid, "not_found")
+    return results
+
+
+# Single blocking GET to Steam / SteamCharts, recorded in the upstream metrics
+def get_upstream(url, timeout=10):
+    started = time.perf_counter()
+    try:
+        res = requests.get(url, timeout=timeout)
+    except Exception as e:
+        metrics.observe_upstream(url, time.perf_counter() - started, type(e).__name__)
+        raise
+    reason = None if res.status_code == 200 else f"http_{res.status_code}"
+    metrics.observe_upstream(url, time.perf_counter() - started, reason)
+    return res
+
+
+# Appids currently in the Steam top players chart
+def fetch_steam_top_appids():
+    res = get_upstream(f"{STEAM_API_URL}/ISteamChartsService/GetGamesByConcurrentPlayers/v1/")
+    if res.status_code != 200:
+        print(f"Failed to fetch top sellers: {res.status_code}")
+        return []
+    ranks = res.json().get("response", {}).get("ranks", [])
+    return list(dict.fromkeys(int(data["appid"]) for data in ranks))
+
+
+# Crawl history for rows ({appid, name}) keeping only points newer than last_timestamps[appid]
+# on_batch(rows) - uploader, called with every batch_size completed rows while the crawl goes on
+#  (in a background thread, one batch uploading at a time; crawl workers that fill the next batch await
+#  the upload, so memory stays bounded by two batches plus a row per crawl worker, without blocking the
+#  event loop)
+# Output: history rows with only the new points (apps without new points are skipped)
+#  OR with on_batch: number of rows uploaded
+def crawl_history_deltas(rows, last_timestamps, on_batch=None, batch_size=HISTORY_BATCH_SIZE):
+    data_return = []
+    uploader = ThreadPoolExecutor(max_workers=1) if on_batch is not None else None
+    uploading = None
+    uploaded = 0
+    # First failed upload, the rest of the crawl is skipped and the error raised at the end
+    upload_error = None
+    flush_lock = asyncio.Lock()
+
+    def submit():
+        nonlocal data_return, uploading, uploaded
+        uploading = uploader.submit(on_batch, data_return)
+        uploaded += len(data_return)
+        data_return = []
+
+    # Back pressure: wait for the previous batch, then upload everything collected meanwhile
+    async def flush():
+        nonlocal upload_error
+        async with flush_lock:
+            if upload_error is not None or len(data_return) < batch_size:
+                return
+            if uploading is not None:
+                try:
+                    await asyncio.wrap_future(uploading)
+                except Exception as e:
+                    upload_error = e
+                    return
+            submit()
+
+    def collect(row, data):
+        if upload_error is not None:
+            return None
+        last_ts = last_timestamps.get(int(row["appid"]))
+        if last_ts is not None:
+            data = [entry for entry in data if entry[0] > last_ts]
+        if data:
+            data_return.append(chart_data_to_row(row["appid"], row["name"], data))
+            if uploader is not None and len(data_return) >= batch_size:
+                return flush()
+        return None
+
+    if uploader is None:
+        crawl_chart_data(rows, collect)
+        return data_return
+
+    try:
+        crawl_chart_data(rows, collect)
+        # The crawl's event loop is closed, the last batch is uploaded from here
+        if upload_error is None and uploading is not None:
+            try:
+                uploading.result()
+            except Exception as e:
+                upload_error = e
+        if upload_error is not None:
+            raise upload_error
+        if data_return:
+            submit()
+        if uploading is not None:
+            uploading.result()
+    finally:
+        uploader.shutdown(wait=True)
+    return uploaded
+
+
+# Add rows for newly ranked apps missing from data_list, backfilling their metadata
+# backfill_metadata(appids) - backend function storing the fetched metadata
+def add_new_ranked_apps(data_list, backfill_metadata):
+    existing_appids = {int(item["appid"]) for item in data_list}
+    new_appids = [appid for appid in fetch_steam_top_appids() if appid not in existing_appids]
+    if not new_appids:
+        return data_list
+
+    print(f"Fetching metadata for {len(new_appids)} new appids")
+    backfilled = backfill_metadata(new_appids)
+    for appid in new_appids:
+        result = backfilled.get(appid, {})
+        name = result["data"]["name"] if result.get("status") == "ok" else "Unknown"
+        data_list.append({"appid": appid, "name": name})
+    return data_list
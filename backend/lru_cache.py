@@ -0,0 +1,71 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+# Size-bounded LRU cache with TTL and generation-based invalidation
+# - weight(value) is summed against max_weight (default 1 per entry)
+# - entries stored under an older generation count as misses
+# - hits / misses / evictions are counted for monitoring
+class LRUCache:
+    def __init__(self, max_weight, ttl, weight=None):
+        self.max_weight = max_weight
+        self.ttl = ttl
+        self.weight = weight or (lambda value: 1)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._total_weight = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _remove(self, key):
+        _, _, _, weight = self._entries.pop(key)
+        self._total_weight -= weight
+
+    # Value for key stored under generation, None on miss
+    def get(self, key, generation=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, entry_generation, expires_at, _ = entry
+            if entry_generation != generation or time.monotonic() >= expires_at:
+                self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, generation=None):
+        weight = self.weight(value)
+        if weight > self.max_weight:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, generation, time.monotonic() + self.ttl, weight)
+            self._total_weight += weight
+            while self._total_weight > self.max_weight:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._total_weight = 0
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "weight": self._total_weight,
+            "max_weight": self.max_weight,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,62 @@
+import json
+
+import numpy as np
+
+from metadata_store import METADATA_FIELDS
+
+# Rows encoded per yielded chunk
+STREAM_CHUNK_ROWS = 500
+
+
+# Parse fields= argument ("appid,name,genres"), None -> all fields
+# Raises ValueError on unknown field names
+def parse_fields(fields_arg):
+    if not fields_arg:
+        return None
+    fields = [field.strip() for field in fields_arg.split(",") if field.strip()]
+    unknown = [field for field in fields if field not in METADATA_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    if "appid" not in fields:
+        fields.insert(0, "appid")
+    return fields
+
+
+# Metadata table (sorted by appid) served as projected and paginated chunks
+# Only the rows of the chunk being encoded are turned into Python objects
+class MetadataExport:
+    def __init__(self, table):
+        self.table = table
+        self.appids = table.column("appid").to_numpy()
+
+    def __len__(self):
+        return self.table.num_rows
+
+    # Row range for cursor (last appid of previous page) and limit
+    # Output: start, end, next cursor (None on last page)
+    def page(self, cursor=None, limit=None):
+        total = len(self.appids)
+        start = 0 if cursor is None else int(np.searchsorted(self.appids, cursor, side="right"))
+        end = total if limit is None else min(start + limit, total)
+        next_cursor = int(self.appids[end - 1]) if end < total and end > start else None
+        return start, end, next_cursor
+
+    @staticmethod
+    def _encode(row):
+        return json.dumps(row, ensure_ascii=False, separators=(",", ":"), default=str)
+
+    # Generator of JSON array (or NDJSON) chunks for rows[start:end]
+    def stream(self, start, end, fields=None, ndjson=False):
+        table = self.table.select(fields) if fields is not None else self.table
+        if not ndjson:
+            yield b"["
+        for chunk_start in range(start, end, STREAM_CHUNK_ROWS):
+            chunk = table.slice(chunk_start, min(STREAM_CHUNK_ROWS, end - chunk_start))
+            lines = [self._encode(row) for row in chunk.to_pylist()]
+            if ndjson:
+                yield ("\n".join(lines) + "\n").encode("utf-8")
+            else:
+                prefix = "," if chunk_start > start else ""
+                yield (prefix + ",".join(lines)).encode("utf-8")
+        if not ndjson:
+            yield b"]"
@@ -0,0 +1,154 @@
+import math
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+# Columns of the metadata table, in table order
+METADATA_FIELDS = [
+    "appid", "name", "header_image", "short_description", "developers",
+    "publishers", "release_date", "platforms", "price", "categories",
+    "genres", "website", "screenshots", "background"
+]
+
+# Fields stored as ", " joined strings in the metadata table
+LIST_FIELDS = ["platforms", "categories", "genres", "screenshots"]
+
+# Low-cardinality columns kept dictionary encoded in memory
+DICTIONARY_FIELDS = ["developers", "publishers", "genres", "platforms"]
+
+METADATA_SCHEMA = pa.schema(
+    [pa.field("appid", pa.int64())] + [pa.field(field, pa.string()) for field in METADATA_FIELDS[1:]]
+)
+# Schema of tables built by to_metadata_table
+METADATA_TABLE_SCHEMA = pa.schema([
+    pa.field(field.name, pa.dictionary(pa.int32(), pa.string())) if field.name in DICTIONARY_FIELDS else field
+    for field in METADATA_SCHEMA
+])
+
+
+# Split ", " joined field into list (None / NaN / "" -> [])
+def split_list_field(value):
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return []
+    if isinstance(value, list):
+        return value
+    return str(value).split(", ") if value else []
+
+
+# Raw value -> string column value (None / NaN -> null)
+def _to_string(value):
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return None
+    if isinstance(value, list):
+        return ", ".join(value)
+    return str(value)
+
+
+# Metadata as an Arrow table: METADATA_SCHEMA columns, sorted by appid, dictionary encoded DICTIONARY_FIELDS
+# Input: pyarrow.Table (e.g. from BigQuery) or list of row dicts
+def to_metadata_table(data=None):
+    if data is None:
+        data = []
+    # Already built by to_metadata_table (e.g. a memory-mapped warm snapshot), used as is without copying
+    if isinstance(data, pa.Table) and data.schema.equals(METADATA_TABLE_SCHEMA):
+        return data
+    if not isinstance(data, pa.Table):
+        data = pa.table({
+            field.name: pa.array(
+                [int(row["appid"]) if field.name == "appid" else _to_string(row.get(field.name)) for row in data],
+                field.type,
+            )
+            for field in METADATA_SCHEMA
+        })
+
+    columns = []
+    for field in METADATA_SCHEMA:
+        if field.name in data.column_names:
+            column = pc.cast(data.column(field.name), field.type)
+        else:
+            column = pa.nulls(data.num_rows, field.type)
+        columns.append(column)
+    table = pa.Table.from_arrays(columns, schema=METADATA_SCHEMA)
+    table = table.filter(pc.is_valid(table.column("appid"))).sort_by("appid").combine_chunks()
+
+    for field in DICTIONARY_FIELDS:
+        index = table.schema.get_field_index(field)
+        table = table.set_column(index, field, table.column(field).dictionary_encode())
+    return table
+
+
+# Python dict for one row, list fields parsed
+def _parse_row(row):
+    row["appid"] = int(row["appid"])
+    for field in LIST_FIELDS:
+        if field in row:
+            row[field] = split_list_field(row[field])
+    return row
+
+
+# Metadata store keyed by int appid
+# Built once per cache refresh on top of the Arrow metadata table,
+# Python objects are only created for the rows that are looked up
+# Rows added later (backfill / Steam API) are kept in a small overlay
+class MetadataStore:
+    def __init__(self, rows=None):
+        self.table = to_metadata_table(rows)
+        self._appids = self.table.column("appid").to_numpy()
+        self._added = {}
+
+    def __len__(self):
+        return len(self._appids) + sum(1 for appid in self._added if self._position(appid) is None)
+
+    def __contains__(self, appid):
+        try:
+            appid = int(appid)
+        except (TypeError, ValueError):
+            return False
+        return appid in self._added or self._position(appid) is not None
+
+    # Row position of appid in the table or None
+    def _position(self, appid):
+        position = int(np.searchsorted(self._appids, appid))
+        if position < len(self._appids) and self._appids[position] == appid:
+            return position
+        return None
+
+    # Add or replace one row (raw row from BigQuery / Steam API)
+    def add(self, row):
+        entry = _parse_row(dict(row))
+        self._added[entry["appid"]] = entry
+        return dict(entry)
+
+    # Get parsed metadata for appid, returns a copy or None
+    def get(self, appid):
+        return self.get_many([appid]).get(self._appid(appid))
+
+    @staticmethod
+    def _appid(appid):
+        try:
+            return int(appid)
+        except (TypeError, ValueError):
+            return None
+
+    # Parsed metadata for many appids with one table take
+    # Output: {appid: row} for the appids found
+    def get_many(self, appids):
+        results = {}
+        positions = []
+        for appid in appids:
+            appid = self._appid(appid)
+            if appid is None:
+                continue
+            if appid in self._added:
+                results[appid] = dict(self._added[appid])
+                continue
+            position = self._position(appid)
+            if position is not None:
+                positions.append(position)
+
+        if positions:
+            for row in self.table.take(positions).to_pylist():
+                row = _parse_row(row)
+                results[row["appid"]] = row
+        return results
@@ -0,0 +1,316 @@
+import json
+import os
+import threading
+import time
+import weakref
+from bisect import bisect_left
+from urllib.parse import urlsplit
+
+# Directory shared by the worker processes of one instance (gunicorn), every worker writes its metrics there
+# and a scrape of any worker merges all of them, so counters and histograms cover the whole instance
+METRICS_MULTIPROC_DIR = os.getenv("METRICS_MULTIPROC_DIR", "")
+# How often a worker writes its metrics to METRICS_MULTIPROC_DIR
+METRICS_WRITE_INTERVAL = float(os.getenv("METRICS_WRITE_INTERVAL", "5"))
+
+# Default latency buckets (seconds)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_registry = []
+_collectors = []
+_registry_lock = threading.Lock()
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    pairs += [f'{name}="{_escape(value)}"' for name, value in extra]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+# Metric with per-thread shards: recording touches only the calling thread's dict (no lock),
+# shards are merged when /metrics is scraped, shards of finished threads are folded into a base
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._local = threading.local()
+        self._shards = []
+        self._base = {}
+        self._lock = threading.Lock()
+        with _registry_lock:
+            _registry.append(self)
+
+    def _shard(self):
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = {}
+            self._local.shard = shard
+            with self._lock:
+                self._shards.append((weakref.ref(threading.current_thread()), shard))
+        return shard
+
+    # Merged values {label values: value}
+    def _collect(self):
+        with self._lock:
+            alive = []
+            for thread, shard in self._shards:
+                if thread() is None or not thread().is_alive():
+                    for key, value in list(shard.items()):
+                        self._base[key] = self._merge(self._base.get(key), value)
+                else:
+                    alive.append((thread, shard))
+            self._shards = alive
+            merged = {key: self._merge(None, value) for key, value in self._base.items()}
+            for _, shard in alive:
+                for key, value in list(shard.items()):
+                    merged[key] = self._merge(merged.get(key), value)
+        return merged
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount=1):
+        shard = self._shard()
+        shard[labels] = shard.get(labels, 0) + amount
+
+    @staticmethod
+    def _merge(total, value):
+        return (total or 0) + value
+
+    # values - merged {label values: value}, this process only if None
+    def render(self, values=None):
+        values = self._collect() if values is None else values
+        return [
+            f"{self.name}{_format_labels(self.labelnames, labels)} {value}"
+            for labels, value in sorted(values.items())
+        ]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    # Per label set: [count per bucket (last is +Inf)..., sum]
+    def observe(self, value, *labels):
+        shard = self._shard()
+        state = shard.get(labels)
+        if state is None:
+            state = [0] * (len(self.buckets) + 2)
+            shard[labels] = state
+        state[bisect_left(self.buckets, value)] += 1
+        state[-1] += value
+
+    # Context manager observing the duration of the block
+    def time(self, *labels):
+        return _Timer(self, labels)
+
+    @staticmethod
+    def _merge(total, value):
+        if total is None:
+            return list(value)
+        return [a + b for a, b in zip(total, value)]
+
+    # values - merged {label values: state}, this process only if None
+    def render(self, values=None):
+        values = self._collect() if values is None else values
+        lines = []
+        for labels, state in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), state[:-1]):
+                cumulative += count
+                le = bound if bound == "+Inf" else repr(float(bound))
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, [('le', le)])} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {state[-1]}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, *self.labels)
+
+
+# Register fn() -> [(name, type, help, [(labels dict, value), ...]), ...] evaluated on every scrape
+# (gauges and counters kept elsewhere, e.g. cache sizes)
+def register_collector(fn):
+    with _registry_lock:
+        _collectors.append(fn)
+
+
+def _collect_families():
+    with _registry_lock:
+        collectors = list(_collectors)
+    families = []
+    for collector in collectors:
+        try:
+            families += collector()
+        except Exception as e:
+            print(f"Error collecting metrics: {e}")
+    return families
+
+
+def _render_family(name, kind, documentation, samples):
+    lines = [f"# HELP {name} {documentation}", f"# TYPE {name} {kind}"]
+    for labels, value in samples:
+        lines.append(f"{name}{_format_labels(labels.keys(), labels.values())} {value}")
+    return lines
+
+
+# Prometheus text exposition format of every metric
+# (of every worker with METRICS_MULTIPROC_DIR, of this process otherwise)
+def render():
+    if METRICS_MULTIPROC_DIR:
+        return _render_multiprocess()
+    lines = []
+    with _registry_lock:
+        metrics = list(_registry)
+    for metric in metrics:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.render())
+    for family in _collect_families():
+        lines.extend(_render_family(*family))
+    return "\n".join(lines) + "\n"
+
+
+# MULTIPROCESS (gunicorn workers)
+
+def _process_file(pid):
+    return os.path.join(METRICS_MULTIPROC_DIR, f"{pid}.json")
+
+
+# Write the metrics of this process to METRICS_MULTIPROC_DIR (atomically, a scrape never reads a partial file)
+def write_process_metrics():
+    with _registry_lock:
+        metrics = list(_registry)
+    state = {
+        "metrics": {metric.name: [[list(labels), value] for labels, value in metric._collect().items()]
+                    for metric in metrics},
+        "families": _collect_families(),
+    }
+    path = _process_file(os.getpid())
+    tmp = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(tmp, path)
+
+
+def _write_periodically():
+    while True:
+        time.sleep(METRICS_WRITE_INTERVAL)
+        try:
+            write_process_metrics()
+        except Exception as e:
+            print(f"Error writing process metrics: {e}")
+
+
+# Start writing this worker's metrics every METRICS_WRITE_INTERVAL seconds (no-op without METRICS_MULTIPROC_DIR)
+def start_process_writer():
+    if not METRICS_MULTIPROC_DIR:
+        return
+    os.makedirs(METRICS_MULTIPROC_DIR, exist_ok=True)
+    write_process_metrics()
+    threading.Thread(target=_write_periodically, name="metrics-writer", daemon=True).start()
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+# Metrics of every worker that wrote to METRICS_MULTIPROC_DIR
+# Counters and histograms are summed (files of exited workers are kept, so totals never go backwards),
+# collector gauges describe one process and get a worker label (exited workers are left out)
+def _render_multiprocess():
+    write_process_metrics()
+    states = {}
+    for name in os.listdir(METRICS_MULTIPROC_DIR):
+        pid = name[:-len(".json")]
+        if not name.endswith(".json") or not pid.isdigit():
+            continue
+        try:
+            with open(os.path.join(METRICS_MULTIPROC_DIR, name), "r", encoding="utf-8") as f:
+                states[int(pid)] = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Error reading metrics of worker {pid}: {e}")
+
+    lines = []
+    with _registry_lock:
+        metrics = list(_registry)
+    for metric in metrics:
+        merged = {}
+        for state in states.values():
+            for labels, value in state["metrics"].get(metric.name, []):
+                merged[tuple(labels)] = metric._merge(merged.get(tuple(labels)), value)
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.render(merged))
+
+    families = {}
+    for pid, state in sorted(states.items()):
+        alive = _alive(pid)
+        for name, kind, documentation, samples in state["families"]:
+            family = families.setdefault(name, (kind, documentation, {}))
+            for labels, value in samples:
+                if kind == "counter":
+                    key = tuple(labels.items())
+                    family[2][key] = family[2].get(key, 0) + value
+                elif alive:
+                    family[2][tuple(labels.items()) + (("worker", str(pid)),)] = value
+    for name, (kind, documentation, samples) in families.items():
+        lines.extend(_render_family(name, kind, documentation, [(dict(key), value) for key, value in samples.items()]))
+    return "\n".join(lines) + "\n"
+
+
+# METRICS
+
+http_request_duration = Histogram(
+    "http_request_duration_seconds", "Request latency per Flask route", ["route", "method", "status"]
+)
+cache_requests = Counter(
+    "cache_requests_total", "Cache lookups by cache and result (hit / miss)", ["cache", "result"]
+)
+bad_appid_rejections = Counter(
+    "bad_appid_rejections_total", "Requests rejected by the BAD_APPIDS negative cache", ["reason"]
+)
+bigquery_jobs = Counter("bigquery_jobs_total", "BigQuery jobs by job name and status", ["job", "status"])
+bigquery_job_duration = Histogram("bigquery_job_duration_seconds", "BigQuery job duration", ["job"])
+bigquery_bytes_processed = Counter(
+    "bigquery_bytes_processed_total", "Bytes processed by BigQuery jobs", ["job"]
+)
+bigquery_rows = Counter("bigquery_rows_total", "Rows returned or written by BigQuery jobs", ["job"])
+upstream_request_duration = Histogram(
+    "upstream_request_duration_seconds", "Latency of Steam store / SteamCharts calls", ["host"]
+)
+upstream_errors = Counter("upstream_errors_total", "Failed Steam store / SteamCharts calls", ["host", "reason"])
+
+
+# Record one upstream call to url, reason None on success
+def observe_upstream(url, duration, reason=None):
+    host = urlsplit(url).netloc
+    upstream_request_duration.observe(duration, host)
+    if reason is not None:
+        upstream_errors.inc(host, reason)
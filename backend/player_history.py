@@ -0,0 +1,126 @@
+from datetime import datetime, timezone
+
+import numpy as np
+
+# Bounds for points= on the playercount endpoint
+MIN_POINTS = 3
+MAX_POINTS = 5000
+
+
+# Parse from/to argument: epoch milliseconds or ISO date ("2024-01-31")
+# Output: epoch milliseconds, raises ValueError on bad input
+def parse_time_arg(value):
+    if value is None or value == "":
+        return None
+    if value.lstrip("-").isdigit():
+        return int(value)
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return int(parsed.timestamp() * 1000)
+
+
+# Largest-Triangle-Three-Buckets downsampling
+# Keeps first and last point and the visually most significant point of every bucket
+# Output: indexes of the kept points (points >= 3)
+def lttb_indexes(timestamps, counts, points):
+    size = len(timestamps)
+    if points >= size:
+        return np.arange(size)
+
+    x = timestamps.astype(np.float64)
+    y = counts.astype(np.float64)
+    edges = np.linspace(1, size - 1, points - 1).astype(np.int64)
+
+    kept = np.empty(points, dtype=np.int64)
+    kept[0] = 0
+    kept[-1] = size - 1
+    previous = 0
+    for i in range(points - 2):
+        start, end = edges[i], edges[i + 1]
+        # Average of the next bucket (last point for the final bucket)
+        next_end = edges[i + 2] if i + 2 < len(edges) else size
+        next_x = x[end:next_end].mean()
+        next_y = y[end:next_end].mean()
+        # Triangle area between previous kept point, candidate and next bucket average
+        areas = np.abs(
+            (x[previous] - next_x) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (next_y - y[previous])
+        )
+        previous = start + int(np.argmax(areas))
+        kept[i + 1] = previous
+    return kept
+
+
+# Player count history stored as columns: int64 epoch ms timestamps, int32 counts
+class PlayerHistory:
+    def __init__(self, appid, name, timestamps, counts):
+        self.appid = appid
+        self.name = name
+        self.timestamps = timestamps
+        self.counts = counts
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    # Parse "ts count, ts count, ..." string from the history table
+    @classmethod
+    def from_string(cls, appid, name, date_playerscount):
+        text = date_playerscount if isinstance(date_playerscount, str) else ""
+        try:
+            values = np.array(text.replace(",", " ").split(), dtype=np.int64).reshape(-1, 2)
+        except ValueError:
+            # Slow path for malformed entries (e.g. "ts None"), skip them
+            pairs = []
+            for entry in text.split(", "):
+                parts = entry.split(" ")
+                try:
+                    pairs.append((int(parts[0]), int(float(parts[1]))))
+                except (IndexError, ValueError):
+                    continue
+            values = np.array(pairs, dtype=np.int64).reshape(-1, 2)
+
+        order = np.argsort(values[:, 0], kind="stable")
+        return cls(
+            int(appid),
+            name if isinstance(name, str) else "",
+            values[order, 0].copy(),
+            values[order, 1].astype(np.int32),
+        )
+
+    # Parse a row with appid, name, date_playerscount
+    @classmethod
+    def from_row(cls, row):
+        return cls.from_string(row["appid"], row.get("name"), row.get("date_playerscount"))
+
+    # Points within [from_ts, to_ts] (epoch ms, None -> open)
+    def between(self, from_ts=None, to_ts=None):
+        start = 0 if from_ts is None else int(np.searchsorted(self.timestamps, from_ts, side="left"))
+        end = len(self) if to_ts is None else int(np.searchsorted(self.timestamps, to_ts, side="right"))
+        return PlayerHistory(self.appid, self.name, self.timestamps[start:end], self.counts[start:end])
+
+    # Downsample to at most `points` points with LTTB
+    def downsample(self, points):
+        if points is None or points >= len(self):
+            return self
+        kept = lttb_indexes(self.timestamps, self.counts, points)
+        return PlayerHistory(self.appid, self.name, self.timestamps[kept], self.counts[kept])
+
+    # Same row shape as the history table
+    def to_row(self):
+        return {
+            "appid": self.appid,
+            "name": self.name,
+            "date_playerscount": ", ".join(
+                f"{ts} {count}" for ts, count in zip(self.timestamps.tolist(), self.counts.tolist())
+            ),
+        }
+
+    # Columnar response
+    def to_columns(self):
+        return {
+            "appid": self.appid,
+            "name": self.name,
+            "timestamps": self.timestamps.tolist(),
+            "counts": self.counts.tolist(),
+        }
@@ -0,0 +1,77 @@
+import json
+
+import pyarrow as pa
+
+RANKING_FIELDS = ["rank", "appid", "concurrent_in_game", "name", "header_image"]
+
+
+# Joined ranking (ranking + metadata) built once per cache generation
+# Every entry is serialized to JSON once, pages are served by joining slices
+# The joined, serialized entries are published with the cache snapshot (to_tables / from_tables)
+class RankingSnapshot:
+    def __init__(self, generation, ranking, metadata_store):
+        self.generation = generation
+
+        all_metadata = metadata_store.get_many(game["appid"] for game in ranking)
+        games = []
+        for game in ranking:
+            metadata = all_metadata.get(int(game["appid"]))
+            if metadata is None:
+                continue
+            name = metadata.get("name")
+            header_image = metadata.get("header_image")
+            games.append({
+                "rank": int(game["rank"]),
+                "appid": int(game["appid"]),
+                "concurrent_in_game": int(game["concurrent_in_game"]),
+                "name": name if isinstance(name, str) else "Unknown",
+                "header_image": header_image if isinstance(header_image, str) else "",
+            })
+
+        self._set_games(games, [
+            json.dumps(game, ensure_ascii=False, separators=(",", ":")).encode("utf-8") for game in games
+        ])
+
+    def _set_games(self, games, encoded):
+        self.games = tuple(games)
+        self._encoded = tuple(encoded)
+        self._encoded_all = self._join(self._encoded)
+
+    def __len__(self):
+        return len(self.games)
+
+    # Arrow table of the joined entries and their JSON: {name: pyarrow.Table}
+    def to_tables(self):
+        columns = {field: [game[field] for game in self.games] for field in RANKING_FIELDS}
+        columns["encoded"] = pa.array(self._encoded, pa.binary())
+        return {"ranking_games": pa.table(columns)}
+
+    # Ranking from the table of to_tables, without joining and serializing again
+    @classmethod
+    def from_tables(cls, generation, tables):
+        table = tables["ranking_games"]
+        snapshot = cls.__new__(cls)
+        snapshot.generation = generation
+        snapshot._set_games(table.select(RANKING_FIELDS).to_pylist(), table.column("encoded").to_pylist())
+        return snapshot
+
+    @staticmethod
+    def _join(encoded):
+        return b"[" + b",".join(encoded) + b"]"
+
+    # JSON array bytes for games[offset:offset+limit] (limit None -> whole ranking)
+    def encode_slice(self, offset=0, limit=None):
+        if offset == 0 and (limit is None or limit >= len(self._encoded)):
+            return self._encoded_all
+        end = None if limit is None else offset + limit
+        return self._join(self._encoded[offset:end])
+
+    # JSON object bytes for one page with total count and generation
+    def encode_page(self, offset, limit):
+        header = json.dumps({
+            "generation": self.generation,
+            "total": len(self.games),
+            "offset": offset,
+            "limit": limit,
+        }, separators=(",", ":")).encode("utf-8")
+        return header[:-1] + b',"games":' + self.encode_slice(offset, limit) + b"}"
@@ -0,0 +1,206 @@
+import re
+from bisect import bisect_left
+from functools import reduce
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+# Minimum share of query trigrams a name must contain to count as a typo match
+FUZZY_MIN_SIMILARITY = 0.5
+
+_NON_ALNUM = re.compile(r"[^0-9a-z]+")
+
+# Normalized names only hold these characters, so a trigram is a number below len(ALPHABET) ** 3
+ALPHABET = " 0123456789abcdefghijklmnopqrstuvwxyz"
+GRAM_COUNT = len(ALPHABET) ** 3
+_SYMBOLS = np.zeros(256, dtype=np.int64)
+_SYMBOLS[np.frombuffer(ALPHABET.encode("ascii"), dtype=np.uint8)] = np.arange(len(ALPHABET))
+
+
+# Normalize game name / query: lowercase, punctuation -> single space
+def normalize_name(name):
+    if not isinstance(name, str):
+        return ""
+    return _NON_ALNUM.sub(" ", name.lower()).strip()
+
+
+# Trigrams of normalized text (padded so short words still produce some)
+def trigrams(text):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _gram_code(gram):
+    symbols = _SYMBOLS[np.frombuffer(gram.encode("ascii"), dtype=np.uint8)]
+    return int((symbols[0] * len(ALPHABET) + symbols[1]) * len(ALPHABET) + symbols[2])
+
+
+# Trigram postings of many normalized names at once
+# Output: (offsets, postings) - rows holding gram g are postings[offsets[g]:offsets[g + 1]], ascending
+def _build_postings(normalized):
+    padded = [f"  {name} " if name else "" for name in normalized]
+    lengths = np.fromiter((len(text) for text in padded), dtype=np.int64, count=len(padded))
+    symbols = _SYMBOLS[np.frombuffer("".join(padded).encode("ascii"), dtype=np.uint8)]
+    symbols = np.concatenate([symbols, [0, 0]])
+
+    # Position p starts a trigram if p + 2 is still inside the same name
+    rows = np.repeat(np.arange(len(padded), dtype=np.int64), lengths)
+    position = np.arange(len(rows)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    starts = np.flatnonzero(position <= np.repeat(lengths, lengths) - 3)
+    codes = (symbols[starts] * len(ALPHABET) + symbols[starts + 1]) * len(ALPHABET) + symbols[starts + 2]
+
+    # Sorted unique (gram, row) pairs
+    keys = np.sort(codes * max(len(padded), 1) + rows[starts])
+    first = np.ones(len(keys), dtype=bool)
+    first[1:] = keys[1:] != keys[:-1]
+    keys = keys[first]
+    grams = keys // max(len(padded), 1)
+    postings = (keys % max(len(padded), 1)).astype(np.int32)
+    offsets = np.searchsorted(grams, np.arange(GRAM_COUNT + 1)).astype(np.int64)
+    return offsets, postings
+
+
+# Unique rows, each with its lowest (best) tier
+def _best_tiers(rows, tiers):
+    order = np.lexsort((tiers, rows))
+    rows, tiers = rows[order], tiers[order]
+    first = np.ones(len(rows), dtype=bool)
+    first[1:] = rows[1:] != rows[:-1]
+    return rows[first], tiers[first]
+
+
+# Normalized names in alphabetical order, as a sequence for bisect
+class _SortedNames:
+    def __init__(self, normalized, order):
+        self.normalized = normalized
+        self.order = order
+
+    def __len__(self):
+        return len(self.order)
+
+    def __getitem__(self, i):
+        return self.normalized[int(self.order[i])].as_py()
+
+
+# Search index for game names
+# Built once per cache refresh from the Arrow metadata table and current player counts
+# Everything is kept in flat columnar arrays indexed by metadata table row, names / header images are only
+#  read from the table for the returned rows
+# - normalized names, sorted order and alphabetical rank for prefix lookups (bisect) and tie-breaks
+# - trigram -> rows postings (CSR) for substring and typo-tolerant matches
+# The arrays are published with the cache snapshot (to_tables / from_tables), so workers memory-map one copy
+class SearchIndex:
+    def __init__(self, table=None, player_counts=None):
+        player_counts = player_counts or {}
+        if table is None:
+            table = pa.table({"appid": pa.array([], pa.int64()), "name": pa.array([], pa.string()),
+                              "header_image": pa.array([], pa.string())})
+        self.table = table
+
+        normalized = [normalize_name(name) for name in table.column("name").to_pylist()]
+        self.normalized = pa.array(normalized, pa.string())
+        self.order = pc.sort_indices(self.normalized).to_numpy().astype(np.int32)
+        self.name_rank = np.empty(len(self.order), dtype=np.int32)
+        self.name_rank[self.order] = np.arange(len(self.order), dtype=np.int32)
+
+        appids = table.column("appid").to_pylist()
+        self.players = np.fromiter(
+            (player_counts.get(appid, 0) for appid in appids), dtype=np.int64, count=len(appids)
+        )
+
+        self.offsets, self.postings = _build_postings(normalized)
+        self._sorted = _SortedNames(self.normalized, self.order)
+        # Rows with an empty normalized name are never matched
+        self._searchable = len(normalized) - normalized.count("")
+
+    def __len__(self):
+        return self._searchable
+
+    # Arrow tables holding the index arrays: {name: pyarrow.Table}
+    def to_tables(self):
+        return {
+            "search_rows": pa.table({
+                "normalized": self.normalized,
+                "order": self.order,
+                "name_rank": self.name_rank,
+                "players": self.players,
+            }),
+            "search_postings": pa.table({"postings": self.postings}),
+            "search_offsets": pa.table({"offsets": self.offsets}),
+        }
+
+    # Index over table from the arrays of to_tables (e.g. memory-mapped), without copying them
+    # Output: SearchIndex or None if the arrays do not belong to table
+    @classmethod
+    def from_tables(cls, table, tables):
+        rows = tables["search_rows"].combine_chunks()
+        if rows.num_rows != table.num_rows:
+            return None
+        index = cls.__new__(cls)
+        index.table = table
+        index.normalized = rows.column("normalized").chunk(0) if rows.num_rows else pa.array([], pa.string())
+        index.order = rows.column("order").to_numpy()
+        index.name_rank = rows.column("name_rank").to_numpy()
+        index.players = rows.column("players").to_numpy()
+        index.postings = tables["search_postings"].column("postings").to_numpy()
+        index.offsets = tables["search_offsets"].column("offsets").to_numpy()
+        index._sorted = _SortedNames(index.normalized, index.order)
+        index._searchable = len(index.normalized) - pc.sum(pc.equal(index.normalized, "")).as_py() if len(index.order) else 0
+        return index
+
+    def _gram_rows(self, gram):
+        code = _gram_code(gram)
+        return self.postings[self.offsets[code]:self.offsets[code + 1]]
+
+    # Rows whose normalized name starts with prefix: exact matches plus the `limit` most played others
+    # (the whole contiguous range of sorted names is ranked, so short queries still find popular games)
+    def _prefix_matches(self, prefix, limit):
+        start = bisect_left(self._sorted, prefix)
+        end = bisect_left(self._sorted, prefix + "\uffff")
+        i = start
+        while i < end and self._sorted[i] == prefix:
+            i += 1
+        exact = self.order[start:i]
+        others = self.order[i:end]
+        if len(others) > limit:
+            others = others[np.lexsort((self.name_rank[others], -self.players[others]))[:limit]]
+        return exact, others
+
+    # Search games by name
+    # Ranking: exact name, prefix, substring, typo match - each tier by current players
+    def search(self, query, limit=20):
+        query = normalize_name(query)
+        if not query or limit <= 0:
+            return []
+
+        # Candidate rows and their tier (lower is better), a row keeps its best tier
+        exact, prefix = self._prefix_matches(query, limit)
+        rows = np.concatenate([exact, prefix]).astype(np.int64)
+        tiers = np.concatenate([np.zeros(len(exact), dtype=np.int8), np.ones(len(prefix), dtype=np.int8)])
+
+        if len(query) >= 3:
+            # Substring matches: rows holding every trigram of the query
+            inner = sorted((self._gram_rows(query[i:i + 3]) for i in range(len(query) - 2)), key=len)
+            matches = reduce(lambda a, b: np.intersect1d(a, b, assume_unique=True), inner[1:], inner[0])
+            if len(matches):
+                matches = matches[pc.match_substring(self.normalized.take(pa.array(matches)), query).to_numpy(
+                    zero_copy_only=False)]
+            rows, tiers = _best_tiers(
+                np.concatenate([rows, matches]), np.concatenate([tiers, np.full(len(matches), 2, dtype=np.int8)])
+            )
+
+            # Typo-tolerant matches, only when better tiers did not fill the page
+            if len(rows) < limit:
+                query_grams = trigrams(query)
+                matches, shared = np.unique(
+                    np.concatenate([self._gram_rows(gram) for gram in query_grams]), return_counts=True
+                )
+                matches = matches[shared >= FUZZY_MIN_SIMILARITY * len(query_grams)]
+                rows = np.concatenate([rows, matches])
+                tiers = np.concatenate([tiers, np.full(len(matches), 3, dtype=np.int8)])
+
+        rows, tiers = _best_tiers(rows, tiers)
+        ranked = rows[np.lexsort((self.name_rank[rows], -self.players[rows], tiers))[:limit]]
+
+        return self.table.select(["appid", "name", "header_image"]).take(pa.array(ranked)).to_pylist()
@@ -0,0 +1,68 @@
+import os
+import time
+
+from warm_snapshot import WARM_SNAPSHOT_DIR, WARM_SNAPSHOT_REMOTE_POLL, current_version, sync_remote_snapshot
+
+# How often a worker checks for a snapshot published by another worker
+SHARED_POLL_INTERVAL = 5
+# How long a worker without any snapshot waits for the builder to publish the first one
+SHARED_FIRST_WAIT = 120
+
+
+# Builder election for multi-worker serving (CACHE_MODE=shared)
+# The worker holding an exclusive lock on builder.lock refreshes from storage and publishes snapshots,
+# the OS releases the lock if that worker dies, so another worker takes over on its next refresh
+class BuilderLock:
+    def __init__(self, directory=WARM_SNAPSHOT_DIR):
+        self.directory = directory
+        self._file = None
+
+    def acquire(self):
+        if self._file is not None:
+            return True
+        import fcntl
+
+        os.makedirs(self.directory, exist_ok=True)
+        f = open(os.path.join(self.directory, "builder.lock"), "a")
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            return False
+        self._file = f
+        print(f"Worker {os.getpid()} is the cache builder.")
+        return True
+
+
+# Tracks which published snapshot version this worker serves
+class PublishedSnapshots:
+    def __init__(self, directory=WARM_SNAPSHOT_DIR):
+        self.directory = directory
+        self.loaded_version = None
+        self._checked_at = 0
+        self._synced_at = time.time()
+
+    # Published version differs from the one this worker serves
+    def has_new(self):
+        version = current_version(self.directory)
+        return version is not None and version != self.loaded_version
+
+    # Same as has_new, checked at most every SHARED_POLL_INTERVAL seconds
+    # (versions published by other instances are downloaded at most every WARM_SNAPSHOT_REMOTE_POLL seconds)
+    def poll(self):
+        if time.time() - self._checked_at < SHARED_POLL_INTERVAL:
+            return False
+        self._checked_at = time.time()
+        if time.time() - self._synced_at >= WARM_SNAPSHOT_REMOTE_POLL:
+            self._synced_at = time.time()
+            sync_remote_snapshot(self.directory)
+        return self.has_new()
+
+    # Wait up to timeout seconds for a new published version
+    def wait_for_new(self, timeout):
+        deadline = time.time() + timeout
+        while not self.has_new():
+            if time.time() >= deadline:
+                return False
+            time.sleep(0.5)
+        return True
@@ -0,0 +1,463 @@
+import csv
+import os
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+
+import pyarrow as pa
+
+import csv_calling
+import ingestion
+
+LOCAL_DB_PATH = os.getenv("LOCAL_DB_PATH", os.path.join(csv_calling.BASE_DIR, "GameStats.sqlite3"))
+
+fieldnames = [
+    "appid", "name", "header_image", "short_description", "developers",
+    "publishers", "release_date", "platforms", "price", "categories",
+    "genres", "website", "screenshots", "background"
+]
+
+# Ranking size, same as the BigQuery ranking query
+RANKING_LIMIT = 7000
+# Bound parameters per IN (...) query
+MAX_QUERY_PARAMS = 500
+
+SCHEMA = f"""
+    CREATE TABLE IF NOT EXISTS steam_metadata (
+        appid INTEGER PRIMARY KEY,
+        {", ".join(f"{field} TEXT" for field in fieldnames[1:])}
+    );
+    CREATE TABLE IF NOT EXISTS history_playercount (
+        appid INTEGER PRIMARY KEY,
+        name TEXT,
+        date_playerscount TEXT,
+        latest_ts INTEGER,
+        latest_players INTEGER
+    );
+    CREATE INDEX IF NOT EXISTS history_latest_players ON history_playercount (latest_players DESC);
+    CREATE TABLE IF NOT EXISTS history_points (
+        appid INTEGER,
+        ts INTEGER,
+        players INTEGER,
+        PRIMARY KEY (appid, ts)
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS all_steam_apps (
+        appid INTEGER PRIMARY KEY,
+        name TEXT
+    );
+    CREATE TABLE IF NOT EXISTS update_runs (
+        run_id TEXT PRIMARY KEY,
+        shards INTEGER,
+        full_rebuild INTEGER,
+        created_at REAL,
+        committed_at REAL
+    );
+    CREATE TABLE IF NOT EXISTS update_run_apps (
+        run_id TEXT,
+        appid INTEGER,
+        name TEXT,
+        PRIMARY KEY (run_id, appid)
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS update_shards (
+        run_id TEXT,
+        shard INTEGER,
+        attempt TEXT,
+        row_count INTEGER,
+        finished_at REAL,
+        PRIMARY KEY (run_id, shard)
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS history_staging (
+        run_id TEXT,
+        shard INTEGER,
+        attempt TEXT,
+        appid INTEGER,
+        name TEXT,
+        date_playerscount TEXT,
+        PRIMARY KEY (run_id, attempt, appid)
+    ) WITHOUT ROWID;
+"""
+
+_local = threading.local()
+
+
+# One connection per thread, WAL so readers never block on the writer
+def get_connection():
+    connection = getattr(_local, "connection", None)
+    if connection is None:
+        connection = sqlite3.connect(LOCAL_DB_PATH, timeout=30)
+        connection.row_factory = sqlite3.Row
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.executescript(SCHEMA)
+        _local.connection = connection
+    return connection
+
+
+# Last "ts count" point of a history string
+# Output: (ts, count) or (None, None)
+def _latest_point(date_playerscount):
+    if not date_playerscount:
+        return None, None
+    try:
+        ts, count = date_playerscount.rsplit(", ", 1)[-1].split(" ")
+        return int(ts), int(float(count))
+    except ValueError:
+        return None, None
+
+
+# All "ts count" points of a history string, malformed points skipped
+# Output: [(ts, count)]
+def _points(date_playerscount):
+    points = []
+    for entry in (date_playerscount or "").split(", "):
+        try:
+            ts, count = entry.split(" ")
+            points.append((int(ts), int(float(count))))
+        except ValueError:
+            continue
+    return points
+
+
+def _split_list_fields(row):
+    for data in fieldnames:
+        if data in ["platforms", "categories", "genres", "screenshots"]:
+            row[data] = row[data].split(", ") if row.get(data) else []
+    return row
+
+
+# Rows of `select` WHERE appid IN (...), chunked below SQLite's bound parameter limit
+def _select_by_appids(select, appids):
+    appids = [int(appid) for appid in appids]
+    rows = []
+    for start in range(0, len(appids), MAX_QUERY_PARAMS):
+        chunk = appids[start:start + MAX_QUERY_PARAMS]
+        placeholders = ", ".join("?" for _ in chunk)
+        rows.extend(get_connection().execute(f"{select} WHERE appid IN ({placeholders})", chunk).fetchall())
+    return rows
+
+
+# HISTORY PLAYERCOUNT CALLING
+
+def get_history_playercount_by_appid(appid):
+    return get_history_playercount_by_appids([appid]).get(int(appid))
+
+# Output: {appid: row} for the appids found
+# With HISTORY_POINTS the history strings are assembled from history_points, like the BigQuery backend
+def get_history_playercount_by_appids(appids):
+    if not ingestion.HISTORY_POINTS:
+        rows = _select_by_appids("SELECT appid, name, date_playerscount FROM history_playercount", appids)
+        return {row["appid"]: dict(row) for row in rows}
+
+    names = {row["appid"]: row["name"] for row in _select_by_appids(
+        "SELECT appid, name FROM history_playercount", appids
+    )}
+    points = {}
+    for row in _select_by_appids("SELECT appid, ts, players FROM history_points", appids):
+        points.setdefault(row["appid"], []).append(f"{row['ts']} {row['players']}")
+    return {
+        appid: {"appid": appid, "name": names.get(appid), "date_playerscount": ", ".join(values)}
+        for appid, values in points.items()
+    }
+
+def add_history_playercount(data):
+    upsert_history_playercount([data])
+
+# Batch upsert of history rows
+# append=True - date_playerscount holds only new points and is appended to the stored history
+def upsert_history_playercount(rows, append=False):
+    with get_connection() as connection:
+        _upsert_history(connection, rows, append)
+
+# Upsert within the caller's transaction
+def _upsert_history(connection, rows, append):
+    params = []
+    for row in rows:
+        latest_ts, latest_players = _latest_point(row["date_playerscount"])
+        params.append((int(row["appid"]), row.get("name"), row["date_playerscount"], latest_ts, latest_players))
+
+    if append:
+        history = """
+            CASE WHEN history_playercount.date_playerscount IS NULL OR history_playercount.date_playerscount = ''
+                THEN excluded.date_playerscount
+                ELSE history_playercount.date_playerscount || ', ' || excluded.date_playerscount
+            END
+        """
+    else:
+        history = "excluded.date_playerscount"
+
+    if ingestion.HISTORY_POINTS:
+        if not append:
+            connection.executemany("DELETE FROM history_points WHERE appid = ?", [(param[0],) for param in params])
+        connection.executemany(
+            "INSERT OR REPLACE INTO history_points (appid, ts, players) VALUES (?, ?, ?)",
+            [
+                (int(row["appid"]), ts, players)
+                for row in rows for ts, players in _points(row["date_playerscount"])
+            ],
+        )
+    connection.executemany(f"""
+        INSERT INTO history_playercount (appid, name, date_playerscount, latest_ts, latest_players)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT (appid) DO UPDATE SET
+            name = excluded.name,
+            date_playerscount = {history},
+            latest_ts = COALESCE(excluded.latest_ts, history_playercount.latest_ts),
+            latest_players = COALESCE(excluded.latest_players, history_playercount.latest_players)
+    """, params)
+
+# Last ingested timestamp per appid
+def get_last_history_timestamps():
+    rows = get_connection().execute(
+        "SELECT appid, latest_ts FROM history_playercount WHERE latest_ts IS NOT NULL"
+    ).fetchall()
+    return {row["appid"]: row["latest_ts"] for row in rows}
+
+# Top games by latest player count, served from the indexed latest_players column
+def get_current_history_playercount_sorted(limit=RANKING_LIMIT):
+    rows = get_connection().execute("""
+        SELECT appid, name, latest_players AS concurrent_in_game
+        FROM history_playercount
+        WHERE latest_players IS NOT NULL
+        ORDER BY latest_players DESC
+        LIMIT ?
+    """, (limit,)).fetchall()
+    return [dict(row) for row in rows]
+
+
+# METADATA CALLING
+
+def get_all_metadata():
+    rows = get_connection().execute("SELECT * FROM steam_metadata ORDER BY appid ASC").fetchall()
+    return [dict(row) for row in rows]
+
+# Whole metadata table as a pyarrow.Table, built column by column
+def get_all_metadata_table():
+    cursor = get_connection().execute(f"SELECT {', '.join(fieldnames)} FROM steam_metadata ORDER BY appid ASC")
+    columns = list(zip(*cursor.fetchall())) or [()] * len(fieldnames)
+    return pa.table({
+        field: pa.array(column, pa.int64() if field == "appid" else pa.string())
+        for field, column in zip(fieldnames, columns)
+    })
+
+def get_metadata_by_appid(appid):
+    row = get_connection().execute(
+        "SELECT * FROM steam_metadata WHERE appid = ?", (int(appid),)
+    ).fetchone()
+    return _split_list_fields(dict(row)) if row is not None else None
+
+# Output: {appid: row} for the appids found
+def get_metadata_by_appids(appids):
+    rows = _select_by_appids("SELECT * FROM steam_metadata", appids)
+    return {row["appid"]: _split_list_fields(dict(row)) for row in rows}
+
+def add_metadata(data):
+    upsert_metadata([data])
+    return data
+
+# Batch upsert of metadata rows
+def upsert_metadata(rows):
+    columns = ", ".join(fieldnames)
+    placeholders = ", ".join("?" for _ in fieldnames)
+    updates = ", ".join(f"{field} = excluded.{field}" for field in fieldnames[1:])
+    with get_connection() as connection:
+        connection.executemany(
+            f"INSERT INTO steam_metadata ({columns}) VALUES ({placeholders}) "
+            f"ON CONFLICT (appid) DO UPDATE SET {updates}",
+            [tuple(row.get(field) for field in fieldnames) for row in rows],
+        )
+    return True
+
+# Fetches store details for appids missing from the metadata table and upserts them in one batch
+# Output: {appid: {"status": "ok", "data": row} | {"status": "failed", "reason": reason}}
+def backfill_metadata(appids):
+    results = ingestion.fetch_store_metadata(appids)
+    rows = [result["data"] for result in results.values() if result["status"] == "ok"]
+    if rows:
+        upsert_metadata(rows)
+    return results
+
+
+# SHARDED UPDATE RUNS (same shape as the BigQuery functions, see update_job.py)
+
+# The local "lock" is the open run itself: the update is only started when no run is open
+# (start_update_run checks again within its write transaction, so concurrent callers plan one run)
+def try_acquire_lock():
+    return get_open_update_run() is None
+
+def release_lock():
+    pass
+
+def enqueue_update_shard(run_id, shard):
+    raise ValueError("Cloud Tasks dispatch needs the bigquery backend")
+
+def _run_from_row(row):
+    return {
+        "run_id": row["run_id"],
+        "shards": row["shards"],
+        "full_rebuild": bool(row["full_rebuild"]),
+        "committed": row["committed_at"] is not None,
+    }
+
+# Plans a new update run: the apps of the local metadata table plus newly ranked apps
+# An open run is returned as is, the ranked apps are only crawled / backfilled when a run is planned
+# The open run check is repeated with the insert in one BEGIN IMMEDIATE transaction, so of concurrent callers
+#  only the first plans a run and the others get that run back
+def start_update_run(full_rebuild, shards):
+    run = get_open_update_run()
+    if run is not None:
+        print(f"Update run {run['run_id']} is already open, not planning another one.")
+        return run
+
+    rows = get_connection().execute("SELECT appid, name FROM steam_metadata").fetchall()
+    apps = ingestion.add_new_ranked_apps([dict(row) for row in rows], backfill_metadata)
+    run_id = f"{int(time.time())}-{uuid.uuid4().hex[:8]}"
+    with get_connection() as connection:
+        connection.execute("BEGIN IMMEDIATE")
+        row = connection.execute(
+            "SELECT * FROM update_runs WHERE committed_at IS NULL ORDER BY created_at DESC LIMIT 1"
+        ).fetchone()
+        if row is not None:
+            print(f"Update run {row['run_id']} is already open, not planning another one.")
+            return _run_from_row(row)
+        connection.executemany(
+            "INSERT OR REPLACE INTO update_run_apps (run_id, appid, name) VALUES (?, ?, ?)",
+            [(run_id, int(app["appid"]), app["name"]) for app in apps],
+        )
+        connection.execute(
+            "INSERT INTO update_runs (run_id, shards, full_rebuild, created_at) VALUES (?, ?, ?, ?)",
+            (run_id, shards, int(full_rebuild), time.time()),
+        )
+    print(f"Update run {run_id} planned: {len(apps)} apps in {shards} shards.")
+    return {"run_id": run_id, "shards": shards, "full_rebuild": full_rebuild, "committed": False}
+
+def get_update_run(run_id):
+    row = get_connection().execute("SELECT * FROM update_runs WHERE run_id = ?", (run_id,)).fetchone()
+    return _run_from_row(row) if row is not None else None
+
+# Newest run that was not committed (to resume) or None
+def get_open_update_run():
+    row = get_connection().execute(
+        "SELECT * FROM update_runs WHERE committed_at IS NULL ORDER BY created_at DESC LIMIT 1"
+    ).fetchone()
+    return _run_from_row(row) if row is not None else None
+
+# run_id of the newest committed run or None, identifies the stored player count histories
+def get_last_committed_update_run_id():
+    row = get_connection().execute(
+        "SELECT run_id FROM update_runs WHERE committed_at IS NOT NULL ORDER BY committed_at DESC LIMIT 1"
+    ).fetchone()
+    return row["run_id"] if row is not None else None
+
+# Apps of one shard (appid % shards == shard)
+def get_update_run_apps(run_id, shards, shard):
+    rows = get_connection().execute(
+        "SELECT appid, name FROM update_run_apps WHERE run_id = ? AND appid % ? = ?", (run_id, shards, shard)
+    ).fetchall()
+    return [dict(row) for row in rows]
+
+def get_finished_update_shards(run_id):
+    rows = get_connection().execute("SELECT shard FROM update_shards WHERE run_id = ?", (run_id,)).fetchall()
+    return {row["shard"] for row in rows}
+
+# Stages a batch of crawled rows of one shard attempt (called while the shard is crawled)
+# The commit only reads the checkpointed attempt of every shard, rows of abandoned attempts are ignored
+def stage_update_rows(run_id, shard, attempt, rows):
+    with get_connection() as connection:
+        connection.executemany(
+            "INSERT OR REPLACE INTO history_staging (run_id, shard, attempt, appid, name, date_playerscount) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            [(run_id, shard, attempt, int(row["appid"]), row["name"], row["date_playerscount"]) for row in rows],
+        )
+
+# Checkpoints a shard once every row of attempt is staged
+def checkpoint_update_shard(run_id, shard, attempt, row_count):
+    with get_connection() as connection:
+        connection.execute(
+            "INSERT OR REPLACE INTO update_shards (run_id, shard, attempt, row_count, finished_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (run_id, shard, attempt, row_count, time.time()),
+        )
+
+# Applies the staged rows of a finished run in one transaction and marks it committed
+# Output: True if committed by this call, False if the run was already committed
+def commit_update_run(run):
+    run_id = run["run_id"]
+    with get_connection() as connection:
+        marked = connection.execute(
+            "UPDATE update_runs SET committed_at = ? WHERE run_id = ? AND committed_at IS NULL",
+            (time.time(), run_id),
+        ).rowcount
+        if marked != 1:
+            return False
+
+        rows = connection.execute(
+            """
+            SELECT s.appid, s.name, s.date_playerscount
+            FROM history_staging AS s
+            JOIN update_shards AS c ON c.run_id = s.run_id AND c.shard = s.shard AND c.attempt = s.attempt
+            WHERE s.run_id = ?
+            """,
+            (run_id,),
+        ).fetchall()
+        if run["full_rebuild"]:
+            connection.execute("DELETE FROM history_playercount")
+            connection.execute("DELETE FROM history_points")
+        _upsert_history(connection, [dict(row) for row in rows], append=not run["full_rebuild"])
+        connection.execute("DELETE FROM history_staging WHERE run_id = ?", (run_id,))
+        connection.execute("DELETE FROM update_run_apps WHERE run_id = ?", (run_id,))
+    print(f"Update run {run_id} committed.")
+    return True
+
+
+# Migration from the string-only schema: recomputes the latest columns and, with HISTORY_POINTS,
+#  history_points from the history strings (same role as BQ_migrate_history_tables)
+def migrate_history_tables():
+    rows = get_connection().execute("SELECT appid, name, date_playerscount FROM history_playercount").fetchall()
+    with get_connection() as connection:
+        connection.execute("DELETE FROM history_points")
+    upsert_history_playercount([dict(row) for row in rows])
+    print(f"History tables rebuilt for {len(rows)} apps.")
+
+
+# ALL APPLIST CALLING
+
+def get_all_steam_games():
+    rows = get_connection().execute("SELECT appid, name FROM all_steam_apps").fetchall()
+    return [dict(row) for row in rows]
+
+def upsert_steam_games(rows):
+    with get_connection() as connection:
+        connection.executemany(
+            "INSERT OR REPLACE INTO all_steam_apps (appid, name) VALUES (?, ?)",
+            [(int(row["appid"]), row["name"]) for row in rows],
+        )
+
+
+# IMPORT FROM CSV FILES
+
+# Loads the CSV files of csv_calling into the local database
+def import_csv_files():
+    sources = [
+        (csv_calling.CSV_FILE_METADATA, upsert_metadata),
+        (csv_calling.CSV_FILE_ALL_HISTORY, upsert_history_playercount),
+        (csv_calling.CSV_FILE_ALL_APPLIST, upsert_steam_games),
+    ]
+    for path, upsert in sources:
+        if not os.path.isfile(path):
+            print(f"Skipping missing file {path}")
+            continue
+        with open(path, "r", encoding="utf-8") as f:
+            rows = [row for row in csv.DictReader(f) if row.get("appid", "").isdigit()]
+        upsert(rows)
+        print(f"Imported {len(rows)} rows from {os.path.basename(path)}")
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["import"]:
+        import_csv_files()
+    elif sys.argv[1:] == ["migrate"]:
+        migrate_history_tables()
+    else:
+        print("Usage: python sqlite_calling.py import|migrate")
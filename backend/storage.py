@@ -0,0 +1,70 @@
+import os
+
+from dotenv import load_dotenv
+
+# Storage backend selection: "bigquery" (default) or "local" (SQLite, see sqlite_calling)
+load_dotenv()
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "bigquery")
+
+
+if STORAGE_BACKEND == "local":
+    import sqlite_calling
+
+    get_all_metadata = sqlite_calling.get_all_metadata
+    get_all_metadata_table = sqlite_calling.get_all_metadata_table
+    get_metadata_by_appid = sqlite_calling.get_metadata_by_appid
+    get_metadata_by_appids = sqlite_calling.get_metadata_by_appids
+    add_metadata = sqlite_calling.add_metadata
+    backfill_metadata = sqlite_calling.backfill_metadata
+
+    # Same shape as BigQuery: list of rows
+    def get_history_playercount_by_appid(appid):
+        row = sqlite_calling.get_history_playercount_by_appid(appid)
+        return [row] if row is not None else []
+
+    get_history_playercount_by_appids = sqlite_calling.get_history_playercount_by_appids
+    migrate_history_tables = sqlite_calling.migrate_history_tables
+    get_current_history_playercount_sorted = sqlite_calling.get_current_history_playercount_sorted
+    get_last_history_timestamps = sqlite_calling.get_last_history_timestamps
+    try_acquire_lock = sqlite_calling.try_acquire_lock
+    release_lock = sqlite_calling.release_lock
+    start_update_run = sqlite_calling.start_update_run
+    get_open_update_run = sqlite_calling.get_open_update_run
+    get_last_committed_update_run_id = sqlite_calling.get_last_committed_update_run_id
+    get_update_run = sqlite_calling.get_update_run
+    get_update_run_apps = sqlite_calling.get_update_run_apps
+    get_finished_update_shards = sqlite_calling.get_finished_update_shards
+    stage_update_rows = sqlite_calling.stage_update_rows
+    checkpoint_update_shard = sqlite_calling.checkpoint_update_shard
+    commit_update_run = sqlite_calling.commit_update_run
+    enqueue_update_shard = sqlite_calling.enqueue_update_shard
+
+elif STORAGE_BACKEND == "bigquery":
+    import bigquery_calling
+
+    get_all_metadata = bigquery_calling.BQ_get_all_metadata
+    get_all_metadata_table = bigquery_calling.BQ_get_all_metadata_table
+    get_metadata_by_appid = bigquery_calling.BQ_get_metadata_by_appid
+    get_metadata_by_appids = bigquery_calling.BQ_get_metadata_by_appids
+    add_metadata = bigquery_calling.BQ_add_metadata
+    backfill_metadata = bigquery_calling.BQ_backfill_metadata
+    get_history_playercount_by_appid = bigquery_calling.BQ_get_history_playercount_by_appid
+    get_history_playercount_by_appids = bigquery_calling.BQ_get_history_playercount_by_appids
+    migrate_history_tables = bigquery_calling.BQ_migrate_history_tables
+    get_current_history_playercount_sorted = bigquery_calling.BQ_get_current_history_playercount_sorted
+    get_last_history_timestamps = bigquery_calling.BQ_get_last_history_timestamps
+    try_acquire_lock = bigquery_calling.try_acquire_lock
+    release_lock = bigquery_calling.release_lock
+    start_update_run = bigquery_calling.BQ_start_update_run
+    get_open_update_run = bigquery_calling.BQ_get_open_update_run
+    get_last_committed_update_run_id = bigquery_calling.BQ_get_last_committed_update_run_id
+    get_update_run = bigquery_calling.BQ_get_update_run
+    get_update_run_apps = bigquery_calling.BQ_get_update_run_apps
+    get_finished_update_shards = bigquery_calling.BQ_get_finished_update_shards
+    stage_update_rows = bigquery_calling.BQ_stage_update_rows
+    checkpoint_update_shard = bigquery_calling.BQ_checkpoint_update_shard
+    commit_update_run = bigquery_calling.BQ_commit_update_run
+    enqueue_update_shard = bigquery_calling.enqueue_update_shard
+
+else:
+    raise ValueError(f"Unknown STORAGE_BACKEND {STORAGE_BACKEND!r}, expected 'bigquery' or 'local'")
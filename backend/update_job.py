@@ -0,0 +1,69 @@
+import os
+import time
+import uuid
+
+import ingestion
+import storage
+
+# Apps of a run are split into UPDATE_SHARDS shards by appid % shards
+UPDATE_SHARDS = int(os.getenv("UPDATE_SHARDS", "16"))
+# "inline" - /update-task crawls the pending shards itself
+# "tasks" - /update-task enqueues one Cloud Task per pending shard (POST /update-task/shard),
+#  so shards run in parallel across instances
+UPDATE_DISPATCH = os.getenv("UPDATE_DISPATCH", "inline")
+# Inline crawling stops starting shards after this many seconds, the next /update-task resumes the run
+UPDATE_TIME_BUDGET = float(os.getenv("UPDATE_TIME_BUDGET", str(45 * 60)))
+
+
+# Resumes the open update run or, holding the update lock, plans a new one
+# The lock is held from planning until the run is committed (see commit_if_finished)
+# Output: (run, resumed) or (None, False) if the lock is taken / the update is not due
+def start_or_resume_run(full_rebuild=False, shards=UPDATE_SHARDS):
+    run = storage.get_open_update_run()
+    if run is not None:
+        return run, True
+
+    if not storage.try_acquire_lock():
+        return None, False
+    try:
+        return storage.start_update_run(full_rebuild, shards), False
+    except Exception:
+        storage.release_lock()
+        raise
+
+# Shards of run without a checkpoint
+def pending_shards(run):
+    finished = storage.get_finished_update_shards(run["run_id"])
+    return [shard for shard in range(run["shards"]) if shard not in finished]
+
+# Crawls the history of one shard, staging rows in batches as they complete, then checkpoints it
+# full_rebuild runs crawl the whole history, incremental runs only points newer than the stored ones
+# Output: number of staged rows or None if the shard was already checkpointed
+def run_shard(run, shard):
+    run_id = run["run_id"]
+    if shard in storage.get_finished_update_shards(run_id):
+        return None
+
+    apps = storage.get_update_run_apps(run_id, run["shards"], shard)
+    last_timestamps = {} if run["full_rebuild"] else storage.get_last_history_timestamps()
+    # Rows of an attempt that fails before its checkpoint are never committed
+    attempt = uuid.uuid4().hex
+    started = time.perf_counter()
+    staged = ingestion.crawl_history_deltas(
+        apps, last_timestamps, lambda rows: storage.stage_update_rows(run_id, shard, attempt, rows)
+    )
+    storage.checkpoint_update_shard(run_id, shard, attempt, staged)
+    print(f"Update run {run_id}: shard {shard + 1}/{run['shards']} staged {staged} of "
+          f"{len(apps)} apps in {time.perf_counter() - started:.1f}s.")
+    return staged
+
+# Commits run once every shard is checkpointed and releases the update lock
+# Output: True if this call committed the run
+def commit_if_finished(run):
+    if pending_shards(run):
+        return False
+    committed = storage.commit_update_run(run)
+    # Only the call that committed releases the lock, a concurrent finisher must not
+    if committed:
+        storage.release_lock()
+    return committed
@@ -0,0 +1,207 @@
+import json
+import os
+import shutil
+import time
+
+import pyarrow as pa
+import pyarrow.fs as pafs
+import pyarrow.ipc as ipc
+
+import csv_calling
+
+# Directory holding persisted cache snapshots, the files are memory-mapped from here
+WARM_SNAPSHOT_DIR = os.getenv("WARM_SNAPSHOT_DIR", os.path.join(csv_calling.BASE_DIR, "warm_snapshot"))
+# Optional storage shared by all instances (e.g. gs://bucket/warm_snapshot), published versions are uploaded
+# there and instances download newer ones into WARM_SNAPSHOT_DIR, so new instances start warm
+WARM_SNAPSHOT_URI = os.getenv("WARM_SNAPSHOT_URI", "")
+# How often the shared storage is checked for a newer version
+WARM_SNAPSHOT_REMOTE_POLL = float(os.getenv("WARM_SNAPSHOT_REMOTE_POLL", "60"))
+# Bumped when the on-disk layout changes, older snapshots are ignored
+WARM_SNAPSHOT_FORMAT = 3
+# Number of snapshot versions kept on disk
+WARM_SNAPSHOT_VERSIONS = 2
+
+CURRENT_FILE = "CURRENT"
+
+
+# rows - pyarrow.Table or list of row dicts
+def _write_table(path, rows):
+    table = rows if isinstance(rows, pa.Table) else pa.Table.from_pylist(rows)
+    with pa.OSFile(path, "wb") as sink:
+        with ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+
+
+def _read_table(path):
+    with pa.memory_map(path, "r") as source:
+        return ipc.open_file(source).read_all()
+
+
+def _generation(version):
+    return int(version[1:]) if version and version[1:].isdigit() else 0
+
+
+# (filesystem, path) of WARM_SNAPSHOT_URI
+def _remote():
+    return pafs.FileSystem.from_uri(WARM_SNAPSHOT_URI)
+
+
+# Point CURRENT at version and keep the newest versions only
+def _switch_current(directory, version):
+    current_tmp = os.path.join(directory, f"{CURRENT_FILE}.{os.getpid()}.tmp")
+    with open(current_tmp, "w", encoding="utf-8") as f:
+        f.write(version)
+    os.replace(current_tmp, os.path.join(directory, CURRENT_FILE))
+
+    versions = sorted(
+        (name for name in os.listdir(directory) if name.startswith("v") and not name.endswith(".tmp")),
+        key=_generation,
+    )
+    for name in versions[:-WARM_SNAPSHOT_VERSIONS]:
+        if name != version:
+            shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+
+
+# Upload a local version to WARM_SNAPSHOT_URI, CURRENT last so readers never see a partial version
+def _upload_version(directory, version):
+    started = time.monotonic()
+    try:
+        fs, root = _remote()
+        fs.create_dir(f"{root}/{version}")
+        pafs.copy_files(os.path.join(directory, version), f"{root}/{version}",
+                        source_filesystem=pafs.LocalFileSystem(), destination_filesystem=fs)
+        with fs.open_output_stream(f"{root}/{CURRENT_FILE}") as f:
+            f.write(version.encode("utf-8"))
+
+        # Keep the newest versions only
+        versions = sorted(
+            (info.base_name for info in fs.get_file_info(pafs.FileSelector(root))
+             if info.type == pafs.FileType.Directory and info.base_name.startswith("v")),
+            key=_generation,
+        )
+        for name in versions[:-WARM_SNAPSHOT_VERSIONS]:
+            if name != version:
+                fs.delete_dir(f"{root}/{name}")
+    except Exception as e:
+        print(f"Error uploading warm snapshot {version} to {WARM_SNAPSHOT_URI}: {e}")
+        return
+    print(f"Warm snapshot {version} uploaded to {WARM_SNAPSHOT_URI} in {time.monotonic() - started:.2f}s.")
+
+
+# Download the version published in WARM_SNAPSHOT_URI if it is newer than the local one
+# Output: True if the local CURRENT was switched
+def sync_remote_snapshot(directory=WARM_SNAPSHOT_DIR):
+    if not WARM_SNAPSHOT_URI:
+        return False
+    started = time.monotonic()
+    try:
+        fs, root = _remote()
+        try:
+            with fs.open_input_stream(f"{root}/{CURRENT_FILE}") as f:
+                version = f.read().decode("utf-8").strip()
+        except FileNotFoundError:
+            return False
+        if _generation(version) <= _generation(current_version(directory)):
+            return False
+
+        target = os.path.join(directory, version)
+        if not os.path.isdir(target):
+            # Workers of one instance may download the same version at once, the first one to finish wins
+            staging = os.path.join(directory, f"{version}.{os.getpid()}.tmp")
+            shutil.rmtree(staging, ignore_errors=True)
+            os.makedirs(staging)
+            pafs.copy_files(f"{root}/{version}", staging,
+                            source_filesystem=fs, destination_filesystem=pafs.LocalFileSystem())
+            try:
+                os.replace(staging, target)
+            except OSError:
+                shutil.rmtree(staging, ignore_errors=True)
+        _switch_current(directory, version)
+    except Exception as e:
+        print(f"Error downloading warm snapshot from {WARM_SNAPSHOT_URI}: {e}")
+        return False
+    print(f"Warm snapshot {version} downloaded from {WARM_SNAPSHOT_URI} in {time.monotonic() - started:.2f}s.")
+    return True
+
+
+# Persist ranking rows, the metadata table, the analytics table and derived index tables
+#  ({name: pyarrow.Table}, e.g. SearchIndex.to_tables) as Arrow IPC files in a new version directory
+# CURRENT is switched atomically once every file is written, so readers never see a partial version
+# Output: version name
+def save_warm_snapshot(generation, fetched_at, ranking, metadata, analytics, indexes=None, history_version=None,
+                       directory=WARM_SNAPSHOT_DIR):
+    indexes = indexes or {}
+    version = f"v{generation}"
+    os.makedirs(directory, exist_ok=True)
+    staging = os.path.join(directory, f"{version}.tmp")
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+
+    _write_table(os.path.join(staging, "ranking.arrow"), ranking)
+    _write_table(os.path.join(staging, "metadata.arrow"), metadata)
+    _write_table(os.path.join(staging, "analytics.arrow"), analytics)
+    for name, table in indexes.items():
+        _write_table(os.path.join(staging, f"{name}.arrow"), table)
+    with open(os.path.join(staging, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump({
+            "format": WARM_SNAPSHOT_FORMAT,
+            "generation": generation,
+            "fetched_at": fetched_at,
+            "history_version": history_version,
+            "indexes": sorted(indexes),
+        }, f)
+
+    target = os.path.join(directory, version)
+    shutil.rmtree(target, ignore_errors=True)
+    os.replace(staging, target)
+
+    _switch_current(directory, version)
+    print(f"Warm snapshot {version} saved ({len(ranking)} ranked, {metadata.num_rows} metadata rows).")
+    if WARM_SNAPSHOT_URI:
+        _upload_version(directory, version)
+    return version
+
+
+# Version name of the current persisted snapshot or None
+def current_version(directory=WARM_SNAPSHOT_DIR):
+    try:
+        with open(os.path.join(directory, CURRENT_FILE), "r", encoding="utf-8") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+# Load the current persisted snapshot (a newer one from WARM_SNAPSHOT_URI is downloaded first)
+# Tables are memory-mapped, so processes loading the same version share their pages
+# Output: {"version", "generation", "fetched_at", "history_version", "ranking" (rows), "metadata",
+#  "analytics" (pyarrow.Table), "indexes" ({name: pyarrow.Table})} or None if missing / unreadable
+def load_warm_snapshot(directory=WARM_SNAPSHOT_DIR):
+    sync_remote_snapshot(directory)
+    try:
+        version = current_version(directory)
+        if version is None:
+            return None
+        path = os.path.join(directory, version)
+        with open(os.path.join(path, "manifest.json"), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("format") != WARM_SNAPSHOT_FORMAT:
+            print(f"Ignoring warm snapshot {path}, format {manifest.get('format')}.")
+            return None
+        snapshot = {
+            "version": version,
+            "generation": manifest["generation"],
+            "fetched_at": manifest["fetched_at"],
+            "history_version": manifest.get("history_version"),
+            "ranking": _read_table(os.path.join(path, "ranking.arrow")).to_pylist(),
+            "metadata": _read_table(os.path.join(path, "metadata.arrow")),
+            "analytics": _read_table(os.path.join(path, "analytics.arrow")),
+            "indexes": {
+                name: _read_table(os.path.join(path, f"{name}.arrow")) for name in manifest.get("indexes", [])
+            },
+        }
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"Error loading warm snapshot: {e}")
+        return None
+    return snapshot
@@ -18,6 +18,19 @@ export const fetchGameHistory = async (appid: string | undefined) => {
     if (!res.ok) throw new Error('Failed to fetch');
     return res.json();
 };
+
+export const fetchGameStats = async (appid: string | undefined) => {
+    const res = await fetch(API_URL + "steam/game/" + appid + "/stats");
+    if (!res.ok) throw new Error('Failed to fetch');
+    return res.json();
+};
+
+// window: 24h | 7d | 30d, by: percent | absolute
+export const fetchTrending = async (window = "7d", by = "percent", limit = 50) => {
+    const res = await fetch(API_URL + `trending?window=${window}&by=${by}&limit=${limit}`);
+    if (!res.ok) throw new Error('Failed to fetch');
+    return res.json();
+};
   
 export const searchForGamesAllList = async () => {
     const res = await fetch(API_URL + "steam/getallgameslist");
@@ -31,13 +44,45 @@ export const searchForGames = async (query: string | undefined) => {
     return res.json();
 };
 
+// The metadata export can contain NaN, which is not valid JSON
+const parseMetadataJson = (text: string) => JSON.parse(text.replace(/\bNaN\b/g, 'null'));
+
+const METADATA_ANALYSE_FIELDS = "appid,name,developers,publishers,release_date,platforms,categories,genres";
+
 export const fetchAllGamesMetadata = async () => {
-    const res = await fetch(API_URL + "steam/allmetadata");
+    const res = await fetch(API_URL + "steam/allmetadata?fields=" + METADATA_ANALYSE_FIELDS);
     if (!res.ok) throw new Error('Failed to fetch');
+    return parseMetadataJson(await res.text());
+};
+
+// One page of the metadata export, cursor is the last appid of the previous page
+export const fetchGamesMetadataPage = async (cursor: number | undefined, limit: number) => {
+    const params = new URLSearchParams({ fields: METADATA_ANALYSE_FIELDS, limit: String(limit) });
+    if (cursor !== undefined) params.set("cursor", String(cursor));
+    const res = await fetch(API_URL + "steam/allmetadata?" + params);
+    if (!res.ok) throw new Error('Failed to fetch');
+
+    const nextCursor = res.headers.get("X-Next-Cursor");
+    return {
+        rows: parseMetadataJson(await res.text()),
+        total: Number(res.headers.get("X-Total-Count") || 0),
+        nextCursor: nextCursor === null ? undefined : Number(nextCursor),
+    };
+};
 
-    const text = await res.text();
-    // Replace all occurrences of NaN with null to fix invalid JSON
-    const cleanedText = text.replace(/\bNaN\b/g, 'null');
-    
-    return JSON.parse(cleanedText);
+export type AggregateFilters = {
+    genre?: string;
+    platform?: string;
+    year?: number;
+};
+
+// Top counts per dimension (developers, publishers, platforms, categories, genres) computed by the backend
+export const fetchAggregates = async (filters: AggregateFilters, top = 500) => {
+    const params = new URLSearchParams({ top: String(top) });
+    if (filters.genre) params.set("genre", filters.genre);
+    if (filters.platform) params.set("platform", filters.platform);
+    if (filters.year) params.set("year", String(filters.year));
+    const res = await fetch(API_URL + "steam/aggregates?" + params);
+    if (!res.ok) throw new Error('Failed to fetch');
+    return res.json();
 };
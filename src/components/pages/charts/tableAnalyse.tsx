@@ -1,19 +1,20 @@
-import React from 'react';
-import { DataGrid } from '@mui/x-data-grid';
+import React, { useState } from 'react';
+import { useQuery, keepPreviousData } from '@tanstack/react-query';
+import { DataGrid, GridPaginationModel } from '@mui/x-data-grid';
 import { Button, Box } from '@mui/material';
 
-interface TableProps {
-  data: {
-    appid: number;
-    name: string;
-    developers: string;
-    publishers: string;
-    release_date: string;
-    platforms: string;
-    categories: string;
-    genres: string;
-  }[];
-}
+import { fetchAllGamesMetadata, fetchGamesMetadataPage } from '../../../api/steam_games';
+
+type GameMetadataAnalyse = {
+  appid: number;
+  name: string;
+  developers: string;
+  publishers: string;
+  release_date: string;
+  platforms: string;
+  categories: string;
+  genres: string;
+};
 
 const columns = [
   { field: 'appid', headerName: 'App ID', width: 100 },
@@ -26,7 +27,7 @@ const columns = [
   { field: 'genres', headerName: 'Genres', width: 200 },
 ];
 
-const downloadCSV = (data: TableProps['data']) => {
+const downloadCSV = (data: GameMetadataAnalyse[]) => {
     if (!data.length) return;
     const headers = Object.keys(data[0]);
     const rows = data.map(row =>
@@ -42,21 +43,69 @@ const downloadCSV = (data: TableProps['data']) => {
     URL.revokeObjectURL(url);
 };
 
-export const TableAnalyse: React.FC<TableProps> = ({ data }) => {
+// Table of all games, loaded page by page from the metadata export (the whole export only for the CSV download)
+export const TableAnalyse: React.FC = () => {
+  const [paginationModel, setPaginationModel] = useState<GridPaginationModel>({ page: 0, pageSize: 100 });
+  // Cursor (last appid of the previous page) of every page reached so far, the grid moves one page at a time
+  const [cursors, setCursors] = useState<(number | undefined)[]>([undefined]);
+  const [downloading, setDownloading] = useState(false);
+
+  const cursor = cursors[paginationModel.page];
+  const { data, isFetching } = useQuery({
+    queryKey: ["fetchGamesMetadataPage", cursor, paginationModel.pageSize],
+    queryFn: () => fetchGamesMetadataPage(cursor, paginationModel.pageSize),
+    placeholderData: keepPreviousData,
+    refetchOnWindowFocus: false,
+  });
+
+  const onPaginationModelChange = (model: GridPaginationModel) => {
+    if (model.pageSize !== paginationModel.pageSize) {
+      setCursors([undefined]);
+      setPaginationModel({ page: 0, pageSize: model.pageSize });
+      return;
+    }
+    if (model.page === paginationModel.page + 1 && data?.nextCursor !== undefined) {
+      setCursors(prev => {
+        const next = prev.slice(0, model.page);
+        next[model.page] = data.nextCursor;
+        return next;
+      });
+    } else if (model.page > paginationModel.page) {
+      return;
+    }
+    setPaginationModel(model);
+  };
+
+  const onDownload = async () => {
+    setDownloading(true);
+    try {
+      downloadCSV(await fetchAllGamesMetadata());
+    } finally {
+      setDownloading(false);
+    }
+  };
+
   return (
     <Box sx={{ height: 650, width: '100%' }}>
       <Button
         variant="contained"
         color="primary"
-        onClick={() => downloadCSV(data)}
+        disabled={downloading}
+        onClick={onDownload}
       >
-        Download CSV
+        {downloading ? "Preparing CSV..." : "Download CSV"}
       </Button>
 
       <DataGrid
-        rows={data}
+        rows={data?.rows ?? []}
         columns={columns}
         getRowId={(row) => row.appid}
+        loading={isFetching}
+        paginationMode="server"
+        rowCount={data?.total ?? 0}
+        pageSizeOptions={[25, 50, 100]}
+        paginationModel={paginationModel}
+        onPaginationModelChange={onPaginationModelChange}
       />
     </Box>
   );
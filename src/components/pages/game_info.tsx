@@ -3,7 +3,7 @@ import { useQuery } from '@tanstack/react-query';
 import { useParams  } from "react-router-dom";
 import "../../styles/game_info.css";
 
-import { fetchGame } from "../../api/steam_games";
+import { fetchGame, fetchGameStats } from "../../api/steam_games";
 import { PlayerHistoryCountAreaChart } from "./charts/areaChartPlayerHistory"
 
 import windowsIcon from '../../assets/platform_icons/windows.png';
@@ -30,6 +30,21 @@ type GameMetadata = {
     background: string;
 };
 
+// Player count statistics from API (null where the history is too short)
+type GameStats = {
+    players: number | null;
+    peak: number | null;
+    peak_ts: number | null;
+    change_pct_24h: number | null;
+    change_pct_7d: number | null;
+    change_pct_30d: number | null;
+    avg_7d: number | null;
+    avg_30d: number | null;
+};
+
+const formatChange = (value: number | null) =>
+    value === null ? "-" : `${value > 0 ? "+" : ""}${value.toFixed(1)}%`;
+
 // Props interface for background image setter
 interface GameInfoProps {
     setBackgroundUrl: React.Dispatch<React.SetStateAction<string>>;
@@ -71,6 +86,15 @@ const GameInfo = ({ setBackgroundUrl }: GameInfoProps) => {
         },
     });
     
+    // Fetch peak / change statistics, the page is shown without them if they fail
+    const { data: stats } = useQuery<GameStats>({
+        queryKey: ['gameStats', appid],
+        queryFn: () => fetchGameStats(appid),
+        refetchOnWindowFocus: false,
+        refetchOnMount: false,
+        retry: false,
+    });
+
     // Ref to image list container
     const imageListRef = useRef<HTMLDivElement>(null); 
 
@@ -162,6 +186,25 @@ const GameInfo = ({ setBackgroundUrl }: GameInfoProps) => {
                 <p>Loading player count history...</p>
             )}
 
+            {/* Player count statistics */}
+            {stats && (
+                <div className="stats-game-info">
+                    <div>
+                        <h3>Peak Players:</h3>
+                        <p>{stats.peak?.toLocaleString() ?? "-"}</p>
+                        {stats.peak_ts !== null && <p>{new Date(stats.peak_ts).toLocaleDateString()}</p>}
+                    </div>
+                    <div>
+                        <h3>Change (24h / 7d / 30d):</h3>
+                        <p>{formatChange(stats.change_pct_24h)} / {formatChange(stats.change_pct_7d)} / {formatChange(stats.change_pct_30d)}</p>
+                    </div>
+                    <div>
+                        <h3>Average Players (7d / 30d):</h3>
+                        <p>{stats.avg_7d?.toLocaleString() ?? "-"} / {stats.avg_30d?.toLocaleString() ?? "-"}</p>
+                    </div>
+                </div>
+            )}
+
             {/* Game description and publisher/developer info */}
             <div className="details-game-info">
                 <div className="description-game-info">
@@ -1,34 +1,35 @@
-import { useQuery } from "@tanstack/react-query";
-import { useEffect, useRef, useState } from "react";
+import { useQuery, keepPreviousData } from "@tanstack/react-query";
+import { useRef, useState } from "react";
 import { createTheme, ThemeProvider } from '@mui/material/styles';
 import html2canvas from "html2canvas";
 
 import "../../styles/steam_analyse.css";
 
-import { fetchAllGamesMetadata } from "../../api/steam_games";
+import { AggregateFilters, fetchAggregates } from "../../api/steam_games";
 import { TableAnalyse } from "./charts/tableAnalyse"
 import { BarChartAnalyse } from "./charts/barChartAnalyse";
 import { PieChartAnalyse } from "./charts/pieChartAnalyse";
 import { LineChartAnalyse } from "./charts/lineChartAnalyse";
 
-type GameMetadataAnalyse = {
-    appid: number;
-    name: string;
-    developers: string;
-    publishers: string;
-    release_date: string;
-    platforms: string;
-    categories: string;
-    genres: string;
-}
+type Dimension = "developers" | "publishers" | "platforms" | "categories" | "genres";
+
+// Top counts per dimension, sorted by count
+type GameAggregates = Record<Dimension, { name: string; value: number }[]>;
 
 type ChartsConfig = {
     type: "bar" | "pie" | "line";
-    data: { name: string; value: number }[];
-    title: string;
+    dimension: Dimension;
     numberOfSlices: number;
 };
 
+const DIMENSION_TITLES: Record<Dimension, string> = {
+    developers: "Developers",
+    publishers: "Publishers",
+    platforms: "Platforms",
+    categories: "Categories",
+    genres: "Genres",
+};
+
 const darkTheme = createTheme({
   palette: {
     mode: 'dark',
@@ -36,74 +37,38 @@ const darkTheme = createTheme({
 });
 
 const SteamAnalyse = () => {
-    // Fetch all game metadata
+    // Filters applied to every chart, counted by the backend
+    const [filters, setFilters] = useState<AggregateFilters>({});
+
+    // Unfiltered counts, also the options of the genre / platform filters
     const {
-        data: analyseGames,
+        data: allAggregates,
         isLoading,
         isError
-    } = useQuery<GameMetadataAnalyse[]>({
-        queryKey: ["fetchAllGamesMetadata"],
-        queryFn: fetchAllGamesMetadata,
+    } = useQuery<GameAggregates>({
+        queryKey: ["fetchAggregates", {}],
+        queryFn: () => fetchAggregates({}),
         refetchOnWindowFocus: false,
         refetchOnMount: false,
     });
 
-    // State to manage the charts data
-    const [dataPage, setDataPage] = useState<ChartsConfig[]>([]);
+    const filtered = Boolean(filters.genre || filters.platform || filters.year);
+    const { data: filteredAggregates } = useQuery<GameAggregates>({
+        queryKey: ["fetchAggregates", filters],
+        queryFn: () => fetchAggregates(filters),
+        enabled: filtered,
+        placeholderData: keepPreviousData,
+        refetchOnWindowFocus: false,
+    });
+    const aggregates = filtered ? filteredAggregates : allAggregates;
 
-    const developersCounter: Record<string, number> = {};
-    const platformsCounter: Record<string, number> = {};
-    const categoriesCounter: Record<string, number> = {};
-    const genresCounter: Record<string, number> = {};
+    // State to manage the charts
+    const [dataPage, setDataPage] = useState<ChartsConfig[]>([
+        { type: "bar", dimension: "developers", numberOfSlices: 20 },
+    ]);
 
     const chartRefs = useRef<HTMLDivElement[]>([]);
 
-    // Process the game metadata to count developers, platforms, categories, and genres
-    analyseGames?.forEach((game) => {
-        developersCounter[game.developers] = (developersCounter[game.developers] || 0) + 1;
-        
-        const platformsStr = game.platforms || "";
-        platformsStr.split(", ").forEach((platform) => {
-            if (platform) {
-                platformsCounter[platform] = (platformsCounter[platform] || 0) + 1;
-            }
-        });
-        
-        const categoriesStr = game.categories || "";
-        categoriesStr.split(", ").forEach((category) => {
-            if (category) {
-                categoriesCounter[category] = (categoriesCounter[category] || 0) + 1;
-            }
-        });
-        
-        const genresStr = game.genres || "";
-        genresStr.split(", ").forEach((genre) => {
-            if(genre) {
-                genresCounter[genre] = (genresCounter[genre] || 0) + 1;
-            } 
-        });
-    });
-    
-    // DEVELOPERS
-    const developersData = Object.entries(developersCounter).map(([name, value]) => ({
-        name, value
-    })).filter(({ name }) => name !== "null").sort((a, b) => b.value - a.value);
-    
-    // PLATFORMS
-    const platformsData = Object.entries(platformsCounter).map(([name, value]) => ({
-        name, value
-    })).sort((a, b) => b.value - a.value);
-    
-    // CATEGORIES
-    const categoriesData = Object.entries(categoriesCounter).map(([name, value]) => ({
-        name, value
-    })).sort((a, b) => b.value - a.value);
-    
-    // GENRES
-    const genresData = Object.entries(genresCounter).map(([name, value]) => ({
-        name, value
-    })).sort((a, b) => b.value - a.value);
-    
     const downloadChart = (index: number) => {
         const chartElement = chartRefs.current[index];
         html2canvas(chartElement).then((canvas) => {
@@ -113,11 +78,6 @@ const SteamAnalyse = () => {
             link.click();
     })};
 
-    // Initialize the data page with developers data
-    useEffect(() => {
-        setDataPage([{ type: "bar", data: developersData, title: "Developers", numberOfSlices: 20 }]);
-    }, [analyseGames]);
-    
     return (
         isLoading ? (
             <div className="loading-container">
@@ -125,24 +85,41 @@ const SteamAnalyse = () => {
             </div>
         ) : isError ? (
             <div className="error-container">
-                <h1>Error loading game metadata</h1>
+                <h1>Error loading game statistics</h1>
             </div>
         ) : (
             <>
                 {/* Displaying the table of games */}
-                { analyseGames && (
-                    <div className="table-page">
-                        <ThemeProvider theme={darkTheme}>
-                            <TableAnalyse data={analyseGames} />
-                        </ThemeProvider>
-                    </div>
-                )}
+                <div className="table-page">
+                    <ThemeProvider theme={darkTheme}>
+                        <TableAnalyse />
+                    </ThemeProvider>
+                </div>
+
+                {/* Filters applied to every chart */}
+                <div className="chart-controls">
+                    <select value={filters.genre ?? ""} onChange={(e) => setFilters(prev => ({ ...prev, genre: e.target.value || undefined }))}>
+                        <option value="">All genres</option>
+                        {allAggregates?.genres.map(({ name }) => <option key={name} value={name}>{name}</option>)}
+                    </select>
+                    <select value={filters.platform ?? ""} onChange={(e) => setFilters(prev => ({ ...prev, platform: e.target.value || undefined }))}>
+                        <option value="">All platforms</option>
+                        {allAggregates?.platforms.map(({ name }) => <option key={name} value={name}>{name}</option>)}
+                    </select>
+                    <input
+                        type="number"
+                        placeholder="Release year"
+                        value={filters.year ?? ""}
+                        onChange={(e) => setFilters(prev => ({ ...prev, year: e.target.value ? Number(e.target.value) : undefined }))}/>
+                </div>
                 
                 {/* Displaying the charts */}
                 <div className="charts-page">
-                    { dataPage.map((dataset, i) => (
+                    { dataPage.map((dataset, i) => {
+                        const data = aggregates?.[dataset.dimension] ?? [];
+                        return (
                         <div key={i} className="chart-container">
-                            <p>{dataset.title}</p>
+                            <p>{DIMENSION_TITLES[dataset.dimension]}</p>
                             <div className="chart-controls">
                                 {/* Dropdown to select dataset */}
                                 <select value={dataset.type} onChange={(e) => {
@@ -158,48 +135,22 @@ const SteamAnalyse = () => {
                                 <option value="line">Line Chart</option>
                                 </select>
                                 {/* Dropdown changing dataset */}
-                                <select onChange={(e) => {
-                                    const value = e.target.value;
-                                    let newDataSet: any[] = [];
-                                    let title = "";
-                                    switch (value) {
-                                        case "developers":
-                                            newDataSet = developersData;
-                                            title = "Developers";
-                                            break;
-                                        case "platforms":
-                                            newDataSet = platformsData;
-                                            title = "Platforms";
-                                            break;
-                                        case "categories":
-                                            newDataSet = categoriesData;
-                                            title = "Categories";
-                                            break;
-                                        case "genres":
-                                            newDataSet = genresData;
-                                            title = "Genres";
-                                            break;
-                                        default:
-                                            newDataSet = [];
-                                            title = "";
-                                    } 
+                                <select value={dataset.dimension} onChange={(e) => {
                                     setDataPage(prev => {
                                         const newPage = [...prev];
-                                        newPage[i].data = newDataSet;
-                                        newPage[i].title = title;
+                                        newPage[i].dimension = e.target.value as Dimension;
                                         return newPage;
                                     });
                                 }}>
-                                    <option value="developers">Developers</option>
-                                    <option value="platforms">Platforms</option>
-                                    <option value="categories">Categories</option>
-                                    <option value="genres">Genres</option>
+                                    {Object.entries(DIMENSION_TITLES).map(([dimension, title]) => (
+                                        <option key={dimension} value={dimension}>{title}</option>
+                                    ))}
                                 </select>
                                 {/* Input to change number of slices */}
                                 <input
                                     type="number"
                                     min={1}
-                                    max={dataset.data.length}
+                                    max={data.length}
                                     value={dataset.numberOfSlices}
                                     onChange={(e) => {
                                         setDataPage(prev => {
@@ -212,13 +163,13 @@ const SteamAnalyse = () => {
                             {/* Displaying the chart */}
                             <div className="chart-display" ref={(el) => { chartRefs.current[i] = el as HTMLDivElement; }}>
                             {dataset.type === "bar" && (
-                                <BarChartAnalyse data={dataset.data.slice(0, dataset.numberOfSlices)} />
+                                <BarChartAnalyse data={data.slice(0, dataset.numberOfSlices)} />
                             )}
                             {dataset.type === "pie" && (
-                                <PieChartAnalyse data={dataset.data.slice(0, dataset.numberOfSlices)} />
+                                <PieChartAnalyse data={data.slice(0, dataset.numberOfSlices)} />
                             )}
                             {dataset.type === "line" && (
-                                <LineChartAnalyse data={dataset.data.slice(0, dataset.numberOfSlices)} />
+                                <LineChartAnalyse data={data.slice(0, dataset.numberOfSlices)} />
                             )}
                             </div>
                             {/* Actions for the chart */}
@@ -227,13 +178,14 @@ const SteamAnalyse = () => {
                                 <button className="delete-button" onClick={() => setDataPage(prev => prev.filter((_, index) => index !== i))}>Delete</button>
                             </div>
                         </div>
-                    ))}
+                        );
+                    })}
                 </div>
 
                 <div>
                     { /* Add new chart */ }
                     <div className="add-chart-controls">
-                        <button onClick={() => setDataPage(prev => [...prev, { type: "bar", data: developersData, title: "Developers", numberOfSlices: 20 }])}>Add New Chart</button>
+                        <button onClick={() => setDataPage(prev => [...prev, { type: "bar", dimension: "developers", numberOfSlices: 20 }])}>Add New Chart</button>
                     </div>
                 </div>
             </>
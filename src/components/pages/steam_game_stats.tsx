@@ -3,7 +3,7 @@ import { useQuery } from "@tanstack/react-query";
 import { Link } from "react-router-dom";
 import "../../styles/game_stats.css";
 
-import { fetchTopSteamGames } from "../../api/steam_games";
+import { fetchTopSteamGames, fetchTrending } from "../../api/steam_games";
 import { PieChartGameStats } from "./charts/pieChartAnalyse";
 
 
@@ -15,6 +15,15 @@ type Game = {
     header_image: string;
 };
 
+// Ranked game with its player count change (precomputed by the backend)
+type TrendingGame = {
+    appid: number;
+    name: string;
+    header_image: string;
+    players: number;
+    change_pct_7d: number;
+};
+
 const GameStats = () => {
     // Fetch top Steam games when the component mounts
     const { 
@@ -28,6 +37,14 @@ const GameStats = () => {
         refetchOnMount: false,
     });
     
+    // Games with the largest player count growth over the last week
+    const { data: trending } = useQuery<TrendingGame[]>({
+        queryKey: ["trending", "7d"],
+        queryFn: () => fetchTrending("7d", "percent", 5),
+        refetchOnWindowFocus: false,
+        refetchOnMount: false,
+    });
+    
     // Calculate top 10 games and prepare data for the pie chart
     const top10Games = (games ?? []).slice(0, 10);
     const [showAll, setShowAll] = useState(false);
@@ -93,6 +110,25 @@ const GameStats = () => {
                     </button>
                 </div>
                 
+                {/* Displaying the trending games */}
+                {trending && trending.length > 0 && (
+                    <>
+                        <h2>Trending This Week</h2>
+                        <div className="game-grid">
+                            {trending.map((game) => (
+                                <Link to={`/game/${game.appid}`} key={game.appid} className="game-card">
+                                    <img src={game.header_image} alt={game.name} />
+                                    <div className="game-rank">{game.change_pct_7d > 0 ? "+" : ""}{game.change_pct_7d.toFixed(1)}%</div>
+                                    <div className="game-info-gamestats">
+                                        <p className="game-name">{game.name}</p>
+                                        <p className="player-count">Players: {game.players.toLocaleString()}</p>
+                                    </div>
+                                </Link>
+                            ))}
+                        </div>
+                    </>
+                )}
+
                 {/* Displaying the pie chart with game stats */}
                 <div className="chart-container-gamestats">
                     <PieChartGameStats data={chartData} />